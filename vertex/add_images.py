@@ -2,7 +2,9 @@
 import asyncio
 from dotenv import load_dotenv
 import os
-from vertex import ImageSearchDemo
+# ImageSearchDemo（TensorFlow / GCP SDK を読み込む）は関数内で import する
+# デコード用のワーカープロセスは spawn 時にこのスクリプトを読み直すため、先頭では軽いモジュールだけを読み込む
+from vertex import EmbeddingCache, IngestManifest, ParallelImageDecoder
 
 # .envファイルを読み込む（明示的にパスを指定）
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -20,6 +22,8 @@ async def add_new_images(image_dir):
     Args:
         image_dir (str): 追加する画像が含まれているディレクトリパス
     """
+    from vertex import ImageSearchDemo
+
     # Google Cloud の設定
     PROJECT_ID = "voltaic-plating-265716"
     BUCKET_NAME = "sisterly"
@@ -27,17 +31,28 @@ async def add_new_images(image_dir):
     INDEX_NAME = "sisterly_deployed_20241107_090612_8ef2af22"
     ENDPOINT_ID = "5566554692546199552"  # 既存のエンドポイントID
     
+    # デコード・リサイズは全コアのプロセスプールで行う
+    image_decoder = ParallelImageDecoder()
+    
     # デモの初期化
     demo = ImageSearchDemo(
         project_id=PROJECT_ID,
         location=LOCATION,
         bucket_name=BUCKET_NAME,
-        index_display_name=INDEX_NAME
+        index_display_name=INDEX_NAME,
+        # 同じ画像の再推論を避けるためのローカルキャッシュ
+        embedding_cache=EmbeddingCache(os.path.join(os.path.dirname(__file__), ".cache", "embeddings.sqlite")),
+        # 取り込み済みの画像を記録し、再実行時は新しい画像・変更された画像だけを処理する
+        ingest_manifest=IngestManifest(os.path.join(os.path.dirname(__file__), ".cache", "ingest_manifest.sqlite")),
+        image_decoder=image_decoder
     )
     
     # 画像の追加とエンべディングの作成を実行(管理者で実行)
     # demo.add_images("admin_images", user_type='admin')
-    await demo.add_images("admin_images", user_type='admin')
+    try:
+        await demo.add_images("admin_images", user_type='admin')
+    finally:
+        image_decoder.close()
 
     # 特定のユーザーとして画像をアップロード
     #demo.add_images("user_images", user_type='user', user_id='user123')
@@ -0,0 +1,96 @@
+# benchmark_decode.py
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from vertex.benchmark import make_synthetic_jpegs
+from vertex.decoder import decode_image
+from vertex.model_manager import ModelManager
+from vertex.preprocess import decode_and_resize
+
+
+def load_jpegs(image_dir):
+    images = []
+    for filename in sorted(os.listdir(image_dir)):
+        if filename.lower().endswith(('.jpg', '.jpeg')):
+            with open(os.path.join(image_dir, filename), "rb") as f:
+                images.append(f.read())
+    return images
+
+
+def time_decoder(decode, images, repeats):
+    """
+    1枚あたりのデコード時間（ミリ秒）を計測する
+
+    Returns:
+        tuple: (デコード結果の配列, 1枚あたりの時間のリスト)
+    """
+    outputs = [np.asarray(decode(image_bytes)) for image_bytes in images]  # ウォームアップ
+    timings = []
+    for _ in range(repeats):
+        for image_bytes in images:
+            started = time.perf_counter()
+            np.asarray(decode(image_bytes))
+            timings.append((time.perf_counter() - started) * 1000)
+    return np.stack(outputs), timings
+
+
+def cosine_similarity(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-resolution and reduced-resolution JPEG decoding")
+    parser.add_argument("--image-dir", help="Directory of JPEGs to use instead of synthetic images")
+    parser.add_argument("--count", type=int, default=16, help="Number of synthetic images")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-model", action="store_true", help="Skip the embedding drift measurement")
+    args = parser.parse_args()
+
+    if args.image_dir:
+        images = load_jpegs(args.image_dir)
+    else:
+        images = make_synthetic_jpegs(args.count, args.width, args.height)
+    print(f"{len(images)} JPEGs, {sum(map(len, images)) / len(images) / 1024:.0f} KiB on average\n")
+
+    decoders = {
+        "tf full": lambda image_bytes: decode_and_resize(tf.constant(image_bytes), reduced=False),
+        "tf reduced": lambda image_bytes: decode_and_resize(tf.constant(image_bytes), reduced=True),
+        "pillow full": lambda image_bytes: decode_image(image_bytes, reduced=False),
+        "pillow reduced": lambda image_bytes: decode_image(image_bytes, reduced=True),
+    }
+    outputs = {}
+    print(f"{'decoder':<16}{'median ms':>12}{'mean ms':>12}")
+    for name, decode in decoders.items():
+        outputs[name], timings = time_decoder(decode, images, args.repeats)
+        print(f"{name:<16}{statistics.median(timings):>12.2f}{statistics.mean(timings):>12.2f}")
+
+    print(f"\n{'comparison':<32}{'pixel MAE':>12}{'cos mean':>12}{'cos min':>12}")
+    model = None if args.no_model else ModelManager()
+    for full, reduced in (("tf full", "tf reduced"), ("pillow full", "pillow reduced"), ("tf full", "pillow reduced")):
+        mae = float(np.mean(np.abs(outputs[full] - outputs[reduced])))
+        row = f"{full + ' vs ' + reduced:<32}{mae:>12.4f}"
+        if model is not None:
+            # 現在の経路（tf full）からどれだけエンべディングがずれるか
+            similarity = cosine_similarity(
+                model(tf.constant(outputs[full]), training=False).numpy(),
+                model(tf.constant(outputs[reduced]), training=False).numpy()
+            )
+            row += f"{float(similarity.mean()):>12.5f}{float(similarity.min()):>12.5f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# python benchmark_decode.py
+# python benchmark_decode.py --image-dir test_images --no-model
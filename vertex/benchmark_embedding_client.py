@@ -0,0 +1,80 @@
+# benchmark_embedding_client.py
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vertex.benchmark import FakeEmbeddingModel
+from vertex.embedding_client import EmbeddingClient
+
+
+def run(model, client, images):
+    """
+    偽モデルに対して全画像をエンべディングし、スループットとスロットリングの回数を返す
+    """
+    def embed(image_bytes):
+        try:
+            return client.embed(image_bytes)
+        except Exception:
+            # リトライを使い切った画像は失敗として数えるだけにする
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=client.concurrency.maximum) as pool:
+        embeddings = list(pool.map(embed, images))
+    elapsed = time.perf_counter() - started
+    return {
+        "images_per_sec": sum(embedding is not None for embedding in embeddings) / elapsed,
+        "throttled": model.throttled,
+        "peak_concurrency": model.peak_concurrency,
+        **client.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise EmbeddingClient against a local fake model with a quota")
+    parser.add_argument("--images", type=int, default=600)
+    parser.add_argument("--quota", type=float, default=60.0, help="Fake model calls allowed per second")
+    parser.add_argument("--model-concurrency", type=int, default=16, help="Fake model calls allowed in flight")
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake model seconds per call")
+    parser.add_argument("--throttle-rate", type=float, default=0.01, help="Probability of a spurious quota error")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    images = [os.urandom(64) for _ in range(args.images)]
+
+    def fake_model():
+        return FakeEmbeddingModel(
+            latency=args.latency,
+            quota_per_second=args.quota,
+            max_concurrency=args.model_concurrency,
+            throttle_rate=args.throttle_rate,
+        )
+
+    configurations = {
+        # 制限なしで最大並列に投げる（リトライだけで凌ぐ）
+        "retry_only": dict(initial_concurrency=args.max_concurrency, max_concurrency=args.max_concurrency),
+        # AIMD で同時実行数だけを調整する
+        "adaptive": dict(max_concurrency=args.max_concurrency),
+        # クォータに合わせたトークンバケット + AIMD
+        "rate_limited": dict(requests_per_second=args.quota, max_concurrency=args.max_concurrency),
+    }
+
+    print(f"quota {args.quota:.0f}/s, model concurrency {args.model_concurrency}, latency {args.latency * 1000:.0f} ms")
+    print(f"{'client':<14}{'img/s':>8}{'requests':>10}{'throttled':>11}{'failed':>8}{'limit':>8}{'peak':>6}")
+    for name, options in configurations.items():
+        model = fake_model()
+        client = EmbeddingClient(model.embed, backoff=0.1, **options)
+        result = run(model, client, images)
+        print(
+            f"{name:<14}{result['images_per_sec']:>8.1f}{result['requests']:>10}{result['throttled']:>11}"
+            f"{result['failed']:>8}{result['concurrency_limit']:>8.1f}{result['peak_concurrency']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
+
+
+# python benchmark_embedding_client.py
+# python benchmark_embedding_client.py --quota 120 --model-concurrency 8 --latency 0.05
@@ -0,0 +1,192 @@
+# benchmark_pipeline.py
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+
+from vertex import ImageSearchDemo, LocalBucket, LocalVectorStore, Tracer
+from vertex.benchmark import IMAGE_FORMATS, IMAGE_SIZES, StageTimer, make_synthetic_images
+
+# 比較表に出す指標（True は大きいほど良い）
+COMPARED_METRICS = {"images_per_sec": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "peak_rss_mb": False}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args, work_dir, model_manager=None):
+    """
+    合成画像を作り、ローカルの GCS / ベクトル検索の代替に対して各ステージを計測する
+
+    Args:
+        args (argparse.Namespace): main() のコマンドライン引数
+        work_dir (str): 合成画像とローカルのバケット・ベクトルストアを置くディレクトリ
+        model_manager: エンべディングモデル（省略時は ImageSearchDemo の既定のモデル）
+
+    Returns:
+        tuple: (モデルの読み込み秒数, ステージ名 → StageTimer.summary(), Tracer)
+    """
+    image_dir = os.path.join(work_dir, "images")
+    paths = make_synthetic_images(image_dir, sizes=args.sizes, formats=args.formats, count=args.count)
+    print(f"Generated {len(paths)} synthetic images in {image_dir}")
+
+    def fresh_backends(name):
+        bucket = LocalBucket(os.path.join(work_dir, name, "bucket"), name="benchmark", latency=args.bucket_latency)
+        store = LocalVectorStore(os.path.join(work_dir, name, "store"))
+        return bucket, store
+
+    bucket, store = fresh_backends("setup")
+    demo = ImageSearchDemo(
+        project_id="benchmark",
+        location="local",
+        bucket_name=bucket.name,
+        index_display_name="benchmark",
+        search_backend=store,
+        bucket=bucket,
+        # エンドポイントにもインデックスにも触れず、ローカルの代替だけで動かす
+        offline=True,
+        model_manager=model_manager,
+        # ステージ内の内訳（読み込み・デコード・推論・シリアライズなど）も記録する
+        tracer=Tracer(enabled=args.trace)
+    )
+    # モデルの読み込みはステージの計測から外す
+    demo.model.load()
+
+    # demo の1枚ごとのログは計測結果が読みにくくなるので捨てる
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    stages = []
+
+    with StageTimer("generate_embedding") as timer, quiet:
+        for path in paths:
+            with timer.call():
+                demo._generate_embedding(path)
+    stages.append(timer)
+
+    with StageTimer("generate_embeddings_batch") as timer, quiet:
+        for start in range(0, len(paths), args.batch_size):
+            chunk = paths[start:start + args.batch_size]
+            with timer.call(items=len(chunk)):
+                demo.generate_embeddings_batch(chunk, batch_size=args.batch_size)
+    stages.append(timer)
+
+    with StageTimer("upload_images_to_gcs") as timer, quiet:
+        for repeat in range(args.repeats):
+            # 毎回空のバケットに上げる（2回目以降のスキップを計測しないように）
+            demo.bucket, _ = fresh_backends(f"upload_{repeat}")
+            with timer.call(items=len(paths)):
+                demo.upload_images_to_gcs(image_dir)
+    stages.append(timer)
+
+    with StageTimer("add_images") as timer, quiet:
+        for repeat in range(args.repeats):
+            demo.bucket, demo.search_backend = fresh_backends(f"add_{repeat}")
+            with timer.call(items=len(paths)):
+                asyncio.run(demo.add_images(image_dir, batch_size=args.batch_size))
+    stages.append(timer)
+
+    # 直前の add_images で作ったインデックスに対して検索する
+    with StageTimer("search_similar_images") as timer, quiet:
+        for i in range(args.queries):
+            with timer.call():
+                demo.search_similar_images(paths[i % len(paths)], num_neighbors=args.num_neighbors)
+    stages.append(timer)
+
+    return demo.model.load_seconds, {timer.name: timer.summary() for timer in stages}, demo.tracer
+
+
+def print_report(stages, baseline=None):
+    print(f"\n{'stage':<28}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak RSS MB':>13}")
+    for name, summary in stages.items():
+        print(
+            f"{name:<28}{summary['images_per_sec']:>10.1f}{summary['p50_ms']:>10.1f}"
+            f"{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}{summary['peak_rss_mb']:>13.0f}"
+        )
+    if baseline is None:
+        return
+
+    # ベースラインからの変化率（+ が改善）
+    print(f"\nvs {baseline.get('commit') or 'baseline'}")
+    print(f"{'stage':<28}" + "".join(f"{metric:>14}" for metric in COMPARED_METRICS))
+    for name, summary in stages.items():
+        previous = baseline["stages"].get(name)
+        if previous is None:
+            continue
+        cells = []
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not previous.get(metric):
+                cells.append(f"{'-':>14}")
+                continue
+            change = (summary[metric] - previous[metric]) / previous[metric] * 100
+            cells.append(f"{change if higher_is_better else -change:>+13.1f}%")
+        print(f"{name:<28}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding, upload, ingest and search against local stand-ins")
+    parser.add_argument("--sizes", default=",".join(IMAGE_SIZES), help="Comma-separated image sizes")
+    parser.add_argument("--formats", default=",".join(IMAGE_FORMATS), help="Comma-separated image formats")
+    parser.add_argument("--count", type=int, default=4, help="Images per size/format combination")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of the whole-directory stages")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--num-neighbors", type=int, default=10)
+    parser.add_argument("--bucket-latency", type=float, default=0.0, help="Simulated seconds per storage call")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-image log output")
+    parser.add_argument("--trace", action="store_true", help="Record per-step spans and print their breakdown")
+    args = parser.parse_args()
+    args.sizes = args.sizes.split(",")
+    args.formats = args.formats.split(",")
+
+    work_dir = tempfile.mkdtemp(prefix="vertex-benchmark-")
+    try:
+        model_load_seconds, stages, tracer = run_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose", "trace")},
+        "model_load_seconds": model_load_seconds,
+        "stages": stages,
+        "trace": tracer.export() if args.trace else None,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(stages, baseline)
+    if args.trace:
+        print()
+        tracer.report()
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# python benchmark_pipeline.py --output before.json
+# （変更後）python benchmark_pipeline.py --output after.json --compare before.json
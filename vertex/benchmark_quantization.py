@@ -0,0 +1,94 @@
+# benchmark_quantization.py
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from vertex.embedding_writer import format_embedding
+from vertex.quantization import STORAGE_DTYPES, bytes_per_vector
+from vertex.vector_store import LocalVectorStore
+
+
+def make_synthetic_embeddings(count, dimension, n_clusters=256, seed=0):
+    """
+    クラスタ構造を持つ非負のエンべディングを作る（EfficientNet の特徴ベクトルに近い分布）
+
+    Returns:
+        np.ndarray: float32 matrix of shape (count, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(0.5, 0.5, (n_clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, count)
+    noise = rng.gamma(0.5, 0.25, (count, dimension)).astype(np.float32)
+    return centers[labels] * 0.7 + noise
+
+
+def recall_at_k(results, reference, k):
+    hits = sum(
+        len({r["uri"] for r in result[:k]} & {r["uri"] for r in expected[:k]})
+        for result, expected in zip(results, reference)
+    )
+    return hits / (k * len(reference))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare float32 / float16 / int8 embedding storage")
+    parser.add_argument("--store-dir", help="Existing float32 LocalVectorStore to use instead of synthetic vectors")
+    parser.add_argument("--count", type=int, default=100000, help="Number of synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=1280)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.store_dir:
+        source = LocalVectorStore(args.store_dir, dimension=args.dimension)
+        ids, embeddings = source.ids, source.vectors()
+    else:
+        embeddings = make_synthetic_embeddings(args.count, args.dimension)
+        ids = [f"gs://synthetic/images/{i}.jpg" for i in range(len(embeddings))]
+    rng = np.random.default_rng(1)
+    # 保存済みベクトルに少しノイズを加えたものをクエリにする
+    queries = embeddings[rng.choice(len(embeddings), args.queries, replace=False)]
+    queries = queries + rng.normal(0, 0.05, queries.shape).astype(np.float32)
+
+    # JSON シャードの1レコードあたりのサイズ（I/O の比較用）
+    json_bytes = np.mean([len(format_embedding(embedding)) for embedding in embeddings[:1000]])
+    print(f"{len(embeddings)} vectors x {args.dimension} dims, {args.queries} queries, k={args.k}")
+    print(f"JSON record: {json_bytes:.0f} bytes/vector\n")
+
+    work_dir = tempfile.mkdtemp()
+    reference = None
+    print(f"{'dtype':<10}{'bytes/vec':>10}{'on disk MiB':>13}{'vs f32':>8}{'vs JSON':>9}{'write s':>9}{'search ms':>11}{'recall@k':>10}")
+    try:
+        for dtype in STORAGE_DTYPES:
+            store = LocalVectorStore(os.path.join(work_dir, dtype), dimension=args.dimension, dtype=dtype)
+            started = time.perf_counter()
+            store.add(ids, embeddings)
+            write_seconds = time.perf_counter() - started
+
+            store.search_batch(queries[:1], args.k)  # memmap を開いておく
+            started = time.perf_counter()
+            results = store.search_batch(queries, args.k)
+            search_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+            if reference is None:
+                reference = results
+            per_vector = bytes_per_vector(args.dimension, dtype)
+            print(
+                f"{dtype:<10}{per_vector:>10}{store.nbytes / 2 ** 20:>13.1f}"
+                f"{bytes_per_vector(args.dimension, 'float32') / per_vector:>7.1f}x{json_bytes / per_vector:>8.1f}x"
+                f"{write_seconds:>9.2f}{search_ms:>11.2f}{recall_at_k(results, reference, args.k):>10.4f}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# python benchmark_quantization.py
+# python benchmark_quantization.py --store-dir .cache/vector_store
@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os
-from vertex import ImageSearchDemo
+from vertex import ImageSearchDemo, EmbeddingCache, ThumbnailCache
 
 # .envファイルを読み込む（明示的にパスを指定）
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -33,7 +33,11 @@ if __name__ == "__main__":
         project_id=PROJECT_ID,
         location=LOCATION,
         bucket_name=BUCKET_NAME,
-        index_display_name=INDEX_NAME
+        index_display_name=INDEX_NAME,
+        # 同じ画像の再推論を避けるためのローカルキャッシュ
+        embedding_cache=EmbeddingCache(os.path.join(os.path.dirname(__file__), ".cache", "embeddings.sqlite")),
+        # 検索結果の画像は縮小してキャッシュし、同じピンを取り直さない（download_result_images(thumbnails=True) で使う）
+        thumbnail_cache=ThumbnailCache(os.path.join(os.path.dirname(__file__), ".cache", "thumbnails"))
     )
     
     # 1. 画像のアップロード
@@ -52,5 +56,5 @@ if __name__ == "__main__":
     
     # 4. 結果の画像をダウンロード
     print("\n画像をDLします...")
-    demo.download_result_images(results, "search_results")
+    demo.download_result_images(results, "search_results", thumbnails=True)
     print("Process completed!")
@@ -0,0 +1,97 @@
+# precompute_text_embeddings.py
+import asyncio
+from dotenv import load_dotenv
+import os
+from prisma import Prisma
+from vertex import VertexImageSearch, EmbeddingClient, TextEmbeddingCache
+
+# .envファイルを読み込む（明示的にパスを指定）
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+load_dotenv(env_path)
+
+# 環境変数を明示的に設定
+os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = '/Users/itoi/projects/itoi/pinterest-clone/vertex/secret/voltaic-plating-265716-42cdc3593d25.json'
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache")
+
+
+async def load_pin_texts(page_size=1000):
+    """
+    Prisma の Pin からタイトルと説明文をすべて読み出す
+
+    Args:
+        page_size (int): 1回の問い合わせで読むピンの数
+
+    Returns:
+        list: タイトル・説明文の文字列（空の説明文は除く）
+    """
+    prisma = Prisma()
+    await prisma.connect()
+    texts = []
+    try:
+        cursor = None
+        while True:
+            # id 順にカーソルで読み進める（skip を大きくしないように）
+            pins = await prisma.pin.find_many(
+                take=page_size,
+                skip=1 if cursor else 0,
+                cursor={"id": cursor} if cursor else None,
+                order={"id": "asc"}
+            )
+            if not pins:
+                break
+            for pin in pins:
+                texts.append(pin.title)
+                if pin.description:
+                    texts.append(pin.description)
+            cursor = pins[-1].id
+    finally:
+        await prisma.disconnect()
+    return texts
+
+
+def precompute(texts):
+    """
+    テキスト検索でよく使われるピンのタイトル・説明文のエンべディングを事前に作ってキャッシュする
+
+    Args:
+        texts (list): 事前計算する文字列
+    """
+    # Google Cloud の設定（add_images.py / main.py と同じ）
+    PROJECT_ID = "voltaic-plating-265716"
+    BUCKET_NAME = "sisterly"
+    LOCATION = "asia-northeast1"
+    INDEX_NAME = "sisterly_deployed_20241107_090612_8ef2af22"
+
+    search = VertexImageSearch(
+        project_id=PROJECT_ID,
+        location=LOCATION,
+        bucket_name=BUCKET_NAME,
+        index_display_name=INDEX_NAME,
+        text_cache=TextEmbeddingCache(os.path.join(CACHE_DIR, "text_embeddings.sqlite")),
+        # エンべディングを作るだけなので、インデックス・エンドポイントの検索や作成・デプロイはしない
+        resolve_resources=False
+    )
+    quota = os.getenv("EMBEDDING_QUOTA_PER_SECOND")
+    if quota:
+        # クォータ上限に張り付くように流す
+        search.embedding_client = EmbeddingClient(search._embed_remote, requests_per_second=float(quota))
+    summary = search.precompute_text_embeddings(texts)
+    print(summary)
+    print(search.text_cache.stats())
+
+
+if __name__ == "__main__":
+    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        raise EnvironmentError(
+            "GOOGLE_APPLICATION_CREDENTIALS environment variable is not set. "
+            "Please check your .env file."
+        )
+
+    pin_texts = asyncio.run(load_pin_texts())
+    print(f"Loaded {len(pin_texts)} pin titles and descriptions")
+    precompute(pin_texts)
+
+
+# python precompute_text_embeddings.py
+# EMBEDDING_QUOTA_PER_SECOND=120 python precompute_text_embeddings.py
@@ -0,0 +1,66 @@
+# search_server.py
+import asyncio
+from dotenv import load_dotenv
+import os
+from vertex import ImageSearchDemo, EmbeddingCache, QueryCache, SimilarImageSearchService, LocalVectorStore
+
+# .envファイルを読み込む（明示的にパスを指定）
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+load_dotenv(env_path)
+
+
+async def run_server(host, port):
+    """
+    モデルとエンドポイントを温めたまま類似画像検索を受け付ける
+    
+    Args:
+        host (str): 待ち受けるホスト
+        port (int): 待ち受けるポート
+    """
+    # Google Cloud の設定
+    PROJECT_ID = "voltaic-plating-265716"
+    BUCKET_NAME = "sisterly"
+    LOCATION = "asia-northeast1"
+    INDEX_NAME = "sisterly_deployed_20241107_090612_8ef2af22"
+    
+    # ローカルに元ベクトルがあれば、近似検索の候補を多めに取って正確な内積で並べ直す
+    # （事前に LocalVectorStore.import_from_bucket で embeddings/ を取り込んでおく）
+    rerank_store_dir = os.getenv("SEARCH_RERANK_STORE")
+    
+    demo = ImageSearchDemo(
+        project_id=PROJECT_ID,
+        location=LOCATION,
+        bucket_name=BUCKET_NAME,
+        index_display_name=INDEX_NAME,
+        embedding_cache=EmbeddingCache(os.path.join(os.path.dirname(__file__), ".cache", "embeddings.sqlite")),
+        query_cache=QueryCache(),
+        rerank_store=LocalVectorStore(rerank_store_dir) if rerank_store_dir else None,
+        rerank_factor=int(os.getenv("SEARCH_RERANK_FACTOR", "4"))
+    )
+    
+    # 数ミリ秒以内に届いたクエリを1回の推論と1回の検索にまとめる
+    service = SimilarImageSearchService(
+        demo,
+        batch_window_ms=float(os.getenv("SEARCH_BATCH_WINDOW_MS", "5")),
+        max_batch_size=int(os.getenv("SEARCH_MAX_BATCH_SIZE", "32"))
+    )
+    await service.start()
+    try:
+        await service.serve(host, port)
+    finally:
+        await service.stop()
+
+if __name__ == "__main__":
+    # 環境変数が正しく設定されているか確認
+    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        raise EnvironmentError(
+            "GOOGLE_APPLICATION_CREDENTIALS environment variable is not set. "
+            "Please check your .env file."
+        )
+    
+    asyncio.run(run_server(os.getenv("SEARCH_HOST", "127.0.0.1"), int(os.getenv("SEARCH_PORT", "8765"))))
+
+
+# python search_server.py
+# 1行1リクエストの JSON で検索できる:
+# echo '{"image_path": "test_images/xxx.jpg", "num_neighbors": 10}' | nc 127.0.0.1 8765
@@ -0,0 +1,19 @@
+import numpy as np
+
+
+class FakeModel:
+    # 画像の平均色から決まるエンべディングを返す（TF Hub のモデルを読み込まない）
+    handle = "fake"
+    load_seconds = 0.0
+
+    def __init__(self, dimension):
+        self.projection = np.random.default_rng(0).standard_normal((3, dimension)).astype(np.float32)
+
+    def load(self):
+        pass
+
+    def __call__(self, images, training=False):
+        import tensorflow as tf
+        embeddings = np.asarray(images).mean(axis=(1, 2)) @ self.projection
+        # 内積で比べるので正規化しておく（自分自身が最も近くなるように）
+        return tf.constant(embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))
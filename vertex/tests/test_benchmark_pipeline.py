@@ -0,0 +1,25 @@
+import argparse
+
+import pytest
+
+from fakes import FakeModel
+
+
+def test_benchmark_pipeline_runs_offline(tmp_path):
+    pytest.importorskip("tensorflow")
+    pytest.importorskip("google.cloud.aiplatform")
+    import benchmark_pipeline
+    from vertex.constants import EMBEDDING_DIM
+
+    args = argparse.Namespace(
+        sizes=["small"], formats=["jpg", "png"], count=2, batch_size=4, repeats=1,
+        queries=3, num_neighbors=2, bucket_latency=0.0, verbose=False, trace=True
+    )
+    _, stages, tracer = benchmark_pipeline.run_benchmarks(args, str(tmp_path), model_manager=FakeModel(EMBEDDING_DIM))
+
+    assert list(stages) == [
+        "generate_embedding", "generate_embeddings_batch", "upload_images_to_gcs", "add_images", "search_similar_images"
+    ]
+    assert stages["add_images"]["items"] == 4
+    assert stages["search_similar_images"]["calls"] == 3
+    assert tracer.export()["counters"]
@@ -0,0 +1,102 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from vertex.constants import IMAGE_SIZE
+from vertex.decoder import decode_image, resize_bilinear, sniff_format
+
+# TF の経路と Pillow の経路で許容する画素値の差（[0, 1] スケール）
+# 同じ libjpeg なら一致する。バンドルされている libjpeg のバージョン差で丸めが1段変わる分だけ余裕を持たせる
+MAX_PIXEL_DRIFT = 1 / 255
+MEAN_PIXEL_DRIFT = 0.05 / 255
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def photo_like(width, height, seed=0):
+    # なめらかなグラデーションにノイズを足した、JPEG の写真に近い画像
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+# (名前, 画像バイト列) — 縮小デコードの倍率 1 / 2 / 8、PNG（アルファあり）、GIF、拡大になる小さい画像
+SAMPLES = [
+    ("jpeg_ratio1", encode(photo_like(400, 300), "JPEG", quality=90)),
+    ("jpeg_ratio2", encode(photo_like(1000, 700, seed=1), "JPEG", quality=90)),
+    ("jpeg_ratio8", encode(photo_like(2000, 1800, seed=2), "JPEG", quality=90)),
+    ("png_rgba", encode(photo_like(300, 200, seed=3).convert("RGBA"), "PNG")),
+    ("gif", encode(photo_like(320, 240, seed=4).convert("P"), "GIF")),
+    ("png_upscale", encode(photo_like(100, 80, seed=5), "PNG")),
+]
+
+
+def test_resize_bilinear_identity_and_halving():
+    image = np.random.default_rng(0).random((8, 6, 3)).astype(np.float32)
+    np.testing.assert_allclose(resize_bilinear(image, (8, 6)), image)
+
+    # half-pixel centers で 1/2 に縮小すると、隣り合う 2x2 画素の平均になる
+    expected = image.reshape(4, 2, 3, 2, 3).mean(axis=(1, 3))
+    np.testing.assert_allclose(resize_bilinear(image, (4, 3)), expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("name,data", SAMPLES, ids=[name for name, _ in SAMPLES])
+def test_decode_image_shape_and_range(name, data):
+    assert sniff_format(data) is not None
+    pixels = decode_image(data)
+    assert pixels.shape == (IMAGE_SIZE, IMAGE_SIZE, 3)
+    assert pixels.dtype == np.float32
+    assert 0.0 <= pixels.min() and pixels.max() <= 1.0
+
+
+@pytest.mark.parametrize("reduced", [True, False])
+@pytest.mark.parametrize("name,data", SAMPLES, ids=[name for name, _ in SAMPLES])
+def test_decode_image_matches_tensorflow_path(name, data, reduced):
+    pytest.importorskip("tensorflow")
+    from vertex.preprocess import decode_and_resize
+
+    pillow = decode_image(data, reduced=reduced)
+    tensorflow = decode_and_resize(data, reduced=reduced).numpy()
+    drift = np.abs(pillow - tensorflow)
+    assert drift.max() <= MAX_PIXEL_DRIFT
+    assert drift.mean() <= MEAN_PIXEL_DRIFT
+
+
+def test_preprocessing_variant_is_part_of_model_id(tmp_path):
+    pytest.importorskip("google.cloud.aiplatform")
+    from fakes import FakeModel
+    from vertex.constants import EMBEDDING_DIM
+    from vertex.demo import ImageSearchDemo
+    from vertex.storage import LocalBucket
+    from vertex.vector_store import LocalVectorStore
+
+    def demo(**kwargs):
+        return ImageSearchDemo(
+            project_id="test",
+            location="local",
+            bucket_name="test",
+            index_display_name="test",
+            search_backend=LocalVectorStore(str(tmp_path / "store")),
+            bucket=LocalBucket(str(tmp_path / "bucket"), name="test"),
+            model_manager=FakeModel(EMBEDDING_DIM),
+            offline=True,
+            **kwargs
+        )
+
+    # 縮小デコードは明示したときだけ使い、キャッシュのキーも分ける
+    assert not demo().reduced_decode
+    assert demo().model_id != demo(reduced_decode=True).model_id
+
+    class Decoder:
+        reduced = True
+
+    with pytest.raises(ValueError):
+        demo(image_decoder=Decoder())
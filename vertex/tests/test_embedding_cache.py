@@ -0,0 +1,67 @@
+import sqlite3
+
+import numpy as np
+
+from vertex.embedding_cache import EmbeddingCache
+from vertex.text_embedding_cache import TextEmbeddingCache, normalize_query
+
+
+def test_embedding_cache_evicts_and_keeps_size_across_reopen(tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(db_path, max_entries=2)
+    for i in range(3):
+        cache.put(str(i), "model:4", np.full(4, i))
+    # 上書きは件数を増やさない
+    cache.put("2", "model:4", np.full(4, 7))
+
+    assert cache.get("0", "model:4") is None
+    np.testing.assert_array_equal(cache.get("2", "model:4"), np.full(4, 7, dtype=np.float32))
+    assert cache.stats()["size"] == 2
+    assert cache.evictions == 1
+    cache.close()
+
+    assert EmbeddingCache(db_path, max_entries=2).stats()["size"] == 2
+
+
+def test_text_cache_shares_store_and_serves_from_disk_after_reopen(tmp_path):
+    db_path = str(tmp_path / "text.sqlite")
+    cache = TextEmbeddingCache(db_path, hot_size=1, max_entries=3)
+    texts = [normalize_query(t) for t in ["Ｃａｔ", "dog", "bird", "fish"]]
+    cache.put_many([(text, np.full(4, i)) for i, text in enumerate(texts)], "model:4")
+
+    assert texts[0] == "cat"
+    assert cache.missing(texts + ["cow"], "model:4") == ["cat", "cow"]
+    assert cache.stats()["size"] == 3
+    cache.close()
+
+    cache = TextEmbeddingCache(db_path)
+    np.testing.assert_array_equal(cache.get("fish", "model:4"), np.full(4, 3, dtype=np.float32))
+    assert cache.get("fish", "model:4") is not None
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["hot_hits"] == 1
+
+
+def test_caches_sharing_one_file_stay_within_max_entries(tmp_path):
+    # 2つのインスタンス（別プロセスで同じ .cache/embeddings.sqlite を開いた状態）から交互に書き込む
+    db_path = str(tmp_path / "embeddings.sqlite")
+    first = EmbeddingCache(db_path, max_entries=4)
+    second = EmbeddingCache(db_path, max_entries=4)
+
+    for i in range(3):
+        first.put(f"a{i}", "model:4", np.full(4, i))
+    for i in range(3):
+        second.put(f"b{i}", "model:4", np.full(4, i))
+    first.put("a3", "model:4", np.full(4, 3))
+
+    def stored():
+        return sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # 開いたときの件数のままだと上限を超えても削除されない
+    assert stored() == 4
+    assert first.stats()["size"] == 4
+    assert first.evictions + second.evictions == 3
+    # 最終利用の古い順に消える
+    assert first.get("a0", "model:4") is None
+    assert second.get("a3", "model:4") is not None
+    first.close()
+    second.close()
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from vertex import embedding_client
+from vertex.benchmark import FakeEmbeddingModel
+from vertex.embedding_client import AdaptiveConcurrencyLimiter, EmbeddingClient, TokenBucket
+
+
+def test_token_bucket_limits_the_request_rate():
+    bucket = TokenBucket(rate=50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 最初の1回はバーストで通り、残りの5回は 1/50 秒ずつ待つ
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+
+def test_limiter_halves_once_per_cooldown_and_recovers_additively():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=10, decrease_cooldown=60)
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(throttled=True)
+    # 同時に弾かれたリクエストでは1回しか減らさない
+    assert limiter.limit == 4
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    # 成功1回あたり 1/limit ずつ、ウィンドウ1つでおよそ +1
+    assert 4.9 < limiter.limit < 5.0
+
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 10
+
+
+def test_retries_throttling_with_jittered_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(embedding_client.time, "sleep", delays.append)
+    errors = [google_exceptions.TooManyRequests("429"), google_exceptions.ServiceUnavailable("503")]
+
+    def flaky(image_bytes):
+        if errors:
+            raise errors.pop(0)
+        return [1.0]
+
+    client = EmbeddingClient(flaky, backoff=1.0, max_retries=3)
+    assert client.embed(b"image") == [1.0]
+    assert len(delays) == 2
+    assert 0.5 <= delays[0] <= 1.5
+    assert 1.0 <= delays[1] <= 3.0
+    assert client.stats()["throttled"] == 2
+    assert client.stats()["succeeded"] == 1
+
+
+def test_gives_up_after_max_retries_and_does_not_retry_other_errors(monkeypatch):
+    monkeypatch.setattr(embedding_client.time, "sleep", lambda seconds: None)
+
+    def throttled(image_bytes):
+        raise google_exceptions.ResourceExhausted("quota")
+
+    client = EmbeddingClient(throttled, max_retries=2)
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        client.embed(b"image")
+    assert client.stats()["requests"] == 3
+
+    calls = []
+
+    def broken(image_bytes):
+        calls.append(image_bytes)
+        raise ValueError("bad image")
+
+    with pytest.raises(ValueError):
+        EmbeddingClient(broken).embed(b"image")
+    assert len(calls) == 1
+
+
+def test_adapts_to_fake_model_concurrency_quota():
+    model = FakeEmbeddingModel(dimension=8, latency=0.01, latency_jitter=0.0, max_concurrency=3)
+    client = EmbeddingClient(
+        model.embed, initial_concurrency=8, max_concurrency=8, max_retries=30, backoff=0.005, max_backoff=0.05
+    )
+    images = [bytes([i]) * 16 for i in range(60)]
+
+    embeddings = client.embed_many(images)
+
+    assert len(embeddings) == len(images) and all(len(embedding) == 8 for embedding in embeddings)
+    assert model.peak_concurrency <= 3
+    stats = client.stats()
+    assert stats["throttled"] > 0
+    # 弾かれた分はすべて再送で通る
+    assert stats["failed"] == 0
@@ -0,0 +1,83 @@
+import io
+import json
+
+import numpy as np
+
+from vertex.embedding_writer import ShardedEmbeddingWriter, format_embedding, read_embedding_records
+from vertex.storage import LocalBucket
+
+
+def random_embeddings(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def test_shards_are_capped_by_size(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    embeddings = random_embeddings(20)
+    max_shard_bytes = 1000
+
+    with ShardedEmbeddingWriter(bucket, "embeddings/run/", max_shard_bytes=max_shard_bytes) as writer:
+        written_to = [writer.write(f"gs://test/images/{i}.jpg", embedding) for i, embedding in enumerate(embeddings)]
+
+    assert writer.record_count == 20
+    assert len(writer.shard_names) > 1
+    assert writer.shard_names == [f"embeddings/run/shard-{i:05d}.json" for i in range(len(writer.shard_names))]
+    assert sorted(set(written_to)) == writer.shard_names
+    assert writer.contents_delta_uri == "gs://test/embeddings/run"
+
+    # 上限を超えた時点で切り替えるので、1シャードは上限 + 1レコード未満に収まる
+    line_bytes = max(len(line) for name in writer.shard_names for line in bucket.blob(name).download_as_bytes().splitlines(True))
+    for name in writer.shard_names:
+        size = len(bucket.blob(name).download_as_bytes())
+        assert size < max_shard_bytes + line_bytes
+
+
+def test_records_round_trip_float32_exactly(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    embeddings = random_embeddings(5)
+    # %.9g でないと丸められてしまう値も混ぜる
+    embeddings[0, :3] = [np.float32(1 / 3), np.float32(1e-38), np.float32(3.4028235e38)]
+
+    with ShardedEmbeddingWriter(bucket, "embeddings/run", max_shard_bytes=500) as writer:
+        for i, embedding in enumerate(embeddings):
+            writer.write(f"gs://test/images/{i}.jpg", embedding, {"index": i})
+
+    records = read_embedding_records(bucket, "embeddings/run/")
+    records.sort(key=lambda record: record["metadata"]["index"])
+    assert [record["id"] for record in records] == [f"gs://test/images/{i}.jpg" for i in range(5)]
+    np.testing.assert_array_equal(np.array([record["embedding"] for record in records], dtype=np.float32), embeddings)
+    np.testing.assert_array_equal(np.array(json.loads(format_embedding(embeddings[1])), dtype=np.float32), embeddings[1])
+
+
+def test_float32_sidecar_is_npy(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    embeddings = random_embeddings(6)
+
+    with ShardedEmbeddingWriter(bucket, "embeddings/run", max_shard_bytes=10 ** 6, sidecar_prefix="sidecars/run/") as writer:
+        for i, embedding in enumerate(embeddings):
+            writer.write(f"gs://test/images/{i}.jpg", embedding)
+
+    # サイドカーは contents_delta_uri の外に置かれる
+    assert [blob.name for blob in bucket.list_blobs("embeddings/run/")] == ["embeddings/run/shard-00000.json"]
+    vectors = np.load(io.BytesIO(bucket.blob("sidecars/run/shard-00000.npy").download_as_bytes()))
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors, embeddings)
+
+
+def test_int8_sidecar_is_npz_with_codes_and_scales(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    embeddings = random_embeddings(6)
+
+    with ShardedEmbeddingWriter(
+        bucket, "embeddings/run", max_shard_bytes=10 ** 6, sidecar_prefix="sidecars/run", sidecar_dtype="int8"
+    ) as writer:
+        for i, embedding in enumerate(embeddings):
+            writer.write(f"gs://test/images/{i}.jpg", embedding)
+
+    assert not bucket.blob("sidecars/run/shard-00000.npy").exists()
+    with np.load(io.BytesIO(bucket.blob("sidecars/run/shard-00000.npz").download_as_bytes())) as sidecar:
+        codes, scales = sidecar["codes"], sidecar["scales"]
+    assert codes.dtype == np.int8 and codes.shape == embeddings.shape
+    assert scales.dtype == np.float32 and scales.shape == (6,)
+    restored = codes.astype(np.float32) * scales[:, None]
+    np.testing.assert_allclose(restored, embeddings, atol=float(scales.max()))
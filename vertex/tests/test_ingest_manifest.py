@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+import pytest
+
+from fakes import FakeModel
+from vertex.ingest_manifest import IngestManifest
+from vertex.storage import crc32c_of_file
+
+
+def manifest_entry(blob_name, local_path, shard="embeddings/run/shard-00000.json"):
+    return {
+        "blob_name": blob_name,
+        "generation": 1,
+        "crc32c": crc32c_of_file(local_path),
+        "datapoint_id": f"gs://test/{blob_name}",
+        "embedding_uri": f"gs://test/{shard}",
+        "local_path": local_path,
+    }
+
+
+def test_unchanged_sources_are_detected_by_size_and_mtime(tmp_path):
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"aaa")
+    manifest = IngestManifest(str(tmp_path / "manifest" / "ingest.sqlite"))
+    assert not manifest.is_unchanged_source("images/a.jpg", str(image))
+
+    manifest.record([manifest_entry("images/a.jpg", str(image))])
+    assert len(manifest) == 1
+    assert manifest.is_unchanged_source("images/a.jpg", str(image))
+    assert manifest.is_current("images/a.jpg", crc32c_of_file(str(image)))
+
+    # 内容が変わればサイズも crc32c も変わる
+    image.write_bytes(b"changed")
+    assert not manifest.is_unchanged_source("images/a.jpg", str(image))
+    assert not manifest.is_current("images/a.jpg", crc32c_of_file(str(image)))
+
+    # 記録し直すと上書きされる（行は増えない）
+    manifest.record([manifest_entry("images/a.jpg", str(image), shard="embeddings/run2/shard-00000.json")])
+    assert len(manifest) == 1
+    assert manifest.get("images/a.jpg")["embedding_uri"] == "gs://test/embeddings/run2/shard-00000.json"
+    manifest.close()
+
+
+def test_entries_survive_reopening(tmp_path):
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"aaa")
+    db_path = str(tmp_path / "ingest.sqlite")
+    manifest = IngestManifest(db_path)
+    manifest.record([manifest_entry("images/a.jpg", str(image))])
+    manifest.close()
+
+    reopened = IngestManifest(db_path)
+    assert reopened.get("images/a.jpg")["generation"] == "1"
+    assert reopened.is_unchanged_source("images/a.jpg", str(image))
+    reopened.close()
+
+
+class CountingModel(FakeModel):
+    def __init__(self, dimension):
+        super().__init__(dimension)
+        self.images = 0
+
+    def __call__(self, images, training=False):
+        self.images += len(images)
+        return super().__call__(images, training)
+
+
+def test_add_images_skips_unchanged_files_and_reembeds_changed_ones(tmp_path):
+    pytest.importorskip("tensorflow")
+    pytest.importorskip("google.cloud.aiplatform")
+    from PIL import Image
+    from vertex.constants import EMBEDDING_DIM
+    from vertex.demo import ImageSearchDemo
+    from vertex.storage import LocalBucket
+    from vertex.vector_store import LocalVectorStore
+
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255)]):
+        Image.new("RGB", (32, 32), color).save(image_dir / f"{i}.png")
+
+    model = CountingModel(EMBEDDING_DIM)
+    store = LocalVectorStore(str(tmp_path / "store"))
+    manifest = IngestManifest(str(tmp_path / "ingest.sqlite"))
+    demo = ImageSearchDemo(
+        project_id="test",
+        location="us-central1",
+        bucket_name="test",
+        index_display_name="test",
+        search_backend=store,
+        bucket=LocalBucket(str(tmp_path / "bucket"), name="test"),
+        model_manager=model,
+        ingest_manifest=manifest,
+        offline=True
+    )
+
+    asyncio.run(demo.add_images(str(image_dir)))
+    assert model.images == 3
+    assert len(manifest) == 3
+
+    # 何も変わっていなければファイルを読まずに終わる
+    asyncio.run(demo.add_images(str(image_dir)))
+    assert model.images == 3
+
+    # 内容を変えた画像だけ推論し直し、インデックスとマニフェストを更新する
+    Image.new("RGB", (32, 32), (255, 255, 255)).save(image_dir / "1.png")
+    old_uri = manifest.get("images/admin/1.png")["embedding_uri"]
+    asyncio.run(demo.add_images(str(image_dir)))
+    assert model.images == 4
+    assert manifest.get("images/admin/1.png")["embedding_uri"] != old_uri
+    assert manifest.is_unchanged_source("images/admin/1.png", str(image_dir / "1.png"))
+
+    # 更新日時だけ変わった画像は crc32c が一致するので推論しない
+    stat = os.stat(image_dir / "2.png")
+    os.utime(image_dir / "2.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    asyncio.run(demo.add_images(str(image_dir)))
+    assert model.images == 4
+    assert manifest.is_unchanged_source("images/admin/2.png", str(image_dir / "2.png"))
+    assert len(manifest) == 3
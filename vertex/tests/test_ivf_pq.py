@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from fakes import FakeModel
+from vertex.embedding_writer import ShardedEmbeddingWriter
+from vertex.ivf_pq import IVFPQIndex
+from vertex.storage import LocalBucket
+from vertex.vector_store import LocalVectorStore
+
+DIMENSION = 16
+
+
+def trained_index(tmp_path, dimension=DIMENSION, seed=0):
+    rng = np.random.default_rng(seed)
+    store = LocalVectorStore(str(tmp_path / "store"), dimension=dimension)
+    index = IVFPQIndex(dimension=dimension, n_lists=4, n_subvectors=4, n_bits=4, nprobe=4, vector_store=store)
+    index.train(rng.standard_normal((256, dimension)).astype(np.float32), n_iter=5)
+    return index
+
+
+def test_import_from_bucket_then_search(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((50, DIMENSION)).astype(np.float32)
+    bucket = LocalBucket(str(tmp_path / "bucket"))
+    with ShardedEmbeddingWriter(bucket, "embeddings/202401/run", max_shard_bytes=4096) as writer:
+        for i, vector in enumerate(vectors):
+            writer.write(f"gs://local/images/{i}.jpg", vector)
+
+    index = trained_index(tmp_path)
+    assert index.import_from_bucket(bucket, prefix="embeddings/202401/run/") == len(vectors)
+    assert len(index) == len(vectors)
+    assert index.search(vectors[7], num_neighbors=1)[0]["uri"] == "gs://local/images/7.jpg"
+
+
+def test_add_upserts_existing_ids(tmp_path):
+    index = trained_index(tmp_path)
+    old, new = np.eye(DIMENSION, dtype=np.float32)[:2]
+    index.add(["a", "b"], [old, -old])
+    index.add(["a"], [new])
+
+    assert len(index) == 2
+    results = index.search(old, num_neighbors=5)
+    assert sorted(result["uri"] for result in results) == ["a", "b"]
+    assert next(result for result in results if result["uri"] == "a")["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_add_images_then_search_with_ivf_pq_backend(tmp_path, streaming):
+    pytest.importorskip("tensorflow")
+    pytest.importorskip("google.cloud.aiplatform")
+    from PIL import Image
+    from vertex.demo import ImageSearchDemo
+    from vertex.embedding_cache import EmbeddingCache
+    from vertex.constants import EMBEDDING_DIM
+
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+    for i, color in enumerate(colors):
+        Image.new("RGB", (64, 64), color).save(image_dir / f"{i}.png")
+
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    index = trained_index(tmp_path, dimension=EMBEDDING_DIM)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    demo = ImageSearchDemo(
+        project_id="test",
+        location="us-central1",
+        bucket_name=bucket.name,
+        index_display_name="test",
+        search_backend=index,
+        bucket=bucket,
+        model_manager=FakeModel(EMBEDDING_DIM),
+        embedding_cache=cache,
+        offline=True
+    )
+    asyncio.run(demo.add_images(str(image_dir), streaming=streaming))
+
+    assert len(index) == len(colors)
+    # ストリーミングでも通常の経路と同じくエンべディングキャッシュを通る
+    assert cache.stats()["size"] == len(colors)
+    # 候補（num_neighbors * rerank_factor 件）が全件を覆うので、保存済みのベクトルで正確に並べ直される
+    results = demo.search_similar_images(str(image_dir / "2.png"), num_neighbors=3)
+    assert os.path.basename(results[0]["uri"]) == "2.png"
@@ -0,0 +1,75 @@
+import io
+
+import numpy as np
+import pytest
+
+from fakes import FakeModel
+from vertex.embedding_cache import EmbeddingCache
+from vertex.embedding_writer import ShardedEmbeddingWriter, read_embedding_records
+from vertex.storage import LocalBucket
+
+pytest.importorskip("tensorflow")
+from vertex.pipeline import StreamingIngestPipeline  # noqa: E402
+
+DIMENSION = 8
+
+
+class CountingModel(FakeModel):
+    def __init__(self, dimension):
+        super().__init__(dimension)
+        self.images = 0
+
+    def __call__(self, images, training=False):
+        self.images += len(images)
+        return super().__call__(images, training)
+
+
+def upload_images(bucket):
+    from PIL import Image
+    blob_names = []
+    for i, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255)]):
+        buffer = io.BytesIO()
+        Image.new("RGB", (48, 32), color).save(buffer, "JPEG")
+        blob_names.append(f"images/{i}.jpg")
+        bucket.blob(blob_names[-1]).upload_from_string(buffer.getvalue())
+    bucket.blob("images/broken.jpg").upload_from_string(b"not an image")
+    return blob_names[:2] + ["images/broken.jpg"] + blob_names[2:]
+
+
+def ingest(pipeline, bucket, blob_names, prefix):
+    with ShardedEmbeddingWriter(bucket, prefix) as writer:
+        processed = pipeline.run(blob_names, writer)
+    records = {record["id"]: record["embedding"] for record in read_embedding_records(bucket, f"{prefix}/")}
+    return processed, records
+
+
+def test_dataset_decodes_and_skips_broken_images(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    blob_names = upload_images(bucket)
+    model = CountingModel(DIMENSION)
+    pipeline = StreamingIngestPipeline(bucket, model, batch_size=2)
+
+    processed, records = ingest(pipeline, bucket, blob_names, "embeddings/run")
+
+    assert sorted(blob_name for blob_name, _ in processed) == ["images/0.jpg", "images/1.jpg", "images/2.jpg"]
+    assert model.images == 3
+    assert sorted(records) == ["gs://test/images/0.jpg", "gs://test/images/1.jpg", "gs://test/images/2.jpg"]
+
+
+def test_cached_images_skip_decode_and_inference(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    blob_names = upload_images(bucket)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    model = CountingModel(DIMENSION)
+    pipeline = StreamingIngestPipeline(bucket, model, batch_size=2, embedding_cache=cache, model_id="fake:8")
+
+    _, first = ingest(pipeline, bucket, blob_names, "embeddings/first")
+    assert model.images == 3
+    assert cache.stats()["size"] == 3
+
+    processed, second = ingest(pipeline, bucket, blob_names, "embeddings/second")
+    # 2回目はすべてキャッシュから返り、モデルは呼ばれない
+    assert model.images == 3
+    assert len(processed) == 3
+    for uri, embedding in first.items():
+        np.testing.assert_allclose(second[uri], embedding, rtol=1e-6)
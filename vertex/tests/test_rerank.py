@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from fakes import FakeModel
+
+
+class ApproximateBackend:
+    # 近似検索の代わり: 決まった順（正確な順位とは逆）の候補を返し、要求された件数を記録する
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.requested = []
+
+    def search(self, query_embedding, num_neighbors=5):
+        self.requested.append(num_neighbors)
+        return [dict(candidate) for candidate in self.candidates[:num_neighbors]]
+
+    def search_batch(self, query_embeddings, num_neighbors=5):
+        return [self.search(query_embedding, num_neighbors) for query_embedding in query_embeddings]
+
+
+@pytest.fixture
+def make_demo(tmp_path):
+    pytest.importorskip("google.cloud.aiplatform")
+    from vertex.constants import EMBEDDING_DIM
+    from vertex.demo import ImageSearchDemo
+    from vertex.storage import LocalBucket
+    from vertex.vector_store import LocalVectorStore
+
+    # 軸方向の単位ベクトル i にクエリとの内積 i / 10 を持たせる
+    ids = [f"gs://test/images/{i}.jpg" for i in range(8)]
+    vectors = np.zeros((8, EMBEDDING_DIM), dtype=np.float32)
+    vectors[:, 0] = np.arange(8) / 10
+    query = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    query[0] = 1.0
+    rerank_store = LocalVectorStore(str(tmp_path / "rerank"), dimension=EMBEDDING_DIM)
+    rerank_store.add(ids, vectors)
+
+    def make_demo(use_rerank_store=True, rerank_factor=4):
+        # 近似検索は内積の小さい順に返してくる（正確な順位と逆）
+        candidates = [{"uri": uri, "distance": 0.0} for uri in ids]
+        backend = ApproximateBackend(candidates)
+        demo = ImageSearchDemo(
+            project_id="test",
+            location="us-central1",
+            bucket_name="test",
+            index_display_name="test",
+            search_backend=backend,
+            bucket=LocalBucket(str(tmp_path / "bucket"), name="test"),
+            model_manager=FakeModel(EMBEDDING_DIM),
+            rerank_store=rerank_store if use_rerank_store else None,
+            rerank_factor=rerank_factor,
+            offline=True
+        )
+        return demo, backend
+
+    return make_demo, query
+
+
+def test_candidate_count_widens_only_when_reranking(make_demo):
+    make, _ = make_demo
+    assert make()[0]._candidate_count(2) == 8
+    assert make(rerank_factor=1)[0]._candidate_count(2) == 2
+    assert make(use_rerank_store=False)[0]._candidate_count(2) == 2
+
+
+def test_rerank_reorders_the_shortlist_by_exact_score(make_demo):
+    make, query = make_demo
+    demo, backend = make(rerank_factor=2)
+
+    results = demo.find_neighbors_batch([query], num_neighbors=3)[0]
+
+    # 近似検索からは 3 * 2 = 6 件取り、その中で正確な内積の大きい順に並べ直す
+    assert backend.requested == [6]
+    assert [result["uri"] for result in results] == [f"gs://test/images/{i}.jpg" for i in (5, 4, 3)]
+    assert [result["distance"] for result in results] == pytest.approx([0.5, 0.4, 0.3])
+
+
+def test_without_rerank_the_approximate_order_is_truncated(make_demo):
+    make, query = make_demo
+    for demo, backend in (make(use_rerank_store=False), make(rerank_factor=1)):
+        results = demo._rerank(query, backend.search(query, 8), num_neighbors=2)
+        assert [result["uri"] for result in results] == ["gs://test/images/0.jpg", "gs://test/images/1.jpg"]
+
+
+def test_candidates_missing_from_the_rerank_store_are_kept_last(make_demo):
+    make, query = make_demo
+    unknown = {"uri": "gs://test/images/unknown.jpg", "distance": 0.9}
+    demo, _ = make()
+
+    candidates = [unknown, {"uri": "gs://test/images/1.jpg", "distance": 0.0}, {"uri": "gs://test/images/6.jpg", "distance": 0.0}]
+    results = demo._rerank(query, candidates, num_neighbors=3)
+
+    assert [result["uri"] for result in results] == ["gs://test/images/6.jpg", "gs://test/images/1.jpg", unknown["uri"]]
+    assert results[-1]["distance"] == 0.9
@@ -0,0 +1,56 @@
+import pytest
+
+from vertex import resource_cache
+from vertex.resource_cache import ResourceCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resource_cache.time, "time", clock.time)
+    return clock
+
+
+def test_entries_become_stale_after_ttl(tmp_path, clock):
+    cache = ResourceCache(str(tmp_path / "resources.json"), ttl=60)
+    assert cache.get("test/us-central1/index/test") is None
+
+    cache.put("test/us-central1/index/test", "projects/test/locations/us-central1/indexes/1")
+    assert cache.get("test/us-central1/index/test") == ("projects/test/locations/us-central1/indexes/1", False)
+
+    clock.now += 60
+    assert cache.get("test/us-central1/index/test")[1] is False
+    # 期限切れでも値は返し、古いことだけを知らせる
+    clock.now += 1
+    assert cache.get("test/us-central1/index/test") == ("projects/test/locations/us-central1/indexes/1", True)
+
+    # 解決し直すと新しくなる
+    cache.put("test/us-central1/index/test", "projects/test/locations/us-central1/indexes/2")
+    assert cache.get("test/us-central1/index/test") == ("projects/test/locations/us-central1/indexes/2", False)
+
+
+def test_entries_persist_across_instances(tmp_path, clock):
+    path = str(tmp_path / "cache" / "resources.json")
+    ResourceCache(path).put("key", "projects/test/locations/us-central1/indexEndpoints/1")
+
+    reopened = ResourceCache(path)
+    assert reopened.get("key") == ("projects/test/locations/us-central1/indexEndpoints/1", False)
+    reopened.invalidate("key")
+    assert ResourceCache(path).get("key") is None
+
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / "resources.json"
+    path.write_text("{not json")
+    cache = ResourceCache(str(path))
+    assert cache.get("key") is None
+    cache.put("key", "value")
+    assert ResourceCache(str(path)).get("key")[0] == "value"
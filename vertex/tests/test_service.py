@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+import pytest
+
+from vertex.service import SimilarImageSearchService
+
+
+class BlockingDemo:
+    # 推論が終わらないデモ（stop 時に処理中・待機中のクエリが残る状況を作る）
+    query_cache = None
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.model = self
+
+    def load(self):
+        pass
+
+    def generate_embeddings_from_bytes(self, images, batch_size):
+        self.release.wait(5)
+        return [[0.0] for _ in images]
+
+    def find_neighbors_batch(self, embeddings, num_neighbors):
+        return [[] for _ in embeddings]
+
+
+def test_stop_fails_in_flight_and_queued_queries():
+    async def run():
+        demo = BlockingDemo()
+        service = SimilarImageSearchService(demo, batch_window_ms=1, max_batch_size=1)
+        await service.start()
+        searches = [asyncio.create_task(service.search(b"image", 1)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+
+        await service.stop()
+        demo.release.set()
+        outcomes = await asyncio.wait_for(asyncio.gather(*searches, return_exceptions=True), 1)
+
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+        with pytest.raises(RuntimeError):
+            await service.search(b"image", 1)
+
+    asyncio.run(run())
+
+
+class InstantDemo(BlockingDemo):
+    def __init__(self):
+        super().__init__()
+        self.release.set()
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+
+
+def test_service_can_be_restarted_after_stop():
+    async def run():
+        demo = InstantDemo()
+        service = SimilarImageSearchService(demo, batch_window_ms=1)
+        await service.start()
+        with pytest.raises(RuntimeError):
+            await service.start()
+        assert await service.search(b"image", 1) == []
+        await service.stop()
+
+        # 止めたあとも新しい推論スレッドで再開できる
+        await service.start()
+        assert await asyncio.wait_for(service.search(b"image", 1), 1) == []
+        await service.stop()
+        await service.stop()
+
+        assert demo.loads == 2
+        assert service.queries == 2
+
+    asyncio.run(run())
@@ -0,0 +1,153 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from vertex.thumbnail_cache import ThumbnailCache
+
+
+def encoded(color, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_replaced_image_misses_the_old_thumbnail(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_size=16)
+    uri = "gs://test/images/admin/a.png"
+    path = cache.put(uri, encoded((255, 0, 0)), generation=1)
+
+    assert cache.get(uri, generation=1) == path
+    with Image.open(path) as thumbnail:
+        assert max(thumbnail.size) == 16
+    # 同じ URI に別の画像が上書きアップロードされた（generation が変わった）
+    assert cache.get(uri, generation=2) is None
+
+    new_path = cache.put(uri, encoded((0, 0, 255)), generation=2)
+    with Image.open(new_path) as thumbnail:
+        red, _, blue = thumbnail.convert("RGB").getpixel((0, 0))
+    assert blue > 200 and red < 50
+    # 置き換えられた古いサムネイルは消える
+    assert not os.path.exists(path)
+    assert cache.latest_generation(uri) == 2
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_latest_generation_survives_reopening(tmp_path):
+    uri = "gs://test/images/admin/a.png"
+    cache = ThumbnailCache(str(tmp_path), max_size=16)
+    assert cache.latest_generation(uri) is None
+    cache.put(uri, encoded((255, 0, 0)), generation=1700000000123456789)
+
+    reopened = ThumbnailCache(str(tmp_path), max_size=16)
+    assert reopened.latest_generation(uri) == 1700000000123456789
+    assert reopened.stats()["entries"] == 1
+    reopened.invalidate(uri, 1700000000123456789)
+    assert reopened.latest_generation(uri) is None
+    assert reopened.stats()["entries"] == 0
+
+
+class CountingBucket:
+    # LocalBucket の Blob を包み、本体を返したダウンロードと 304 の回数を数える
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.name = bucket.name
+        self.downloads = 0
+        self.not_modified = 0
+
+    def blob(self, blob_name):
+        blob = self.bucket.blob(blob_name)
+        download = blob.download_as_bytes
+
+        def counted_download(**kwargs):
+            from google.api_core import exceptions as google_exceptions
+            try:
+                data = download(**kwargs)
+            except google_exceptions.NotModified:
+                self.not_modified += 1
+                raise
+            self.downloads += 1
+            return data
+        blob.download_as_bytes = counted_download
+        return blob
+
+
+def test_result_thumbnails_are_opt_in_and_fetched_conditionally(tmp_path):
+    pytest.importorskip("google.cloud.aiplatform")
+    from fakes import FakeModel
+    from vertex.constants import EMBEDDING_DIM
+    from vertex.demo import ImageSearchDemo
+    from vertex.storage import LocalBucket
+    from vertex.vector_store import LocalVectorStore
+
+    local_bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    local_bucket.blob("images/admin/a.png").upload_from_string(encoded((255, 0, 0), size=(640, 480)))
+    bucket = CountingBucket(local_bucket)
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"), max_size=64)
+    demo = ImageSearchDemo(
+        project_id="test",
+        location="us-central1",
+        bucket_name="test",
+        index_display_name="test",
+        search_backend=LocalVectorStore(str(tmp_path / "store")),
+        bucket=bucket,
+        model_manager=FakeModel(EMBEDDING_DIM),
+        thumbnail_cache=cache,
+        offline=True
+    )
+    results = [{"uri": "gs://test/images/admin/a.png", "distance": 1.0}]
+
+    # 既定ではキャッシュがあってもフルサイズの画像を保存する
+    [path] = demo.download_result_images(results, str(tmp_path / "full"))
+    with Image.open(path) as image:
+        assert image.size == (640, 480)
+    assert cache.stats()["entries"] == 0
+
+    [path] = demo.download_result_images(results, str(tmp_path / "first"), thumbnails=True)
+    with Image.open(path) as image:
+        assert max(image.size) == 64
+    assert bucket.downloads == 1
+
+    # 変わっていなければ 304 で済み、本体は取り直さない（reload も呼ばない）
+    fetched = list(demo.iter_result_images(results, str(tmp_path / "second"), thumbnails=True))
+    assert fetched[0]["cached"] and fetched[0]["error"] is None
+    assert (bucket.downloads, bucket.not_modified) == (1, 1)
+
+    # generation が分かっていれば Cloud Storage に問い合わせずにキャッシュから返す
+    generation = cache.latest_generation(results[0]["uri"])
+    fetched = list(demo.iter_result_images([dict(results[0], generation=generation)], str(tmp_path / "third"), thumbnails=True))
+    assert fetched[0]["cached"]
+    assert (bucket.downloads, bucket.not_modified) == (1, 1)
+
+    # 上書きアップロードされた画像は取り直す
+    blob = local_bucket.blob("images/admin/a.png")
+    blob.upload_from_string(encoded((0, 0, 255), size=(640, 480)))
+    os.utime(blob.path, ns=(generation + 10 ** 9, generation + 10 ** 9))
+    fetched = list(demo.iter_result_images(results, str(tmp_path / "fourth"), thumbnails=True))
+    assert not fetched[0]["cached"]
+    assert bucket.downloads == 2
+    assert cache.latest_generation(results[0]["uri"]) == generation + 10 ** 9
+    assert cache.stats()["entries"] == 1
+
+
+def test_thumbnails_need_a_thumbnail_cache(tmp_path):
+    pytest.importorskip("google.cloud.aiplatform")
+    from fakes import FakeModel
+    from vertex.constants import EMBEDDING_DIM
+    from vertex.demo import ImageSearchDemo
+    from vertex.storage import LocalBucket
+    from vertex.vector_store import LocalVectorStore
+
+    demo = ImageSearchDemo(
+        project_id="test",
+        location="us-central1",
+        bucket_name="test",
+        index_display_name="test",
+        search_backend=LocalVectorStore(str(tmp_path / "store")),
+        bucket=LocalBucket(str(tmp_path / "bucket"), name="test"),
+        model_manager=FakeModel(EMBEDDING_DIM),
+        offline=True
+    )
+    with pytest.raises(ValueError):
+        demo.download_result_images([], str(tmp_path / "out"), thumbnails=True)
@@ -0,0 +1,66 @@
+import pytest
+
+from vertex.tracing import Tracer
+
+
+def recorded_tracer():
+    tracer = Tracer(buckets_ms=(1, 10, 100))
+    tracer.observe("add_images.upload", 0.0005)
+    tracer.observe("add_images.upload", 0.05)
+    # 最後のバケットより長いものは sum と count にだけ入る
+    tracer.observe("add_images.upload", 1.0)
+    tracer.observe("search", 0.002, backend="local")
+    with pytest.raises(ValueError):
+        with tracer.span("add_images.index_update"):
+            raise ValueError("boom")
+    tracer.incr("add_images.images", 3)
+    tracer.incr("add_images.images", 2)
+    tracer.gauge("rss_mb", 512)
+    return tracer
+
+
+def test_export_aggregates_spans_counters_and_gauges():
+    exported = recorded_tracer().export()
+
+    assert exported["counters"] == [
+        {"key": "add_images.images", "value": 5, "labels": {}, "description": ""},
+        {"key": "add_images.index_update_errors", "value": 1, "labels": {}, "description": ""},
+    ]
+    assert exported["gauges"] == [{"key": "rss_mb", "value": 512.0, "labels": {}, "description": ""}]
+
+    histograms = {(metric["key"], tuple(metric["labels"].items())): metric["value"] for metric in exported["histograms"]}
+    upload = histograms[("add_images.upload", ())]
+    assert upload["count"] == 3
+    assert upload["sum"] == pytest.approx(1050.5)
+    assert upload["buckets"] == [[1, 1], [10, 0], [100, 1]]
+    assert histograms[("search", (("backend", "local"),))]["count"] == 1
+    assert histograms[("add_images.index_update", ())]["count"] == 1
+
+
+def test_export_parses_as_prisma_metrics():
+    from prisma import Metrics
+    from prisma._compat import model_parse
+
+    tracer = recorded_tracer()
+    exported = tracer.export()
+    # 素の dict のまま prisma の Metrics として読めること
+    parsed = model_parse(Metrics, exported)
+    assert parsed == tracer.to_prisma_metrics()
+
+    assert [counter.key for counter in parsed.counters] == ["add_images.images", "add_images.index_update_errors"]
+    assert parsed.gauges[0].value == 512.0
+    search = next(histogram for histogram in parsed.histograms if histogram.key == "search")
+    assert search.labels == {"backend": "local"}
+    assert search.description == "Span duration in milliseconds"
+    upload = next(histogram for histogram in parsed.histograms if histogram.key == "add_images.upload")
+    assert upload.value.count == 3
+    assert [(bucket.max_value, bucket.total_count) for bucket in upload.value.buckets] == [(1, 1), (10, 0), (100, 1)]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("add_images"):
+        tracer.incr("add_images.images")
+        tracer.gauge("rss_mb", 1)
+    assert tracer.export() == {"counters": [], "gauges": [], "histograms": []}
+    assert tracer.to_prisma_metrics().histograms == []
@@ -0,0 +1,64 @@
+from vertex.storage import LocalBucket
+from vertex.uploader import ConcurrentUploader, build_upload_manifest
+
+
+def write_images(image_dir, contents):
+    image_dir.mkdir(exist_ok=True)
+    for filename, data in contents.items():
+        (image_dir / filename).write_bytes(data)
+
+
+class FlakyBucket(LocalBucket):
+    # 指定したブロブへの最初の failures 回のアップロードを失敗させる
+    def __init__(self, root_dir, fail_blob, failures):
+        super().__init__(root_dir, name="test")
+        self.fail_blob = fail_blob
+        self.failures = failures
+
+    def blob(self, blob_name):
+        blob = super().blob(blob_name)
+        if blob_name == self.fail_blob:
+            upload = blob.upload_from_filename
+
+            def flaky_upload(filename):
+                if self.failures > 0:
+                    self.failures -= 1
+                    raise ConnectionError("connection reset")
+                upload(filename)
+            blob.upload_from_filename = flaky_upload
+        return blob
+
+
+def test_skips_files_whose_crc32c_already_matches(tmp_path):
+    image_dir = tmp_path / "images"
+    write_images(image_dir, {"a.jpg": b"aaa", "b.png": b"bbb", "notes.txt": b"skip me"})
+    bucket = LocalBucket(str(tmp_path / "bucket"), name="test")
+    manifest = build_upload_manifest(str(image_dir), "images/admin/")
+    assert [blob_name for _, blob_name in manifest] == ["images/admin/a.jpg", "images/admin/b.png"]
+
+    uploader = ConcurrentUploader(bucket, max_workers=2)
+    assert [result["status"] for result in uploader.upload(manifest)] == ["uploaded", "uploaded"]
+
+    # 片方だけ中身を変えると、そちらだけ上げ直す
+    (image_dir / "b.png").write_bytes(b"changed")
+    results = uploader.upload(manifest, keep_bytes_below=1024)
+    assert [result["status"] for result in results] == ["skipped", "uploaded"]
+    assert results[0]["generation"] is not None
+    assert results[1]["data"] == b"changed"
+    assert bucket.blob("images/admin/b.png").download_as_bytes() == b"changed"
+
+
+def test_retries_each_file_independently(tmp_path):
+    image_dir = tmp_path / "images"
+    write_images(image_dir, {"a.jpg": b"aaa", "b.jpg": b"bbb", "c.jpg": b"ccc"})
+    manifest = build_upload_manifest(str(image_dir), "images/admin/")
+
+    bucket = FlakyBucket(str(tmp_path / "bucket"), "images/admin/b.jpg", failures=2)
+    results = ConcurrentUploader(bucket, max_workers=3, max_retries=2, backoff=0.0).upload(manifest)
+    assert [result["status"] for result in results] == ["uploaded"] * 3
+
+    # リトライを使い切ったファイルだけが failed になり、他は影響を受けない
+    bucket = FlakyBucket(str(tmp_path / "bucket2"), "images/admin/b.jpg", failures=5)
+    results = ConcurrentUploader(bucket, max_workers=3, max_retries=1, backoff=0.0).upload(manifest)
+    assert [result["status"] for result in results] == ["uploaded", "failed", "uploaded"]
+    assert "connection reset" in results[1]["error"]
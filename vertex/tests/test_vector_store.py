@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from vertex.vector_store import LocalVectorStore
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_add_upserts_existing_ids(tmp_path, dtype):
+    store = LocalVectorStore(str(tmp_path), dimension=3, dtype=dtype)
+    v_old, v_new, other = unit([1, 0, 0]), unit([0, 1, 0]), unit([0.6, 0.8, 0])
+    store.add(["a", "b"], [v_old, other])
+    store.search([1, 0, 0])  # 索引を作ってから上書きし、差分更新の経路も通す
+    store.add(["a"], [v_new])
+
+    assert len(store) == 2
+    results = store.search(v_old, num_neighbors=5)
+    assert [result["uri"] for result in results] == ["b", "a"]
+    assert results[1]["distance"] == pytest.approx(float(v_new @ v_old), abs=0.02)
+
+    # 再スコアリングも検索と同じ（最新の）ベクトルを使う
+    reranked = store.rerank(v_new, [{"uri": "b", "distance": 0.0}, {"uri": "a", "distance": 0.0}], 2)
+    assert reranked[0]["uri"] == "a"
+    assert reranked[0]["distance"] == pytest.approx(1.0, abs=0.02)
+
+
+def test_upsert_survives_reopen(tmp_path):
+    store = LocalVectorStore(str(tmp_path), dimension=2)
+    store.add(["a", "b"], [[1, 0], [0, 1]])
+    store.add(["a"], [[-1, 0]])
+
+    reopened = LocalVectorStore(str(tmp_path), dimension=2)
+    assert len(reopened) == 2
+    assert reopened.live_rows.tolist() == [False, True, True]
+    assert [result["uri"] for result in reopened.search([1, 0], num_neighbors=3)] == ["b", "a"]
@@ -0,0 +1,266 @@
+import importlib
+import threading
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("vertexai")
+from vertex.benchmark import FakeEmbeddingModel  # noqa: E402
+from vertex.embedding_client import EmbeddingClient  # noqa: E402
+from vertex.query_cache import QueryCache  # noqa: E402
+from vertex.text_embedding_cache import TextEmbeddingCache  # noqa: E402
+from vertex.vector_store import LocalVectorStore  # noqa: E402
+
+# vertex.VertexImageSearch はパッケージ側で同名のクラスに置き換わるので、モジュールは import_module で取る
+module = importlib.import_module("vertex.VertexImageSearch")
+
+DIMENSION = 16
+
+
+class FakeMultiModalModel:
+    # MultiModalEmbeddingModel.get_embeddings の代わりに FakeEmbeddingModel でベクトルを返す
+    def __init__(self):
+        self.fake = FakeEmbeddingModel(dimension=DIMENSION, latency=0.0, latency_jitter=0.0)
+
+    def get_embeddings(self, image=None, contextual_text=None, dimension=None):
+        if contextual_text is not None:
+            return types.SimpleNamespace(text_embedding=self.fake.embed(contextual_text.encode("utf-8")))
+        return types.SimpleNamespace(image_embedding=self.fake.embed(image._loaded_bytes))
+
+
+@pytest.fixture
+def make_search(monkeypatch, tmp_path):
+    monkeypatch.setattr(module.storage, "Client", lambda project=None: types.SimpleNamespace(bucket=lambda name: None))
+    monkeypatch.setattr(module.MultiModalEmbeddingModel, "from_pretrained", lambda name: FakeMultiModalModel())
+
+    def resolve(*args, **kwargs):
+        raise AssertionError("index and endpoint must not be resolved")
+    monkeypatch.setattr(module.VertexImageSearch, "_initialize_index_and_endpoint", resolve)
+
+    def make(**kwargs):
+        search = module.VertexImageSearch(
+            project_id="test",
+            location="us-central1",
+            bucket_name="test",
+            index_display_name="test",
+            dimension=DIMENSION,
+            text_cache=TextEmbeddingCache(str(tmp_path / "text.sqlite")),
+            resolve_resources=False,
+            **kwargs
+        )
+        search.embedding_client = EmbeddingClient(search._embed_remote, backoff=0.0)
+        return search
+    return make
+
+
+def test_embed_text_normalizes_and_caches(make_search):
+    search = make_search()
+    first = search.embed_text("  Ｒｅｄ   Dress ")
+    assert search.embed_text("red dress") == pytest.approx(first)
+    assert search.model.fake.calls == 1
+    assert search.text_cache.stats()["hot_hits"] == 1
+
+    with pytest.raises(ValueError):
+        search.embed_text("   ")
+
+
+def test_precompute_text_embeddings_skips_cached_texts(make_search):
+    search = make_search()
+    search.embed_text("cat")
+    summary = search.precompute_text_embeddings(["Cat", "dog", "DOG ", "", "bird"], max_workers=2)
+
+    assert summary["texts"] == 3
+    assert summary["cached"] == 1
+    assert summary["embedded"] == 2
+    assert summary["failed"] == 0
+    assert search.model.fake.calls == 3
+    assert search.text_cache.missing(["cat", "dog", "bird"], search.model_id) == []
+
+
+def test_search_by_text_uses_text_key_in_query_cache(make_search, tmp_path):
+    store = LocalVectorStore(str(tmp_path / "store"), dimension=DIMENSION)
+    query_cache = QueryCache()
+    search = make_search(search_backend=store, query_cache=query_cache)
+    target = np.asarray(search.embed_text("red dress"), dtype=np.float32)
+    store.add(["gs://test/a.jpg", "gs://test/b.jpg"], [target, -target])
+
+    results = search.search_by_text("Red  Dress", k=1)
+    assert [result["id"] for result in results] == ["gs://test/a.jpg"]
+    # 正規化後のテキストに "text:" を付けたキーで保存される（画像ハッシュとは衝突しない）
+    assert query_cache.get_results("text:red dress", 1) == results
+    assert query_cache.get_results("red dress", 1) is None
+
+    calls = search.model.fake.calls
+    assert search.search_by_text("red dress", k=1) == results
+    assert search.model.fake.calls == calls
+
+    with pytest.raises(ValueError):
+        search.search_by_text("")
+
+
+def test_endpoint_calls_fail_clearly_without_resolved_resources(make_search):
+    search = make_search()
+    with pytest.raises(RuntimeError):
+        search._find_neighbors([[0.0] * DIMENSION], 1)
+
+
+class FakeEndpoint:
+    # upsert_embeddings の呼び出しを記録し、fail_calls 番目（1始まり）の呼び出しを失敗させる
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self.upserted = []
+
+    def upsert_embeddings(self, embeddings, metadata_list):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise RuntimeError("upsert failed")
+        self.upserted.extend(item["id"] for item in metadata_list)
+
+
+def write_images(image_dir, count):
+    image_dir.mkdir()
+    paths = []
+    for i in range(count):
+        path = image_dir / f"{i}.jpg"
+        path.write_bytes(f"image {i}".encode("utf-8"))
+        paths.append(str(path))
+    return paths
+
+
+def test_bulk_index_images_reports_summary(make_search, tmp_path):
+    search = make_search()
+    search.index_endpoint = FakeEndpoint()
+    query_cache = search.query_cache = QueryCache()
+    query_cache.put_results("text:cat", 1, [{"id": "stale"}])
+    paths = write_images(tmp_path / "images", 7)
+    # 壊れた（読めない）画像はバッチから外れるだけで、他の画像は取り込まれる
+    paths.insert(3, str(tmp_path / "images" / "missing.jpg"))
+
+    summary = search.bulk_index_images(paths, [{"id": path} for path in paths], batch_size=3, embed_workers=2)
+
+    assert summary["images"] == 8
+    assert summary["embedded"] == 7
+    assert summary["indexed"] == 7
+    assert summary["failed_batches"] == 0
+    assert search.index_endpoint.calls == 3
+    assert search.index_endpoint.upserted == [path for path in paths if not path.endswith("missing.jpg")]
+    for key in ("embed_seconds", "upsert_seconds", "upsert_wait_seconds", "elapsed_seconds"):
+        assert summary[key] >= 0.0
+    assert summary["images_per_second"] > 0.0
+    # 取り込み後はキャッシュ済みの検索結果を破棄する
+    assert query_cache.get_results("text:cat", 1) is None
+
+
+def test_bulk_index_images_skips_failed_upserts(make_search, tmp_path):
+    search = make_search()
+    search.index_endpoint = FakeEndpoint(fail_calls=[2])
+    paths = write_images(tmp_path / "images", 7)
+
+    summary = search.bulk_index_images(paths, [{"id": path} for path in paths], batch_size=3)
+
+    # 2番目のバッチだけ失敗し、残りのバッチは続けて取り込まれる
+    assert summary["embedded"] == 7
+    assert summary["indexed"] == 4
+    assert summary["failed_batches"] == 1
+    assert search.index_endpoint.upserted == paths[:3] + paths[6:]
+    assert summary["images_per_second"] > 0.0
+
+
+INDEX_NAME = "projects/test/locations/us-central1/indexes/{}"
+ENDPOINT_NAME = "projects/test/locations/us-central1/indexEndpoints/{}"
+
+
+@pytest.fixture
+def fake_resources(monkeypatch):
+    # aiplatform の Index / IndexEndpoint の代わり。list で返すリソースをテストから差し替える
+    listed = {"index": [], "endpoint": [], "list_calls": 0}
+
+    class FakeIndex:
+        def __init__(self, index_name):
+            self.resource_name = index_name
+
+        @classmethod
+        def list(cls, filter=None, project=None, location=None):
+            listed["list_calls"] += 1
+            return listed["index"]
+
+    class FakeIndexEndpoint:
+        unavailable = set()
+
+        def __init__(self, index_endpoint_name):
+            if index_endpoint_name in self.unavailable:
+                raise RuntimeError("404 not found")
+            self.resource_name = index_endpoint_name
+
+        @classmethod
+        def list(cls, filter=None, project=None, location=None):
+            listed["list_calls"] += 1
+            return listed["endpoint"]
+
+    monkeypatch.setattr(module.aiplatform, "MatchingEngineIndex", FakeIndex)
+    monkeypatch.setattr(module.aiplatform, "MatchingEngineIndexEndpoint", FakeIndexEndpoint)
+    listed["endpoint_class"] = FakeIndexEndpoint
+    return listed
+
+
+def cached_search(make_search, tmp_path, ttl):
+    cache = module.ResourceCache(str(tmp_path / "resources.json"), ttl=ttl)
+    search = make_search(resource_cache=cache)
+    cache.put(search._resource_cache_key("index", search.index_display_name), INDEX_NAME.format(1))
+    cache.put(search._resource_cache_key("endpoint", search.endpoint_display_name), ENDPOINT_NAME.format(1))
+    return search, cache
+
+
+def join_revalidation():
+    for thread in threading.enumerate():
+        if thread.name == "resource-revalidate":
+            thread.join(timeout=5)
+
+
+def test_fresh_cached_resources_skip_the_list_calls(make_search, fake_resources, tmp_path):
+    search, _ = cached_search(make_search, tmp_path, ttl=60)
+
+    index, endpoint = search._load_cached_resources()
+    join_revalidation()
+
+    assert index is None
+    assert endpoint.resource_name == ENDPOINT_NAME.format(1)
+    # インデックスは使うときに初めて取得する
+    assert search.index.resource_name == INDEX_NAME.format(1)
+    assert fake_resources["list_calls"] == 0
+
+
+def test_stale_cached_resources_are_revalidated_in_background(make_search, fake_resources, tmp_path):
+    search, cache = cached_search(make_search, tmp_path, ttl=-1)
+    fake_resources["index"] = [types.SimpleNamespace(resource_name=INDEX_NAME.format(2))]
+    fake_resources["endpoint"] = [types.SimpleNamespace(resource_name=ENDPOINT_NAME.format(2))]
+
+    # 期限切れでも起動はキャッシュの値ですぐに済ませる
+    _, endpoint = search._load_cached_resources()
+    assert endpoint.resource_name == ENDPOINT_NAME.format(1)
+    join_revalidation()
+
+    # 裏で一覧から解決し直した結果が次回の起動に使われる
+    assert fake_resources["list_calls"] == 2
+    assert cache.get(search._resource_cache_key("index", search.index_display_name))[0] == INDEX_NAME.format(2)
+    assert cache.get(search._resource_cache_key("endpoint", search.endpoint_display_name))[0] == ENDPOINT_NAME.format(2)
+
+
+def test_stale_cached_resources_that_no_longer_exist_are_dropped(make_search, fake_resources, tmp_path):
+    search, cache = cached_search(make_search, tmp_path, ttl=-1)
+
+    search._load_cached_resources()
+    join_revalidation()
+
+    assert cache.get(search._resource_cache_key("index", search.index_display_name)) is None
+    assert cache.get(search._resource_cache_key("endpoint", search.endpoint_display_name)) is None
+
+
+def test_unavailable_cached_endpoint_falls_back_to_listing(make_search, fake_resources, tmp_path):
+    search, cache = cached_search(make_search, tmp_path, ttl=60)
+    fake_resources["endpoint_class"].unavailable = {ENDPOINT_NAME.format(1)}
+
+    assert search._load_cached_resources() is None
+    assert cache.get(search._resource_cache_key("endpoint", search.endpoint_display_name)) is None
@@ -2,10 +2,20 @@ import os
 from google.cloud import storage
 from google.cloud import aiplatform
 from vertexai.vision_models import Image, MultiModalEmbeddingModel
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 import time
 import json
 import logging
+import queue
+import threading
+from .vector_store import LocalVectorStore
+from .embedding_cache import EmbeddingCache
+from .query_cache import QueryCache
+from .tracing import Tracer
+from .resource_cache import ResourceCache
+from .embedding_client import EmbeddingClient
+from .text_embedding_cache import TextEmbeddingCache, normalize_query
 
 class VertexImageSearch:
     def __init__(
@@ -15,9 +25,35 @@ class VertexImageSearch:
         bucket_name: str,
         index_display_name: str,
         dimension: int = 512,
-        approximate_neighbor_count: int = 10
+        approximate_neighbor_count: int = 10,
+        search_backend: Optional["LocalVectorStore"] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        query_cache: Optional[QueryCache] = None,
+        tracer: Optional[Tracer] = None,
+        resource_cache: Optional[ResourceCache] = None,
+        embedding_client: Optional[EmbeddingClient] = None,
+        text_cache: Optional[TextEmbeddingCache] = None,
+        resolve_resources: bool = True
     ):
-        """Initialize Vertex AI Vector Search for image similarity"""
+        """Initialize Vertex AI Vector Search for image similarity
+
+        search_backend: optional in-process backend (LocalVectorStore) that
+        replaces find_neighbors calls against the deployed endpoint.
+        embedding_cache: optional persistent cache consulted before calling the model.
+        query_cache: optional in-memory cache of query embeddings and neighbour lists,
+        invalidated whenever add_images upserts into the index.
+        tracer: optional span timer for index setup, embedding, upsert and search calls.
+        resource_cache: optional on-disk map of display name to resource name; on a hit
+        startup is a single endpoint lookup and stale entries are re-resolved in the background.
+        embedding_client: optional EmbeddingClient (token-bucket rate limit, AIMD concurrency,
+        jittered retry on quota errors) built around _embed_remote; by default one without a
+        rate limit is used, so throttled calls are still retried.
+        text_cache: optional hot LRU + on-disk store of normalized query text to text
+        embedding used by search_by_text and filled in bulk by precompute_text_embeddings.
+        resolve_resources: when False the index and endpoint are neither looked up nor
+        created or deployed; only embedding (embed_text, generate_embedding,
+        precompute_text_embeddings) and search_backend queries are available.
+        """
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
@@ -28,32 +64,54 @@ class VertexImageSearch:
         self.bucket_name = bucket_name
         self.dimension = dimension
         self.index_display_name = index_display_name
+        self.search_backend = search_backend
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.resource_cache = resource_cache
+        self.text_cache = text_cache
+        self.model_id = f"multimodalembedding:{dimension}"
         
         self.storage_client = storage.Client(project=project_id)
         self.bucket = self.storage_client.bucket(bucket_name)
         
         self.model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding")
+        self.embedding_client = embedding_client if embedding_client is not None else EmbeddingClient(self._embed_remote)
         
-        self.index, self.index_endpoint = self._initialize_index_and_endpoint(
-            approximate_neighbor_count
-        )
+        self._index = None
+        self._index_name = None
+        self.index_endpoint = None
+        if resolve_resources:
+            self.index, self.index_endpoint = self._initialize_index_and_endpoint(
+                approximate_neighbor_count
+            )
+
+    @property
+    def index(self) -> aiplatform.MatchingEngineIndex:
+        """The Vector Search index, fetched on first use when it was resolved from the cache"""
+        if self._index is None and self._index_name is not None:
+            self._index = aiplatform.MatchingEngineIndex(index_name=self._index_name)
+        return self._index
+
+    @index.setter
+    def index(self, index: Optional[aiplatform.MatchingEngineIndex]):
+        self._index = index
+
+    @property
+    def endpoint_display_name(self) -> str:
+        return f"{self.index_display_name}-endpoint"
 
     def _initialize_index_and_endpoint(
         self,
         approximate_neighbor_count: int
-    ) -> Tuple[aiplatform.MatchingEngineIndex, aiplatform.MatchingEngineIndexEndpoint]:
+    ) -> Tuple[Optional[aiplatform.MatchingEngineIndex], aiplatform.MatchingEngineIndexEndpoint]:
         """Initialize or get existing Vector Search index and endpoint"""
         try:
-            existing_indexes = aiplatform.MatchingEngineIndex.list(
-                project=self.project_id,
-                location=self.location
-            )
+            cached = self._load_cached_resources()
+            if cached is not None:
+                return cached
             
-            index = None
-            for existing_index in existing_indexes:
-                if existing_index.display_name == self.index_display_name:
-                    index = existing_index
-                    break
+            index = self._find_index()
             
             if index is None:
                 index = self._create_new_index(approximate_neighbor_count)
@@ -61,7 +119,8 @@ class VertexImageSearch:
             else:
                 self.logger.info(f"Using existing index: {self.index_display_name}")
             
-            endpoint = self._get_or_create_endpoint()
+            endpoint = self._get_or_create_endpoint(index)
+            self._remember_resources(index, endpoint)
             
             return index, endpoint
             
@@ -69,115 +128,402 @@ class VertexImageSearch:
             self.logger.error(f"Error initializing index and endpoint: {str(e)}")
             raise
 
-    def _create_new_index(
+    def _resource_cache_key(self, kind: str, display_name: str) -> str:
+        return f"{self.project_id}/{self.location}/{kind}/{display_name}"
+
+    def _load_cached_resources(
+        self
+    ) -> Optional[Tuple[None, aiplatform.MatchingEngineIndexEndpoint]]:
+        """Resolve the endpoint from the resource cache; the index is fetched lazily"""
+        if self.resource_cache is None:
+            return None
+        index_key = self._resource_cache_key("index", self.index_display_name)
+        endpoint_key = self._resource_cache_key("endpoint", self.endpoint_display_name)
+        cached_index = self.resource_cache.get(index_key)
+        cached_endpoint = self.resource_cache.get(endpoint_key)
+        if cached_index is None or cached_endpoint is None:
+            return None
+        
+        try:
+            endpoint = aiplatform.MatchingEngineIndexEndpoint(index_endpoint_name=cached_endpoint[0])
+        except Exception as e:
+            # 削除・作り直された場合は一覧から解決し直す
+            self.logger.warning(f"Cached endpoint {cached_endpoint[0]} is unavailable ({str(e)}), resolving again")
+            self.resource_cache.invalidate(index_key)
+            self.resource_cache.invalidate(endpoint_key)
+            return None
+        
+        self._index_name = cached_index[0]
+        self.logger.info(f"Using cached index and endpoint for {self.index_display_name}")
+        if cached_index[1] or cached_endpoint[1]:
+            threading.Thread(target=self._revalidate_resources, name="resource-revalidate", daemon=True).start()
+        return None, endpoint
+
+    def _revalidate_resources(self):
+        """Re-resolve stale cache entries in the background (affects the next startup)"""
+        try:
+            index = self._find_index()
+            endpoint = self._find_endpoint()
+            if index is None or endpoint is None:
+                self.resource_cache.invalidate(self._resource_cache_key("index", self.index_display_name))
+                self.resource_cache.invalidate(self._resource_cache_key("endpoint", self.endpoint_display_name))
+                self.logger.warning(f"Index or endpoint for {self.index_display_name} no longer exists")
+                return
+            self._remember_resources(index, endpoint)
+        except Exception as e:
+            self.logger.warning(f"Error revalidating cached resources: {str(e)}")
+
+    def _remember_resources(
         self,
-        approximate_neighbor_count: int
-    ) -> aiplatform.MatchingEngineIndex:
-        """Create a new Vector Search index"""
-        return aiplatform.MatchingEngineIndex.create_tree_ah_index(
-            display_name=self.index_display_name,
-            dimensions=self.dimension,
-            approximate_neighbors_count=approximate_neighbor_count,
+        index: aiplatform.MatchingEngineIndex,
+        endpoint: aiplatform.MatchingEngineIndexEndpoint
+    ):
+        if self.resource_cache is None:
+            return
+        self.resource_cache.put(self._resource_cache_key("index", self.index_display_name), index.resource_name)
+        self.resource_cache.put(self._resource_cache_key("endpoint", self.endpoint_display_name), endpoint.resource_name)
+
+    def _find_index(self) -> Optional[aiplatform.MatchingEngineIndex]:
+        """Look up the index by display name (filtered server-side)"""
+        existing_indexes = aiplatform.MatchingEngineIndex.list(
+            filter=f'display_name="{self.index_display_name}"',
+            project=self.project_id,
+            location=self.location
         )
+        return existing_indexes[0] if existing_indexes else None
 
-    def _get_or_create_endpoint(self) -> aiplatform.MatchingEngineIndexEndpoint:
-        """Get existing endpoint or create a new one"""
-        endpoint_display_name = f"{self.index_display_name}-endpoint"
-        
+    def _find_endpoint(self) -> Optional[aiplatform.MatchingEngineIndexEndpoint]:
+        """Look up the endpoint by display name (filtered server-side)"""
         existing_endpoints = aiplatform.MatchingEngineIndexEndpoint.list(
+            filter=f'display_name="{self.endpoint_display_name}"',
             project=self.project_id,
             location=self.location
         )
-        
-        endpoint = None
-        for existing_endpoint in existing_endpoints:
-            if existing_endpoint.display_name == endpoint_display_name:
-                endpoint = existing_endpoint
-                break
+        return existing_endpoints[0] if existing_endpoints else None
+
+    def _create_new_index(
+        self,
+        approximate_neighbor_count: int
+    ) -> aiplatform.MatchingEngineIndex:
+        """Create a new Vector Search index"""
+        with self.tracer.span("build_image_index.create_index"):
+            return aiplatform.MatchingEngineIndex.create_tree_ah_index(
+                display_name=self.index_display_name,
+                dimensions=self.dimension,
+                approximate_neighbors_count=approximate_neighbor_count,
+            )
+
+    def _get_or_create_endpoint(
+        self,
+        index: aiplatform.MatchingEngineIndex
+    ) -> aiplatform.MatchingEngineIndexEndpoint:
+        """Get existing endpoint or create a new one"""
+        endpoint = self._find_endpoint()
         
         if endpoint is None:
-            endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
-                display_name=endpoint_display_name,
-                public_endpoint_enabled=True
-            )
+            with self.tracer.span("build_image_index.create_endpoint"):
+                endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
+                    display_name=self.endpoint_display_name,
+                    public_endpoint_enabled=True
+                )
             
             # Deploy index to endpoint
-            endpoint.deploy_index(
-                index=self.index,
-                deployed_index_id=f"deployed_{self.index_display_name}"
-            )
+            with self.tracer.span("build_image_index.deploy"):
+                endpoint.deploy_index(
+                    index=index,
+                    deployed_index_id=f"deployed_{self.index_display_name}"
+                )
             
         return endpoint
 
     def generate_embedding(self, image_path: str) -> List[float]:
         """Generate embedding for a single image"""
         try:
-            image = Image.load_from_file(image_path)
-            embeddings = self.model.get_embeddings(
-                image=image,
-                dimension=self.dimension
-            )
-            return embeddings.image_embedding
+            image_bytes = self._read_image(image_path)
+            
+            content_hash = None
+            if self.embedding_cache is not None:
+                with self.tracer.span("embed.cache_lookup"):
+                    content_hash = EmbeddingCache.content_hash(image_bytes)
+                    cached = self.embedding_cache.get(content_hash, self.model_id)
+                if cached is not None:
+                    self.tracer.incr("embed.cache_hits")
+                    return cached.tolist()
+            
+            with self.tracer.span("embed.inference"):
+                embedding = self.embedding_client.embed(image_bytes)
+            self.tracer.incr("embed.images")
+            self.tracer.gauge("embed.concurrency_limit", self.embedding_client.concurrency.limit)
+            if content_hash is not None:
+                self.embedding_cache.put(content_hash, self.model_id, embedding)
+            return embedding
         except Exception as e:
             self.logger.error(f"Error generating embedding for {image_path}: {str(e)}")
             raise
 
-    def add_images(
+    def _read_image(self, image_path: str) -> bytes:
+        """Read an image from a local path or a gs:// URI"""
+        if not image_path.startswith("gs://"):
+            with open(image_path, "rb") as f:
+                return f.read()
+        bucket_name, _, blob_name = image_path[len("gs://"):].partition("/")
+        bucket = self.bucket if bucket_name == self.bucket_name else self.storage_client.bucket(bucket_name)
+        return bucket.blob(blob_name).download_as_bytes()
+
+    def _embed_remote(self, image_bytes: bytes) -> List[float]:
+        """Single call to the multimodal embedding model (rate limiting and retries live in embedding_client)"""
+        embeddings = self.model.get_embeddings(
+            image=Image(image_bytes=image_bytes),
+            dimension=self.dimension
+        )
+        return embeddings.image_embedding
+
+    def embed_text(self, text: str) -> List[float]:
+        """Embed a search string into the same space as the image embeddings"""
+        normalized = normalize_query(text)
+        if not normalized:
+            raise ValueError("Query text is empty")
+        
+        if self.text_cache is not None:
+            with self.tracer.span("embed.text_cache_lookup"):
+                cached = self.text_cache.get(normalized, self.model_id)
+            if cached is not None:
+                self.tracer.incr("embed.text_cache_hits")
+                return cached.tolist()
+        
+        with self.tracer.span("embed.text_inference"):
+            embedding = self.embedding_client.call(self._embed_text_remote, normalized)
+        self.tracer.incr("embed.texts")
+        if self.text_cache is not None:
+            self.text_cache.put(normalized, self.model_id, embedding)
+        return embedding
+
+    def _embed_text_remote(self, text: str) -> List[float]:
+        """Single text call to the multimodal embedding model"""
+        embeddings = self.model.get_embeddings(
+            contextual_text=text,
+            dimension=self.dimension
+        )
+        return embeddings.text_embedding
+
+    def precompute_text_embeddings(
         self,
-        image_paths: List[str],
-        metadata: List[Dict]
-    ):
-        """Add multiple images to the Vector Search index"""
-        embeddings = []
-        valid_metadata = []
+        texts: Sequence[str],
+        max_workers: Optional[int] = None,
+        write_batch_size: int = 500
+    ) -> Dict:
+        """Fill text_cache for many strings (e.g. pin titles and descriptions)
+
+        Texts are normalized and deduplicated, those already cached are skipped,
+        and the rest are embedded concurrently through embedding_client and written
+        to the cache write_batch_size at a time.
+        """
+        if self.text_cache is None:
+            raise ValueError("precompute_text_embeddings requires a text_cache")
         
-        for idx, path in enumerate(image_paths):
+        normalized = [text for text in map(normalize_query, texts) if text]
+        pending = self.text_cache.missing(normalized, self.model_id)
+        
+        def embed(text: str) -> Optional[List[float]]:
             try:
-                embedding = self.generate_embedding(path)
-                embeddings.append(embedding)
-                
-                current_metadata = metadata[idx].copy()
-                current_metadata.update({
-                    "image_path": path,
-                    "timestamp": time.time()
-                })
-                valid_metadata.append(current_metadata)
-                
+                return self.embedding_client.call(self._embed_text_remote, text)
             except Exception as e:
-                self.logger.error(f"Error processing image {path}: {str(e)}")
-                continue
+                self.logger.error(f"Error embedding text {text!r}: {str(e)}")
+                return None
+        
+        started = time.perf_counter()
+        embedded = 0
+        with ThreadPoolExecutor(max_workers=self._embed_workers(max_workers)) as pool:
+            for start in range(0, len(pending), write_batch_size):
+                chunk = pending[start:start + write_batch_size]
+                items = [
+                    (text, embedding)
+                    for text, embedding in zip(chunk, pool.map(embed, chunk))
+                    if embedding is not None
+                ]
+                self.text_cache.put_many(items, self.model_id)
+                embedded += len(items)
+                self.tracer.incr("embed.texts", len(items))
+        
+        summary = {
+            "texts": len(set(normalized)),
+            "cached": len(set(normalized)) - len(pending),
+            "embedded": embedded,
+            "failed": len(pending) - embedded,
+            "seconds": time.perf_counter() - started,
+        }
+        self.logger.info(
+            f"Precomputed {summary['embedded']} text embeddings "
+            f"({summary['cached']} already cached, {summary['failed']} failed) in {summary['seconds']:.1f}s"
+        )
+        return summary
 
+    def add_images(
+        self,
+        image_paths: List[str],
+        metadata: List[Dict],
+        max_workers: Optional[int] = None
+    ):
+        """Add multiple images to the Vector Search index, embedding up to max_workers images at once"""
+        embeddings, valid_metadata = self._embed_images(image_paths, metadata, max_workers)
         if embeddings:
+            self._upsert(embeddings, valid_metadata)
+
+    def bulk_index_images(
+        self,
+        image_paths: List[str],
+        metadata: List[Dict],
+        batch_size: int = 100,
+        embed_workers: Optional[int] = None,
+        max_pending_batches: int = 2
+    ) -> Dict:
+        """Bulk index images, embedding the next batches while the previous one upserts
+
+        A producer thread embeds batches (embed_workers images at a time, by default
+        as many as embedding_client may have in flight) into a
+        queue holding at most max_pending_batches; the calling thread upserts them.
+        A failed batch is logged and skipped. Returns the throughput summary.
+        """
+        ready: "queue.Queue" = queue.Queue(maxsize=max_pending_batches)
+        stop = threading.Event()
+        failures: List[Exception] = []
+        summary = {
+            "images": len(image_paths),
+            "embedded": 0,
+            "indexed": 0,
+            "failed_batches": 0,
+            "embed_seconds": 0.0,
+            "upsert_seconds": 0.0,
+            "upsert_wait_seconds": 0.0,
+        }
+        
+        def produce():
             try:
-                # Save embeddings
-                self.index_endpoint.upsert_embeddings(
-                    embeddings=embeddings,
-                    metadata_list=valid_metadata
-                )
-                
-                self.logger.info(f"Successfully added {len(embeddings)} images to index")
-                
+                with ThreadPoolExecutor(max_workers=self._embed_workers(embed_workers)) as pool:
+                    for batch_no, start in enumerate(range(0, len(image_paths), batch_size), 1):
+                        if stop.is_set():
+                            break
+                        started = time.perf_counter()
+                        with self.tracer.span("bulk_index.embed_batch"):
+                            batch = self._embed_images(
+                                image_paths[start:start + batch_size],
+                                metadata[start:start + batch_size],
+                                pool=pool
+                            )
+                        summary["embed_seconds"] += time.perf_counter() - started
+                        # キューが埋まっている間は待つ（upsert が追いつくまで先に進みすぎない）
+                        ready.put((batch_no, *batch))
             except Exception as e:
-                self.logger.error(f"Error adding embeddings to index: {str(e)}")
-                raise
+                failures.append(e)
+            finally:
+                ready.put(None)
+        
+        started = time.perf_counter()
+        producer = threading.Thread(target=produce, name="bulk-index-embed", daemon=True)
+        producer.start()
+        try:
+            while True:
+                waited = time.perf_counter()
+                item = ready.get()
+                summary["upsert_wait_seconds"] += time.perf_counter() - waited
+                if item is None:
+                    break
+                
+                batch_no, embeddings, valid_metadata = item
+                summary["embedded"] += len(embeddings)
+                if not embeddings:
+                    continue
+                self.logger.info(f"Upserting batch {batch_no} ({len(embeddings)} images)")
+                upsert_started = time.perf_counter()
+                try:
+                    with self.tracer.span("bulk_index.upsert"):
+                        self._upsert(embeddings, valid_metadata)
+                    summary["indexed"] += len(embeddings)
+                except Exception as e:
+                    self.logger.error(f"Error processing batch {batch_no}: {str(e)}")
+                    summary["failed_batches"] += 1
+                summary["upsert_seconds"] += time.perf_counter() - upsert_started
+        finally:
+            stop.set()
+            # 途中で止めた場合もキューを空けて producer を終わらせる
+            while producer.is_alive():
+                try:
+                    ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        
+        if failures:
+            raise failures[0]
+        
+        summary["elapsed_seconds"] = time.perf_counter() - started
+        summary["images_per_second"] = summary["indexed"] / summary["elapsed_seconds"] if summary["elapsed_seconds"] else 0.0
+        self.logger.info(
+            f"Indexed {summary['indexed']}/{summary['images']} images in {summary['elapsed_seconds']:.1f}s "
+            f"({summary['images_per_second']:.1f} images/sec; embedding {summary['embed_seconds']:.1f}s, "
+            f"upserting {summary['upsert_seconds']:.1f}s, waiting for embeddings {summary['upsert_wait_seconds']:.1f}s, "
+            f"{summary['failed_batches']} failed batches)"
+        )
+        return summary
 
-    def bulk_index_images(
+    def _embed_workers(self, max_workers: Optional[int]) -> int:
+        """Worker threads for embedding calls: enough to reach embedding_client's concurrency ceiling"""
+        return max_workers or self.embedding_client.concurrency.maximum
+
+    def _embed_images(
         self,
         image_paths: List[str],
         metadata: List[Dict],
-        batch_size: int = 100
-    ):
-        """Bulk index images with batching"""
-        for i in range(0, len(image_paths), batch_size):
-            batch_paths = image_paths[i:i + batch_size]
-            batch_metadata = metadata[i:i + batch_size]
-            
-            self.logger.info(f"Processing batch {i//batch_size + 1}")
+        max_workers: Optional[int] = None,
+        pool: Optional[ThreadPoolExecutor] = None
+    ) -> Tuple[List[List[float]], List[Dict]]:
+        """Embed images concurrently; returns embeddings and metadata for the ones that succeeded, in input order"""
+        def embed(path: str) -> Optional[List[float]]:
             try:
-                self.add_images(batch_paths, batch_metadata)
+                return self.generate_embedding(path)
             except Exception as e:
-                self.logger.error(f"Error processing batch {i//batch_size + 1}: {str(e)}")
+                self.logger.error(f"Error processing image {path}: {str(e)}")
+                return None
+        
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=self._embed_workers(max_workers)) as own_pool:
+                results = list(own_pool.map(embed, image_paths))
+        else:
+            results = list(pool.map(embed, image_paths))
+        
+        embeddings = []
+        valid_metadata = []
+        for path, item_metadata, embedding in zip(image_paths, metadata, results):
+            if embedding is None:
                 continue
+            embeddings.append(embedding)
+            current_metadata = item_metadata.copy()
+            current_metadata.update({
+                "image_path": path,
+                "timestamp": time.time()
+            })
+            valid_metadata.append(current_metadata)
+        return embeddings, valid_metadata
+
+    def _upsert(self, embeddings: List[List[float]], metadata: List[Dict]):
+        """Upsert embeddings into the index and drop cached search results"""
+        try:
+            # Save embeddings
+            self._require_endpoint()
+            with self.tracer.span("add_images.index_update"):
+                self.index_endpoint.upsert_embeddings(
+                    embeddings=embeddings,
+                    metadata_list=metadata
+                )
+            self.tracer.incr("add_images.images", len(embeddings))
+            
+            self.logger.info(f"Successfully added {len(embeddings)} images to index")
+            
+            if self.query_cache is not None:
+                self.query_cache.invalidate()
+            
+        except Exception as e:
+            self.logger.error(f"Error adding embeddings to index: {str(e)}")
+            raise
 
     def search_similar_images(
         self,
@@ -187,25 +533,146 @@ class VertexImageSearch:
     ) -> List[Dict]:
         """Search for similar images"""
         try:
-            query_embedding = self.generate_embedding(query_image_path)
+            content_hash = None
+            query_embedding = None
+            if self.query_cache is not None:
+                content_hash = EmbeddingCache.content_hash(self._read_image(query_image_path))
+                cached_results = self.query_cache.get_results(content_hash, num_neighbors, filter_expression)
+                if cached_results is not None:
+                    return cached_results
+                query_embedding = self.query_cache.get_embedding(content_hash)
+            
+            if query_embedding is None:
+                query_embedding = self.generate_embedding(query_image_path)
+                if content_hash is not None:
+                    self.query_cache.put_embedding(content_hash, query_embedding)
             
+            results = self._find_neighbors([query_embedding], num_neighbors, filter_expression)[0]
+            
+            if content_hash is not None:
+                self.query_cache.put_results(content_hash, num_neighbors, results, filter_expression)
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"Error searching similar images: {str(e)}")
+            raise
+
+    def search_by_text(
+        self,
+        query: str,
+        k: int = 10,
+        filter_expression: Optional[str] = None
+    ) -> List[Dict]:
+        """Search pin images matching a text query"""
+        try:
+            # 正規化後が同じクエリは結果も共有する（画像クエリのハッシュとは衝突しない）
+            cache_key = f"text:{normalize_query(query)}"
+            if self.query_cache is not None:
+                cached_results = self.query_cache.get_results(cache_key, k, filter_expression)
+                if cached_results is not None:
+                    return cached_results
+            
+            with self.tracer.span("search.embed"):
+                query_embedding = self.embed_text(query)
+            results = self._find_neighbors([query_embedding], k, filter_expression)[0]
+            
+            if self.query_cache is not None:
+                self.query_cache.put_results(cache_key, k, results, filter_expression)
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"Error searching by text {query!r}: {str(e)}")
+            raise
+
+    def search_similar_images_batch(
+        self,
+        queries: List[Union[str, Sequence[float]]],
+        num_neighbors: int = 5,
+        filter_expression: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        max_queries_per_request: int = 64,
+        max_request_bytes: int = 4 * 1024 * 1024
+    ) -> List[List[Dict]]:
+        """Search similar images for many query image paths or precomputed vectors
+
+        Image paths are embedded in parallel, then the queries are sent to
+        find_neighbors in chunks capped by count and by approximate payload size
+        (4 bytes per float). Results are returned in the same order as queries.
+        """
+        try:
+            query_embeddings: List[Optional[List[float]]] = [
+                None if isinstance(query, str) else list(query) for query in queries
+            ]
+            image_rows = [row for row, query in enumerate(queries) if isinstance(query, str)]
+            if image_rows:
+                with ThreadPoolExecutor(max_workers=self._embed_workers(max_workers)) as pool:
+                    embedded = pool.map(lambda row: self.generate_embedding(queries[row]), image_rows)
+                    for row, embedding in zip(image_rows, embedded):
+                        query_embeddings[row] = embedding
+            
+            chunk_size = max(1, min(max_queries_per_request, max_request_bytes // (self.dimension * 4)))
+            results = []
+            for start in range(0, len(query_embeddings), chunk_size):
+                results.extend(self._find_neighbors(
+                    query_embeddings[start:start + chunk_size],
+                    num_neighbors,
+                    filter_expression
+                ))
+            
+            self.logger.info(
+                f"Searched {len(queries)} queries in {-(-len(queries) // chunk_size)} requests"
+            )
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"Error searching similar images in batch: {str(e)}")
+            raise
+
+    def _require_endpoint(self):
+        if self.index_endpoint is None:
+            raise RuntimeError("Index endpoint was not resolved (created with resolve_resources=False)")
+
+    def _find_neighbors(
+        self,
+        query_embeddings: List[List[float]],
+        num_neighbors: int,
+        filter_expression: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """Run one multi-query neighbour search against the endpoint or local backend"""
+        if self.search_backend is not None:
+            if filter_expression:
+                raise ValueError("filter_expression is not supported by the local search backend")
+            with self.tracer.span("search.query"):
+                results = self.search_backend.search_batch(query_embeddings, num_neighbors)
+            return [
+                [
+                    {
+                        "metadata": None,
+                        "distance": neighbor["distance"],
+                        "id": neighbor["uri"]
+                    }
+                    for neighbor in neighbors
+                ]
+                for neighbors in results
+            ]
+        
+        self._require_endpoint()
+        with self.tracer.span("search.query"):
             search_result = self.index_endpoint.find_neighbors(
                 deployed_index_id=f"deployed_{self.index_display_name}",
-                queries=[query_embedding],
+                queries=query_embeddings,
                 num_neighbors=num_neighbors,
                 filter_expression=filter_expression
             )
-            
-            results = []
-            for neighbor in search_result[0]:
-                results.append({
+        
+        return [
+            [
+                {
                     "metadata": neighbor.metadata,
                     "distance": neighbor.distance,
                     "id": neighbor.id
-                })
-                
-            return results
-            
-        except Exception as e:
-            self.logger.error(f"Error searching similar images: {str(e)}")
-            raise
+                }
+                for neighbor in neighbors
+            ]
+            for neighbors in search_result
+        ]
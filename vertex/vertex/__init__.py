@@ -1,7 +1,45 @@
-from .demo import ImageSearchDemo
-from .VertexImageSearch import VertexImageSearch
+import importlib
 
 __version__ = "0.1.0"  # パッケージのバージョン情報
 
+# 公開クラス → 定義しているモジュール
+# TensorFlow や GCP SDK を読み込むモジュールもあるので、クラスが最初に使われたときに import する
+# （デコード用のワーカープロセスが vertex.decoder だけを読み込むときに巻き込まないように）
+_EXPORTS = {
+    "ImageSearchDemo": ".demo",
+    "VertexImageSearch": ".VertexImageSearch",
+    "StreamingIngestPipeline": ".pipeline",
+    "LocalBucket": ".storage",
+    "LocalVectorStore": ".vector_store",
+    "IVFPQIndex": ".ivf_pq",
+    "EmbeddingCache": ".embedding_cache",
+    "QueryCache": ".query_cache",
+    "ConcurrentUploader": ".uploader",
+    "ShardedEmbeddingWriter": ".embedding_writer",
+    "ModelManager": ".model_manager",
+    "SimilarImageSearchService": ".service",
+    "IngestManifest": ".ingest_manifest",
+    "ParallelImageDecoder": ".decoder",
+    "Tracer": ".tracing",
+    "ThumbnailCache": ".thumbnail_cache",
+    "ResourceCache": ".resource_cache",
+    "EmbeddingClient": ".embedding_client",
+    "TextEmbeddingCache": ".text_embedding_cache",
+}
+
 # from vertex import * でインポートされるクラスを指定
-__all__ = ["ImageSearchDemo", "VertexImageSearch"]
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # 2回目以降は通常の属性として見つかるようにする
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,256 @@
+import contextlib
+import io
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
+# 合成画像のサイズ（名前 → (幅, 高さ)）とフォーマット（拡張子 → Pillow のフォーマット名）
+IMAGE_SIZES = {
+    "small": (320, 240),
+    "medium": (1024, 768),
+    "large": (4032, 3024),
+}
+IMAGE_FORMATS = {
+    "jpg": "JPEG",
+    "png": "PNG",
+    "gif": "GIF",
+}
+
+
+def synthetic_photo(width, height, index, rng):
+    """
+    Pixels of one synthetic photo: a colour gradient shifted by index, plus noise
+
+    Args:
+        width (int): Width
+        height (int): Height
+        index (int): Image number (shifts the gradient so images differ)
+        rng (np.random.Generator): Source of the noise
+
+    Returns:
+        np.ndarray: uint8 array of shape (height, width, 3)
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        (x / width * 255 + index * 17) % 256,
+        (y / height * 255 + index * 29) % 256,
+        ((x + y) / (width + height) * 255 + index * 41) % 256,
+    ], axis=-1)
+    return np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+
+
+def make_synthetic_images(output_dir, sizes=("small", "medium", "large"), formats=("jpg", "png", "gif"), count=4, seed=0):
+    """
+    Write synthetic photos for every size/format combination
+
+    Args:
+        output_dir (str): Directory the images are written to
+        sizes (tuple): Keys of IMAGE_SIZES
+        formats (tuple): Keys of IMAGE_FORMATS
+        count (int): Images per size/format combination
+        seed (int): Random seed
+
+    Returns:
+        list: Paths of the written images
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for size in sizes:
+        width, height = IMAGE_SIZES[size]
+        for i in range(count):
+            image = Image.fromarray(synthetic_photo(width, height, i, rng))
+            for extension in formats:
+                path = os.path.join(output_dir, f"{size}_{i:03d}.{extension}")
+                image.save(path, IMAGE_FORMATS[extension])
+                paths.append(path)
+    return paths
+
+
+def make_synthetic_jpegs(count, width, height, quality=90, seed=0):
+    """
+    Encode synthetic photos as in-memory JPEGs
+
+    Args:
+        count (int): Number of images
+        width (int): Width
+        height (int): Height
+        quality (int): JPEG quality
+        seed (int): Random seed
+
+    Returns:
+        list: JPEG bytes
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(synthetic_photo(width, height, i, rng)).save(buffer, "JPEG", quality=quality)
+        images.append(buffer.getvalue())
+    return images
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # /proc がない環境（macOS など）ではプロセス全体の最大値で代用する
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ステージ実行中の RSS を別スレッドでサンプリングしてピークを記録する
+class RssSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+
+# 1ステージ分の計測（呼び出しごとのレイテンシ、処理枚数、ピーク RSS）
+class StageTimer:
+    def __init__(self, name):
+        """
+        Collect per-call latencies and throughput for one benchmark stage
+
+        Args:
+            name (str): Stage name used in the report
+        """
+        self.name = name
+        self.latencies = []
+        self.items = 0
+        self.elapsed = 0.0
+        self._sampler = RssSampler()
+        self._started = None
+
+    def __enter__(self):
+        self._sampler.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._started
+        self._sampler.__exit__(exc_type, exc, tb)
+
+    @contextlib.contextmanager
+    def call(self, items=1):
+        """Time one call that processes `items` images"""
+        started = time.perf_counter()
+        yield
+        self.latencies.append(time.perf_counter() - started)
+        self.items += items
+
+    def summary(self):
+        """
+        Returns:
+            dict: images_per_sec, p50/p95/p99 call latency in ms, calls, items, elapsed_sec, peak_rss_mb
+        """
+        latencies_ms = np.asarray(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) else (0.0, 0.0, 0.0)
+        busy = float(np.sum(self.latencies))
+        return {
+            "images_per_sec": self.items / busy if busy else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "calls": len(self.latencies),
+            "items": self.items,
+            "elapsed_sec": self.elapsed,
+            "peak_rss_mb": self._sampler.peak / 2 ** 20,
+        }
+
+
+# ベンチマーク・テスト用のローカルな偽のエンべディング API。遅延と、クォータ・同時実行数超過時のスロットリングを再現する
+class FakeEmbeddingModel:
+    def __init__(
+        self,
+        dimension=512,
+        latency=0.05,
+        latency_jitter=0.02,
+        quota_per_second=None,
+        max_concurrency=None,
+        throttle_rate=0.0,
+        seed=0
+    ):
+        """
+        Local stand-in for the multimodal embedding endpoint
+
+        Args:
+            dimension (int): Length of the returned vectors
+            latency (float): Mean seconds per call
+            latency_jitter (float): Uniform +/- jitter added to latency
+            quota_per_second (float): Calls allowed per rolling second before ResourceExhausted
+            max_concurrency (int): Calls allowed in flight before ResourceExhausted
+            throttle_rate (float): Probability of a spurious ResourceExhausted on any call
+            seed (int): Random seed
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.quota_per_second = quota_per_second
+        self.max_concurrency = max_concurrency
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self.peak_concurrency = 0
+
+        self._random = random.Random(seed)
+        self._recent_calls = []
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed(self, image_bytes):
+        """Return a deterministic pseudo-embedding for image_bytes after a simulated delay"""
+        with self._lock:
+            now = time.monotonic()
+            self._recent_calls = [t for t in self._recent_calls if now - t < 1.0]
+            self.calls += 1
+            throttled = (
+                (self.quota_per_second is not None and len(self._recent_calls) >= self.quota_per_second)
+                or (self.max_concurrency is not None and self._in_flight >= self.max_concurrency)
+                or self._random.random() < self.throttle_rate
+            )
+            if throttled:
+                self.throttled += 1
+            else:
+                self._recent_calls.append(now)
+                self._in_flight += 1
+                self.peak_concurrency = max(self.peak_concurrency, self._in_flight)
+            delay = max(0.0, self.latency + self._random.uniform(-self.latency_jitter, self.latency_jitter))
+        if throttled:
+            raise google_exceptions.ResourceExhausted("Quota exceeded for multimodalembedding")
+
+        try:
+            time.sleep(delay)
+            seed = int.from_bytes(image_bytes[:8].ljust(8, b"\0"), "little") ^ len(image_bytes)
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            return (vector / np.linalg.norm(vector)).tolist()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
@@ -0,0 +1,19 @@
+# TensorFlow などに依存しない共有定数
+# デコード用のワーカープロセスからも読み込むので、ここでは標準ライブラリ以外を import しない
+
+# モデルの入力サイズと出力次元
+IMAGE_SIZE = 224
+EMBEDDING_DIM = 1280
+
+# JPEG の縮小デコードで使える倍率（libjpeg の scaled IDCT）
+JPEG_DECODE_RATIOS = (1, 2, 4, 8)
+
+# 前処理（デコード・リサイズ）の版。変えると同じ画像でもエンべディングが変わるので、
+# エンべディングキャッシュのキー（model_id）に含め、既存のインデックスは作り直す
+# 2: JPEG を ISLOW（INTEGER_ACCURATE）の IDCT でデコードする（1 は TF 既定の INTEGER_FAST）
+PREPROCESS_VERSION = 2
+
+
+def preprocess_id(reduced=False):
+    """Tag of the preprocessing variant, used in model_id and cache keys (e.g. "pp2" or "pp2-reduced")"""
+    return f"pp{PREPROCESS_VERSION}-reduced" if reduced else f"pp{PREPROCESS_VERSION}"
@@ -0,0 +1,193 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from .constants import IMAGE_SIZE
+
+# ファイル先頭のシグネチャ（マジックバイト）→ フォーマット名
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+
+# 拡張子ではなく実際のバイト列からフォーマットを判定する
+def sniff_format(data):
+    """
+    Detect the image format from the file signature
+
+    Args:
+        data (bytes): Encoded image data (only the first 12 bytes are inspected)
+
+    Returns:
+        str | None: "jpeg", "png", "gif", "webp", or None if the format is not supported
+    """
+    for signature, image_format in _SIGNATURES:
+        if data.startswith(signature):
+            return image_format
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _interpolation_weights(in_size, out_size):
+    # tf.image.resize（half-pixel centers）と同じ float32 の計算で、出力画素ごとの参照位置と重みを求める
+    coords = (np.arange(out_size, dtype=np.float32) + np.float32(0.5)) * np.float32(in_size / out_size) - np.float32(0.5)
+    floor = np.floor(coords)
+    lower = np.maximum(floor, 0).astype(np.intp)
+    upper = np.minimum(np.ceil(coords), in_size - 1).astype(np.intp)
+    return lower, upper, coords - floor
+
+
+def resize_bilinear(image, size):
+    """
+    Bilinear resize matching tf.image.resize(method="bilinear", antialias=False)
+
+    Pillow's BILINEAR filter widens its kernel when downscaling (antialiasing), which gives
+    different pixels from the TensorFlow path; this reproduces TensorFlow's computation instead.
+
+    Args:
+        image (np.ndarray): Array of shape (height, width, channels)
+        size (tuple): Output (height, width)
+
+    Returns:
+        np.ndarray: float32 array of shape (size[0], size[1], channels)
+    """
+    image = np.asarray(image, dtype=np.float32)
+    y_lower, y_upper, y_lerp = _interpolation_weights(image.shape[0], size[0])
+    x_lower, x_upper, x_lerp = _interpolation_weights(image.shape[1], size[1])
+    x_lerp = x_lerp[None, :, None]
+
+    top_rows, bottom_rows = image[y_lower], image[y_upper]
+    top = top_rows[:, x_lower] + (top_rows[:, x_upper] - top_rows[:, x_lower]) * x_lerp
+    bottom = bottom_rows[:, x_lower] + (bottom_rows[:, x_upper] - bottom_rows[:, x_lower]) * x_lerp
+    return top + (bottom - top) * y_lerp[:, None, None]
+
+
+# 画像バイト列 → モデル入力と同じ (IMAGE_SIZE, IMAGE_SIZE, 3) の float32 配列
+# preprocess.decode_and_resize と同じ値になるように、デコード・アルファの扱い・リサイズを TF に合わせている
+# （同じ画像が経路によって違うエンべディングになり、インデックスやキャッシュに混ざるのを防ぐ）
+def decode_image(data, reduced=False):
+    """
+    Decode JPEG/PNG/GIF/WebP bytes into a model-ready array
+
+    GIFs and animated WebPs use their first frame. As with tf.io.decode_image(channels=3),
+    alpha channels are dropped, and transparent GIF pixels are black.
+
+    Args:
+        data (bytes): Encoded image data
+        reduced (bool): Decode JPEGs at the smallest 1/2, 1/4 or 1/8 DCT scale that is still
+            at least IMAGE_SIZE on both sides (Pillow draft mode) before the final resize.
+            Must match the setting the index was built with (see constants.preprocess_id)
+
+    Returns:
+        np.ndarray: float32 array of shape (IMAGE_SIZE, IMAGE_SIZE, 3) scaled to [0, 1]
+    """
+    image_format = sniff_format(data)
+    if image_format is None:
+        raise ValueError("Unsupported image format")
+
+    with Image.open(io.BytesIO(data), formats=[image_format.upper()]) as img:
+        if image_format == "jpeg" and reduced:
+            # 縮小スケールで IDCT するので、数百万画素の写真でもフル解像度で展開しない
+            # （選ばれる倍率は preprocess._decode_jpeg_reduced と同じ）
+            img.draft("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+        if image_format in ("gif", "webp"):
+            img.seek(0)
+        if image_format == "gif" and "transparency" in img.info:
+            rgba = np.asarray(img.convert("RGBA"))
+            pixels = np.where(rgba[..., 3:] == 0, 0, rgba[..., :3])
+        else:
+            pixels = np.asarray(img.convert("RGB"))
+    return resize_bilinear(pixels, (IMAGE_SIZE, IMAGE_SIZE)) / np.float32(255.0)
+
+
+def _decode_into(shm_name, shape, row, source, reduced):
+    # ワーカープロセス側: デコード結果を共有メモリの row 行目に直接書き込む
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                source = f.read()
+        batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        batch[row] = decode_image(source, reduced)
+        del batch
+    finally:
+        shm.close()
+
+
+# CPU バウンドなデコード・リサイズを全コアに分散するプロセスプール
+# 結果は pickle せず共有メモリ経由で受け取る
+class ParallelImageDecoder:
+    def __init__(self, max_workers=None, start_method="spawn", reduced=False):
+        """
+        Decode images in worker processes into a shared-memory batch buffer
+
+        Args:
+            max_workers (int): Worker processes (defaults to the number of CPUs)
+            start_method (str): multiprocessing start method; "spawn" is safe alongside TensorFlow threads
+            reduced (bool): Use reduced-resolution JPEG decoding (see decode_image)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.reduced = reduced
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(start_method)
+        )
+        self._shm = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def decode_batch(self, sources):
+        """
+        Decode a batch of images in parallel
+
+        Args:
+            sources (list): Encoded image bytes or file paths (paths are read by the workers)
+
+        Returns:
+            np.ndarray: float32 array of shape (len(sources), IMAGE_SIZE, IMAGE_SIZE, 3)
+        """
+        shape = (len(sources), IMAGE_SIZE, IMAGE_SIZE, 3)
+        if not sources:
+            return np.empty(shape, dtype=np.float32)
+        with self._lock:
+            shm = self._buffer(int(np.prod(shape)) * 4)
+            futures = [
+                self._pool.submit(_decode_into, shm.name, shape, row, source, self.reduced)
+                for row, source in enumerate(sources)
+            ]
+            for future in futures:
+                future.result()
+            # 共有バッファは次のバッチで再利用するのでコピーして返す
+            return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+
+    def close(self):
+        self._pool.shutdown()
+        with self._lock:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+
+    def _buffer(self, size):
+        # バッチ最大サイズの共有メモリを1つだけ確保して使い回す
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        return self._shm
@@ -1,19 +1,30 @@
 from google.cloud import storage
 from google.cloud import aiplatform
+from google.api_core import exceptions as google_exceptions
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import shutil
 from PIL import Image
+import numpy as np
 import tensorflow as tf
-import tensorflow_hub as hub
 import uuid
 from datetime import datetime
-import json
-from prisma import Prisma
+import time
 import traceback
+from .constants import EMBEDDING_DIM, preprocess_id
+from .preprocess import decode_and_resize
+from .pipeline import StreamingIngestPipeline
+from .embedding_cache import EmbeddingCache
+from .uploader import ConcurrentUploader, build_upload_manifest
+from .embedding_writer import ShardedEmbeddingWriter
+from .model_manager import ModelManager
+from .tracing import Tracer
 
 # 検索時の流れは以下の通り
 # 検索画像 → 特徴抽出 → ベクトル化 → インデックスで類似ベクトル検索 → 類似画像を返す
 class ImageSearchDemo:
-    def __init__(self, project_id, location, bucket_name, index_display_name):
+    def __init__(self, project_id, location, bucket_name, index_display_name, search_backend=None, embedding_cache=None, query_cache=None, bucket=None, model_manager=None, ingest_manifest=None, image_decoder=None, tracer=None, thumbnail_cache=None, rerank_store=None, rerank_factor=4, offline=False, reduced_decode=False):
         """
         Initialize the Image Search Demo
         
@@ -22,39 +33,95 @@ class ImageSearchDemo:
             location (str): Region for Vertex AI resources
             bucket_name (str): Cloud Storage bucket name
             index_display_name (str): Name for the Vector Search index
+            search_backend: Optional local backend (e.g. LocalVectorStore) used instead of the endpoint
+            embedding_cache (EmbeddingCache): Optional persistent cache consulted before inference
+            query_cache (QueryCache): Optional in-memory cache of query embeddings and neighbour lists
+            bucket: Optional bucket object to use instead of Cloud Storage (e.g. storage.LocalBucket)
+            model_manager (ModelManager): Embedding model loader (defaults to the cached EfficientNetV2 model)
+            ingest_manifest (IngestManifest): Optional record of already-embedded blobs; add_images skips them
+            image_decoder (ParallelImageDecoder): Optional process pool that decodes batches across all cores
+                (non-streaming ingest and queries; streaming ingest decodes in its tf.data pipeline)
+            tracer (Tracer): Optional span timer for the add_images / build_image_index / search stages
+            thumbnail_cache (ThumbnailCache): Optional local cache of resized result images, used by
+                download_result_images(thumbnails=True)
+            rerank_store (LocalVectorStore): Optional local copy of the indexed vectors; searches over-fetch
+                candidates and re-score them exactly against it
+            rerank_factor (int): Candidates fetched per requested neighbour when re-ranking
+                (higher improves recall at the cost of latency; 1 disables re-ranking)
+            offline (bool): Run without Vertex AI (benchmarks, local development): skip aiplatform.init,
+                the Prisma client and the endpoint connection, and have add_images load new embeddings into search_backend with import_from_bucket
+                instead of updating the Vertex index. Requires search_backend.
+            reduced_decode (bool): Decode JPEGs at a reduced DCT scale (faster ingest). This changes the
+                embeddings slightly and is part of model_id, so the index must be rebuilt after switching.
+                image_decoder must use the same setting.
         """
+        if offline and search_backend is None:
+            raise ValueError("offline=True requires a search_backend")
+        if image_decoder is not None and image_decoder.reduced != reduced_decode:
+            raise ValueError("image_decoder.reduced must match reduced_decode")
+
         self.project_id = project_id
         self.location = location
         self.bucket_name = bucket_name
         self.index_display_name = index_display_name
+        self.search_backend = search_backend
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache
+        self.ingest_manifest = ingest_manifest
+        self.image_decoder = image_decoder
+        # 計測しないときは何もしないトレーサを使う（計測箇所はそのまま残す）
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.thumbnail_cache = thumbnail_cache
+        self.rerank_store = rerank_store
+        self.rerank_factor = rerank_factor
+        self.offline = offline
+        self.reduced_decode = reduced_decode
         
         # Initialize Google Cloud clients
-        self.storage_client = storage.Client(project=project_id)
-        self.bucket = self.storage_client.bucket(bucket_name)
+        if bucket is not None:
+            self.bucket = bucket
+        else:
+            self.storage_client = storage.Client(project=project_id)
+            self.bucket = self.storage_client.bucket(bucket_name)
         
         # Initialize Vertex AI
-        aiplatform.init(project=project_id, location=location)
+        # オフラインで動かすときは Vertex AI も DB も使わないので初期化しない
+        # （location="local" のようなリージョン名でも動かせるように）
+        self.prisma = None
+        if not offline:
+            aiplatform.init(project=project_id, location=location)
 
-        # Initialize Prisma client
-        self.prisma = Prisma() 
+            # Initialize Prisma client
+            from prisma import Prisma
+            self.prisma = Prisma()
+        
+        # add_images でイベントループを止めないための実行環境
+        # GCS などの I/O はスレッドプール、推論は専用の1スレッドで実行する
+        self.io_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gcs-io")
+        self.inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
         
         # Load TensorFlow Hub model for image embeddings
-        self.model = hub.load('https://tfhub.dev/google/imagenet/efficientnet_v2_imagenet1k_b0/feature_vector/2') # ここの処理が不安定すぎるので要改善。
-        print("Model loaded successfully.")
+        # ローカルの SavedModel キャッシュから、最初の推論時に読み込む（毎回 tfhub.dev には取りに行かない）
+        self.model = model_manager if model_manager is not None else ModelManager()
+        # 前処理の版・縮小デコードの有無も含める（前処理が違うエンべディングをキャッシュで混ぜない）
+        self.model_id = f"{self.model.handle}:{EMBEDDING_DIM}:{preprocess_id(reduced_decode)}"
         
         # Initialize endpoint
-        try:
-            # 既存のエンドポイントを取得
-            self.endpoint = aiplatform.MatchingEngineIndexEndpoint(
-                index_endpoint_name=f"projects/{project_id}/locations/{location}/indexEndpoints/5566554692546199552"
-            )
-            print("Successfully connected to existing endpoint")
-        except Exception as e:
-            print(f"Error connecting to endpoint: {str(e)}")
-            raise
+        # オフラインで動かすときはエンドポイントに接続しない
+        self.endpoint = None
+        if not offline:
+            try:
+                # 既存のエンドポイントを取得
+                self.endpoint = aiplatform.MatchingEngineIndexEndpoint(
+                    index_endpoint_name=f"projects/{project_id}/locations/{location}/indexEndpoints/5566554692546199552"
+                )
+                print("Successfully connected to existing endpoint")
+            except Exception as e:
+                print(f"Error connecting to endpoint: {str(e)}")
+                raise
         
     # Google Storageに画像をアップロード
-    def upload_images_to_gcs(self, local_dir, user_type='admin', user_id=None):
+    def upload_images_to_gcs(self, local_dir, user_type='admin', user_id=None, max_workers=8):
         """
         Upload images from local directory to Cloud Storage with original filenames
         
@@ -62,48 +129,50 @@ class ImageSearchDemo:
             local_dir (str): Path to local directory containing images
             user_type (str): 'admin' or 'user'
             user_id (str): User ID for non-admin uploads
+            max_workers (int): Number of concurrent uploads
             
         Returns:
-            list: List of GCS URIs for uploaded images
+            list: List of GCS URIs for uploaded images (including ones already up to date)
         """
-        uploaded_uris = []
-        
-        # Determine base directory based on user type
-        if user_type == 'admin':
-            base_dir = "images/admin/"
-        else:
-            if not user_id:
-                raise ValueError("user_id is required for non-admin uploads")
-            base_dir = f"images/users/{user_id}/"
-        
-        # Create base directory if it doesn't exist
-        if not any(blob.name.startswith(base_dir) for blob in self.bucket.list_blobs(prefix=base_dir)):
-            blob = self.bucket.blob(base_dir)
-            blob.upload_from_string('')
+        base_dir = self._base_dir(user_type, user_id)
         
+        # GCS のディレクトリは名前の接頭辞にすぎないので、プレースホルダ作成のための全件リストは行わない
         print(f"Scanning directory: {local_dir}")
+        manifest = build_upload_manifest(local_dir, base_dir)
         
-        # Upload each image file
-        for filename in os.listdir(local_dir):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                local_path = os.path.join(local_dir, filename)
-                
-                # Use original filename
-                destination_blob_name = f"{base_dir}{filename}"
-                blob = self.bucket.blob(destination_blob_name)
-                
-                print(f"Uploading {filename} to GCS...")
-                try:
-                    blob.upload_from_filename(local_path)
-                    gcs_uri = f"gs://{self.bucket_name}/{destination_blob_name}"
-                    uploaded_uris.append(gcs_uri)
-                    print(f"Uploaded {filename} to {gcs_uri}")
-                except Exception as e:
-                    print(f"Error uploading {filename}: {str(e)}")
+        uploaded_uris = [
+            f"gs://{self.bucket_name}/{result['blob_name']}"
+            for result in self._upload_with_report(manifest, max_workers)
+        ]
         
         print(f"Successfully uploaded {len(uploaded_uris)} images")
         return uploaded_uris
 
+    def _upload_with_report(self, manifest, max_workers=8):
+        # アップロードして結果を表示し、成功（またはスキップ）した分の結果だけを返す
+        uploader = ConcurrentUploader(self.bucket, max_workers=max_workers)
+        succeeded = []
+        for result in uploader.upload(manifest):
+            filename = os.path.basename(result["local_path"])
+            gcs_uri = f"gs://{self.bucket_name}/{result['blob_name']}"
+            if result["status"] == "failed":
+                print(f"Error uploading {filename}: {result['error']}")
+                continue
+            if result["status"] == "skipped":
+                print(f"Skipped {filename} (already up to date at {gcs_uri})")
+            else:
+                print(f"Uploaded {filename} to {gcs_uri}")
+            succeeded.append(result)
+        return succeeded
+
+    def _base_dir(self, user_type, user_id):
+        # Determine base directory based on user type
+        if user_type == 'admin':
+            return "images/admin/"
+        if not user_id:
+            raise ValueError("user_id is required for non-admin uploads")
+        return f"images/users/{user_id}/"
+
     # インデックス構築 & インデックスに画像をアップロード
     # デプロイ完了までに30分ほどかかる
     # 初回インデックス作成時のみ実行
@@ -129,30 +198,32 @@ class ImageSearchDemo:
             print("既存のエンドポイントが見つかりませんでした。新規作成を開始します。")
         
             print("Creating index...")
-            index = aiplatform.MatchingEngineIndex.create_tree_ah_index(
-                display_name=self.index_display_name,
-                description="Image Embeddings Index",
-                contents_delta_uri=image_uris,
-                dimensions=1280,
-                shard_size="SHARD_SIZE_SMALL",
-                approximate_neighbors_count=50,
-                index_update_method="batch_update",
-                distance_measure_type="DOT_PRODUCT_DISTANCE"
-            )
-            
-            print(f"Created index: {index.name}")
-            
-            # インデックスが完全に作成されるまで待つ
-            index.wait()
+            with self.tracer.span("build_image_index.create_index"):
+                index = aiplatform.MatchingEngineIndex.create_tree_ah_index(
+                    display_name=self.index_display_name,
+                    description="Image Embeddings Index",
+                    contents_delta_uri=image_uris,
+                    dimensions=1280,
+                    shard_size="SHARD_SIZE_SMALL",
+                    approximate_neighbors_count=50,
+                    index_update_method="batch_update",
+                    distance_measure_type="DOT_PRODUCT_DISTANCE"
+                )
+                
+                print(f"Created index: {index.name}")
+                
+                # インデックスが完全に作成されるまで待つ
+                index.wait()
             
             print("Creating and deploying index endpoint...")
-            index_endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
-                display_name=f"{self.index_display_name}_endpoint",
-                public_endpoint_enabled=True
-            )
-            
-            # エンドポイントが完全に作成されるまで待つ
-            index_endpoint.wait()
+            with self.tracer.span("build_image_index.create_endpoint"):
+                index_endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
+                    display_name=f"{self.index_display_name}_endpoint",
+                    public_endpoint_enabled=True
+                )
+                
+                # エンドポイントが完全に作成されるまで待つ
+                index_endpoint.wait()
             
             # 一意のデプロイIDを生成
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -160,30 +231,32 @@ class ImageSearchDemo:
             deployed_index_id = f"{self.index_display_name}_deployed_{timestamp}_{unique_id}"
             
             print("Creating and deploying index endpoint...")
-            index_endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
-                display_name=f"{self.index_display_name}_endpoint_{timestamp}",
-                public_endpoint_enabled=True
-            )
-            
-            index_endpoint.wait()
+            with self.tracer.span("build_image_index.create_endpoint"):
+                index_endpoint = aiplatform.MatchingEngineIndexEndpoint.create(
+                    display_name=f"{self.index_display_name}_endpoint_{timestamp}",
+                    public_endpoint_enabled=True
+                )
+                
+                index_endpoint.wait()
             
             print(f"Deploying index with ID: {deployed_index_id}")
-            deploy_operation = index_endpoint.deploy_index(
-                index=index,
-                deployed_index_id=deployed_index_id,  # 一意のIDを使用
-                machine_type="e2-standard-2",
-                min_replica_count=1,
-                max_replica_count=1
-            )
-            
-            deploy_operation.result()
+            with self.tracer.span("build_image_index.deploy"):
+                deploy_operation = index_endpoint.deploy_index(
+                    index=index,
+                    deployed_index_id=deployed_index_id,  # 一意のIDを使用
+                    machine_type="e2-standard-2",
+                    min_replica_count=1,
+                    max_replica_count=1
+                )
+                
+                deploy_operation.result()
             
             print("Index deployed successfully")
             self.endpoint = index_endpoint
             return index
 
     # 既存のインデックスに新しい画像を追加
-    async def add_images(self, image_dir, user_type='admin', user_id=None):
+    async def add_images(self, image_dir, user_type='admin', user_id=None, batch_size=32, streaming=False, write_sidecar=False, sidecar_dtype='float32', in_memory_limit=16 * 1024 * 1024, max_concurrent_uploads=8):
         """
         画像をCloud Storageにアップロードし、インデックスに追加する
         
@@ -191,16 +264,84 @@ class ImageSearchDemo:
             image_dir (str): 画像が含まれているディレクトリパス
             user_type (str): 'admin' or 'user'
             user_id (str): User ID for non-admin uploads
+            batch_size (int): 1回のモデル呼び出しでまとめて推論する画像数
+            streaming (bool): GCS から読み直しながら取り込むかどうか（デコードは tf.data の並列 map で行うので image_decoder は使わない。エンべディングキャッシュとマニフェストは通常の経路と同じく使う）
+            write_sidecar (bool): シャードと同じ内容の .npy も embeddings_npy/ に書き出すかどうか
+            sidecar_dtype (str): サイドカーの保存形式（'float32', 'float16', 'int8'）
+            in_memory_limit (int): これより大きい画像はメモリに載せずファイルから直接アップロード・推論する
+            max_concurrent_uploads (int): 同時に実行するアップロード数
         """
         print("Adding new images to existing index...")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
         
-        # 1. 画像をCloud Storageにアップロード
-        uploaded_uris = self.upload_images_to_gcs(image_dir, user_type, user_id)
+        # 1. アップロード対象の画像を列挙
+        with self.tracer.span("add_images.scan"):
+            manifest = await loop.run_in_executor(
+                self.io_executor, build_upload_manifest, image_dir, self._base_dir(user_type, user_id)
+            )
         
-        if not uploaded_uris:
+        if not manifest:
             print("No images found to upload")
             return
-            
+        
+        # 前回取り込んだときからサイズも更新日時も変わっていないファイルは読まずにスキップ
+        if self.ingest_manifest is not None:
+            total = len(manifest)
+            with self.tracer.span("add_images.scan"):
+                manifest = await loop.run_in_executor(self.io_executor, self._filter_unchanged_sources, manifest)
+            print(f"{total - len(manifest)} images unchanged since the last ingest, {len(manifest)} to check")
+            if not manifest:
+                print("No new images to ingest")
+                return
+        
+        # 2. 画像をCloud Storageにアップロードし、埋め込みベクトルを生成（月単位でグループ化し、実行ごとのシャードにまとめる）
+        current_month = datetime.now().strftime("%Y%m")
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
+        embeddings_dir = f"embeddings/{current_month}/{run_id}"
+        sidecar_dir = f"embeddings_npy/{current_month}/{run_id}" if write_sidecar else None
+        
+        ingested = []   # 今回エンべディングを書き出した画像のマニフェスト項目
+        refreshed = []  # 内容は取り込み済みで、ファイル情報だけ更新する項目
+        writer = ShardedEmbeddingWriter(self.bucket, embeddings_dir, sidecar_prefix=sidecar_dir, sidecar_dtype=sidecar_dtype)
+        try:
+            if streaming:
+                # 先にアップロードし、GCS 上の画像をダウンロード・デコード・推論と重ねて取り込む
+                with self.tracer.span("add_images.upload"):
+                    results = await loop.run_in_executor(self.io_executor, self._upload_with_report, manifest, max_concurrent_uploads)
+                uploaded_uris = [f"gs://{self.bucket_name}/{result['blob_name']}" for result in results]
+                pending = {}
+                for result in results:
+                    if self._needs_embedding(result):
+                        pending[result["blob_name"]] = result
+                    else:
+                        refreshed.append(self._refreshed_manifest_entry(result))
+                pipeline = StreamingIngestPipeline(
+                    self.bucket,
+                    self.model,
+                    bucket_name=self.bucket_name,
+                    batch_size=batch_size,
+                    tracer=self.tracer,
+                    # キャッシュ済みの画像はデコード前に外し、推論した分はキャッシュに書き戻す
+                    embedding_cache=self.embedding_cache,
+                    model_id=self.model_id,
+                    reduced=self.reduced_decode
+                )
+                processed = await loop.run_in_executor(
+                    self.inference_executor,
+                    lambda: pipeline.run(list(pending), writer, metadata={"user_type": user_type, "user_id": user_id})
+                )
+                ingested = [self._manifest_entry(pending[blob_name], shard_name) for blob_name, shard_name in processed]
+            else:
+                # ファイルは1回だけ読み、同じバッファからアップロードと推論を行う（再ダウンロードしない）
+                uploaded_uris, ingested, refreshed = await self._ingest_local_images(
+                    manifest, writer, user_type, user_id, batch_size, in_memory_limit, max_concurrent_uploads
+                )
+        finally:
+            # 残りのシャードのアップロード完了を待つ
+            with self.tracer.span("add_images.shard_upload"):
+                await loop.run_in_executor(self.io_executor, writer.close)
+        
         print(f"Successfully uploaded {len(uploaded_uris)} images")
 
         # # Prismaクライアントの接続を開始
@@ -224,77 +365,211 @@ class ImageSearchDemo:
         #     # 必ず接続を閉じる
         #     await self.prisma.disconnect()
         
-        # 2. 埋め込みベクトルを生成（月単位でグループ化）
-        current_month = datetime.now().strftime("%Y%m")
-        embeddings_dir = f"embeddings/{current_month}"
+        if self.ingest_manifest is not None and refreshed:
+            await loop.run_in_executor(self.io_executor, self.ingest_manifest.record, refreshed)
         
-        for i, uri in enumerate(uploaded_uris):
-            blob_name = uri.replace(f"gs://{self.bucket_name}/", "")
-            blob = self.bucket.blob(blob_name)
-            local_path = f"/tmp/{os.path.basename(blob_name)}"
-            
-            try:
-                print(f"\nProcessing {blob_name}...")
-                blob.download_to_filename(local_path)
-                
-                # Generate embedding
-                print("Generating embedding...")
-                embedding = self._generate_embedding(local_path)
-                print(f"Embedding shape: {len(embedding)}")
-                
-                # 3. エンベディングデータを作成（メタデータを追加）
-                embedding_data = {
-                    "id": uri,
-                    "embedding": embedding,
-                    "metadata": {
-                        "image_path": blob_name,
-                        "user_type": user_type,
-                        "user_id": user_id,
-                        "created_at": datetime.now().isoformat(),
-                    }
-                }
-                
-                # 一時的なJSONファイルを作成
-                embedding_id = str(uuid.uuid4())
-                json_path = f"/tmp/embedding_{embedding_id}.json"
-                with open(json_path, 'w') as f:
-                    json.dump(embedding_data, f)
-                
-                # Cloud Storageに保存
-                cloud_path = f"{embeddings_dir}/{embedding_id}.json"
-                embedding_blob = self.bucket.blob(cloud_path)
-                embedding_blob.upload_from_filename(json_path)
-                
-                # Cleanup
-                os.remove(local_path)
-                os.remove(json_path)
-                print(f"Successfully processed {blob_name}")
-                
-            except Exception as e:
-                print(f"Error processing {blob_name}: {str(e)}")
-                print(traceback.format_exc())
-                continue
+        if writer.record_count == 0:
+            print("No embeddings were generated")
+            return
+        print(f"Wrote {writer.record_count} embeddings to {len(writer.shard_names)} shards")
             
         # 4. インデックスを更新
         try:
-            index = aiplatform.MatchingEngineIndex(
-                index_name=f"projects/{self.project_id}/locations/{self.location}/indexes/7368610270005952512"
-            )
-            
             print("Updating index with new embeddings...")
-            contents_delta_uri = f"gs://{self.bucket_name}/{embeddings_dir}"
-            operation = index.update_embeddings(
-                contents_delta_uri=contents_delta_uri,
-                is_complete_overwrite=False
-            )
-            
+            with self.tracer.span("add_images.index_update"):
+                await loop.run_in_executor(self.io_executor, self._update_index, embeddings_dir)
             print(f"Successfully added embeddings to index")
             
+            # インデックスに反映できたものだけをマニフェストに記録（失敗時は次回やり直す）
+            if self.ingest_manifest is not None:
+                await loop.run_in_executor(self.io_executor, self.ingest_manifest.record, ingested)
+            
+            # インデックスが変わったのでキャッシュ済みの検索結果を破棄
+            if self.query_cache is not None:
+                self.query_cache.invalidate()
+            
+            self.tracer.incr("add_images.images", len(ingested))
+            self.tracer.observe("add_images", time.perf_counter() - started)
+            
         except Exception as e:
             print(f"Error updating index: {str(e)}")
             print(traceback.format_exc())
             raise
 
+    def _update_index(self, embeddings_dir):
+        if self.rerank_store is not None and self.rerank_store is not self.search_backend:
+            # 再スコアリング用のローカルベクトルにも同じシャードを追加する
+            self.rerank_store.import_from_bucket(self.bucket, prefix=f"{embeddings_dir}/")
+        
+        if self.offline:
+            # Vertex AI のインデックスの代わりに、ローカルのバックエンドへ今回書き出したシャードを読み込む
+            return self.search_backend.import_from_bucket(self.bucket, prefix=f"{embeddings_dir}/")
+        
+        index = aiplatform.MatchingEngineIndex(
+            index_name=f"projects/{self.project_id}/locations/{self.location}/indexes/7368610270005952512"
+        )
+        
+        contents_delta_uri = f"gs://{self.bucket_name}/{embeddings_dir}"  # 今回書き出したシャード群
+        return index.update_embeddings(
+            contents_delta_uri=contents_delta_uri,
+            is_complete_overwrite=False
+        )
+
+    def _filter_unchanged_sources(self, manifest):
+        return [
+            (local_path, blob_name) for local_path, blob_name in manifest
+            if not self.ingest_manifest.is_unchanged_source(blob_name, local_path)
+        ]
+
+    # ローカル画像を1回だけ読み込み、同じバッファからアップロードとエンべディング作成を行う
+    # アップロード（I/O スレッドプール）と推論（専用スレッド）を非同期に重ねて実行する
+    async def _ingest_local_images(self, manifest, writer, user_type, user_id, batch_size, in_memory_limit, max_concurrent_uploads):
+        """
+        Upload local images and embed them from the same in-memory buffers
+        
+        Uploads run on io_executor with at most max_concurrent_uploads in flight; finished
+        uploads are queued (bounded, for backpressure) and embedded batch by batch on
+        inference_executor, so the event loop stays free throughout.
+        
+        Args:
+            manifest (list): (local_path, blob_name) pairs from build_upload_manifest
+            writer (ShardedEmbeddingWriter): Destination for the embedding records
+            user_type (str): 'admin' or 'user'
+            user_id (str): User ID for non-admin uploads
+            batch_size (int): Images per model call
+            in_memory_limit (int): Files larger than this many bytes are uploaded and embedded from disk
+            max_concurrent_uploads (int): Uploads in flight at once
+            
+        Returns:
+            tuple: (GCS URIs of the images that were uploaded or already up to date,
+                manifest entries for newly embedded images,
+                manifest entries for images whose content was already embedded)
+        """
+        loop = asyncio.get_running_loop()
+        uploader = ConcurrentUploader(self.bucket)
+        upload_slots = asyncio.Semaphore(max_concurrent_uploads)
+        uploaded = asyncio.Queue(maxsize=batch_size * 2)
+        uploaded_uris = []
+        ingested = []
+        refreshed = []
+        
+        def upload_file(local_path, blob_name):
+            with self.tracer.span("add_images.upload"):
+                return uploader.upload_file(local_path, blob_name, in_memory_limit)
+        
+        async def upload(local_path, blob_name):
+            # キューに渡すまで枠を保持し、メモリ上のバッファが増えすぎないようにする
+            async with upload_slots:
+                result = await loop.run_in_executor(self.io_executor, upload_file, local_path, blob_name)
+                await uploaded.put(result)
+        
+        async def produce():
+            try:
+                await asyncio.gather(*(upload(local_path, blob_name) for local_path, blob_name in manifest))
+            finally:
+                await uploaded.put(None)
+        
+        async def consume():
+            finished = False
+            while not finished:
+                results = []
+                while len(results) < batch_size:
+                    result = await uploaded.get()
+                    if result is None:
+                        finished = True
+                        break
+                    results.append(result)
+                
+                batch = []
+                for result in results:
+                    if result["status"] == "failed":
+                        print(f"Error uploading {result['local_path']}: {result['error']}")
+                        self.tracer.incr("add_images.upload_failures")
+                        continue
+                    uri = f"gs://{self.bucket_name}/{result['blob_name']}"
+                    uploaded_uris.append(uri)
+                    if not self._needs_embedding(result):
+                        refreshed.append(self._refreshed_manifest_entry(result))
+                        continue
+                    # 大きい画像はメモリに載せずファイルから読む
+                    source = result["data"] if result["data"] is not None else result["local_path"]
+                    batch.append((uri, result, source))
+                
+                if not batch:
+                    continue
+                
+                # Generate embeddings (1バッチ1回の推論)
+                print(f"Generating embeddings for {len(batch)} images...")
+                embeddings = await loop.run_in_executor(
+                    self.inference_executor, self._embed_with_fallback, batch, batch_size
+                )
+                
+                for (uri, result, _), embedding in zip(batch, embeddings):
+                    if embedding is None:
+                        continue
+                    # 3. エンベディングデータを作成（メタデータを追加）
+                    # データポイントIDは画像の gs:// URI なので、再実行しても同じIDで上書きされる
+                    with self.tracer.span("add_images.serialize"):
+                        shard_name = writer.write(uri, embedding, {
+                            "image_path": result["blob_name"],
+                            "user_type": user_type,
+                            "user_id": user_id,
+                            "created_at": datetime.now().isoformat(),
+                        })
+                    ingested.append(self._manifest_entry(result, shard_name))
+                    print(f"Successfully processed {result['blob_name']}")
+        
+        producer = asyncio.create_task(produce())
+        try:
+            await consume()
+        finally:
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        
+        return uploaded_uris, ingested, refreshed
+
+    def _embed_with_fallback(self, batch, batch_size):
+        sources = [source for _, _, source in batch]
+        try:
+            return list(self._embed_images(sources, batch_size))
+        except Exception as e:
+            # 壊れた画像が混じっているとバッチ全体が失敗するので1枚ずつやり直す
+            print(f"Batch embedding failed ({str(e)}), retrying one by one")
+            embeddings = []
+            for (_, result, source) in batch:
+                try:
+                    embeddings.append(self._embed_images([source], 1)[0])
+                except Exception as e:
+                    print(f"Error generating embedding for {result['blob_name']}: {str(e)}")
+                    embeddings.append(None)
+            return embeddings
+
+    def _needs_embedding(self, upload_result):
+        # マニフェストに同じ crc32c で記録済みなら推論し直す必要はない
+        return self.ingest_manifest is None or not self.ingest_manifest.is_current(
+            upload_result["blob_name"], upload_result["crc32c"]
+        )
+
+    def _manifest_entry(self, upload_result, shard_name):
+        return {
+            "blob_name": upload_result["blob_name"],
+            "generation": upload_result["generation"],
+            "crc32c": upload_result["crc32c"],
+            "datapoint_id": f"gs://{self.bucket_name}/{upload_result['blob_name']}",
+            "embedding_uri": f"gs://{self.bucket_name}/{shard_name}",
+            "local_path": upload_result["local_path"],
+        }
+
+    def _refreshed_manifest_entry(self, upload_result):
+        entry = self.ingest_manifest.get(upload_result["blob_name"])
+        entry.update(
+            blob_name=upload_result["blob_name"],
+            generation=upload_result["generation"],
+            local_path=upload_result["local_path"],
+        )
+        return entry
+
     # 類似画像の検索 
     def search_similar_images(self, query_image_path, num_neighbors=5):
         """
@@ -307,25 +582,100 @@ class ImageSearchDemo:
         Returns:
             list: List of similar image URIs and distances
         """
-        print(f"Generating embedding for query image: {query_image_path}")
-        query_embedding = self._generate_embedding(query_image_path)
+        started = time.perf_counter()
+        content_hash = None
+        query_embedding = None
+        if self.query_cache is not None:
+            with self.tracer.span("search.cache_lookup"):
+                content_hash = EmbeddingCache.content_hash(tf.io.read_file(query_image_path).numpy())
+                cached_results = self.query_cache.get_results(content_hash, num_neighbors)
+            if cached_results is not None:
+                print(f"Found {len(cached_results)} similar images (cached)")
+                self.tracer.incr("search.cache_hits")
+                self.tracer.observe("search_similar_images", time.perf_counter() - started)
+                return cached_results
+            query_embedding = self.query_cache.get_embedding(content_hash)
         
-        print("Searching for similar images...")
-        response = self.endpoint.find_neighbors(
-            embedding=query_embedding,
-            num_neighbors=num_neighbors
-        )
+        if query_embedding is None:
+            print(f"Generating embedding for query image: {query_image_path}")
+            with self.tracer.span("search.embed"):
+                query_embedding = self._generate_embedding(query_image_path)
+            if content_hash is not None:
+                self.query_cache.put_embedding(content_hash, query_embedding)
         
-        results = [
-            {
-                "uri": neighbor.id,
-                "distance": neighbor.distance
-            }
-            for neighbor in response
-        ]
+        print("Searching for similar images...")
+        with self.tracer.span("search.query"):
+            if self.search_backend is not None:
+                # ローカルのバックエンドで検索（ネットワークを使わない）
+                results = self.search_backend.search(query_embedding, self._candidate_count(num_neighbors))
+            else:
+                response = self.endpoint.find_neighbors(
+                    embedding=query_embedding,
+                    num_neighbors=self._candidate_count(num_neighbors)
+                )
+                
+                results = [
+                    {
+                        "uri": neighbor.id,
+                        "distance": neighbor.distance
+                    }
+                    for neighbor in response
+                ]
+        results = self._rerank(query_embedding, results, num_neighbors)
+        if content_hash is not None:
+            self.query_cache.put_results(content_hash, num_neighbors, results)
         print(f"Found {len(results)} similar images")
+        self.tracer.observe("search_similar_images", time.perf_counter() - started)
         return results
 
+    # 複数クエリをまとめて近傍探索（1回のリクエストで送る）
+    def find_neighbors_batch(self, query_embeddings, num_neighbors=5):
+        """
+        Search neighbours for many query embeddings in one backend call
+        
+        Args:
+            query_embeddings (array-like): Matrix of shape (Q, EMBEDDING_DIM)
+            num_neighbors (int): Number of similar images per query
+            
+        Returns:
+            list: One list of {"uri", "distance"} dicts per query, aligned with the inputs
+        """
+        if self.search_backend is not None:
+            results = self.search_backend.search_batch(query_embeddings, self._candidate_count(num_neighbors))
+        else:
+            response = self.endpoint.find_neighbors(
+                deployed_index_id=self.index_display_name,
+                queries=[[float(value) for value in embedding] for embedding in query_embeddings],
+                num_neighbors=self._candidate_count(num_neighbors)
+            )
+            results = [
+                [
+                    {
+                        "uri": neighbor.id,
+                        "distance": neighbor.distance
+                    }
+                    for neighbor in neighbors
+                ]
+                for neighbors in response
+            ]
+        return [
+            self._rerank(query_embedding, candidates, num_neighbors)
+            for query_embedding, candidates in zip(query_embeddings, results)
+        ]
+
+    def _candidate_count(self, num_neighbors):
+        # 再スコアリングするときは近似検索で多めに候補を取る
+        if self.rerank_store is None or self.rerank_factor <= 1:
+            return num_neighbors
+        return num_neighbors * self.rerank_factor
+
+    def _rerank(self, query_embedding, candidates, num_neighbors):
+        # Matching Engine の近似順位を、ローカルの元ベクトルとの正確な内積で並べ直す
+        if self.rerank_store is None or self.rerank_factor <= 1:
+            return candidates[:num_neighbors]
+        with self.tracer.span("search.rerank"):
+            return self.rerank_store.rerank(query_embedding, candidates, num_neighbors)
+
     # 画像からエンべディングを作成
     def _generate_embedding(self, image_path):
         """
@@ -337,37 +687,173 @@ class ImageSearchDemo:
         Returns:
             list: Image embedding vector
         """
-        # Load and preprocess image
-        img = tf.io.read_file(image_path)
-        img = tf.image.decode_jpeg(img, channels=3)
-        img = tf.image.resize(img, [224, 224])
-        img = tf.cast(img, tf.float32) / 255.0
-        img = tf.expand_dims(img, 0)
-        
-        # Generate embedding
-        embedding = self.model(img, training=False)
-        return embedding[0].numpy().tolist()
+        return self.generate_embeddings_batch([image_path], batch_size=1)[0].tolist()
+
+    # 複数画像のエンべディングをまとめて作成（1回のモデル呼び出しで複数枚を推論）
+    def generate_embeddings_batch(self, image_paths, batch_size=32):
+        """
+        Generate embedding vectors for many images, running the model once per batch
+        
+        Args:
+            image_paths (list): Paths to image files
+            batch_size (int): Number of images stacked into one model call
+            
+        Returns:
+            np.ndarray: float32 matrix of shape (len(image_paths), EMBEDDING_DIM)
+        """
+        return self._embed_images(image_paths, batch_size)
 
-    def download_result_images(self, results, output_dir):
+    # メモリ上の画像データから直接エンべディングを作成（ファイルを介さない）
+    def generate_embeddings_from_bytes(self, images, batch_size=32):
+        """
+        Generate embedding vectors for encoded images already held in memory
+        
+        Args:
+            images (list): Encoded image bytes
+            batch_size (int): Number of images stacked into one model call
+            
+        Returns:
+            np.ndarray: float32 matrix of shape (len(images), EMBEDDING_DIM)
+        """
+        return self._embed_images(images, batch_size)
+
+    def _embed_images(self, sources, batch_size):
+        # sources の各要素は画像のバイト列かファイルパス。パスはバッチごとに読み込む
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        
+        embeddings = np.empty((len(sources), EMBEDDING_DIM), dtype=np.float32)
+        for start in range(0, len(sources), batch_size):
+            # キャッシュにない画像だけを推論に回す
+            pending = []
+            for row, source in enumerate(sources[start:start + batch_size], start):
+                if isinstance(source, bytes):
+                    image_bytes = source
+                else:
+                    with self.tracer.span("embed.read"):
+                        image_bytes = tf.io.read_file(source).numpy()
+                content_hash = None
+                if self.embedding_cache is not None:
+                    with self.tracer.span("embed.cache_lookup"):
+                        content_hash = EmbeddingCache.content_hash(image_bytes)
+                        cached = self.embedding_cache.get(content_hash, self.model_id)
+                    if cached is not None:
+                        self.tracer.incr("embed.cache_hits")
+                        embeddings[row] = cached
+                        continue
+                pending.append((row, content_hash, image_bytes))
+            
+            if not pending:
+                continue
+            images = [image_bytes for _, _, image_bytes in pending]
+            with self.tracer.span("embed.decode"):
+                if self.image_decoder is not None:
+                    # デコード・リサイズはプロセスプールで並列に行う
+                    batch = tf.convert_to_tensor(self.image_decoder.decode_batch(images))
+                else:
+                    batch = tf.stack([decode_and_resize(image_bytes, self.reduced_decode) for image_bytes in images])
+            with self.tracer.span("embed.inference"):
+                batch_embeddings = self.model(batch, training=False).numpy()
+            self.tracer.incr("embed.images", len(pending))
+            for (row, content_hash, _), embedding in zip(pending, batch_embeddings):
+                embeddings[row] = embedding
+                if content_hash is not None:
+                    self.embedding_cache.put(content_hash, self.model_id, embedding)
+        return embeddings
+
+    def download_result_images(self, results, output_dir, max_workers=8, thumbnails=False):
         """
         Download result images from Cloud Storage
         
         Args:
             results (list): List of search results with image URIs
             output_dir (str): Directory to save downloaded images
+            max_workers (int): Number of concurrent downloads
+            thumbnails (bool): Save thumbnails from thumbnail_cache (longest side thumbnail_cache.max_size,
+                JPEG) instead of the full-size images
+            
+        Returns:
+            list: Paths of the saved images, in result order (None where the download failed)
         """
-        os.makedirs(output_dir, exist_ok=True)
         print(f"\nDownloading results to {output_dir}")
+        paths = [None] * len(results)
+        for done, fetched in enumerate(self.iter_result_images(results, output_dir, max_workers, thumbnails), 1):
+            if fetched["error"] is not None:
+                print(f"Error downloading {fetched['uri']}: {fetched['error']}")
+                continue
+            paths[fetched["index"]] = fetched["path"]
+            source = "cache" if fetched["cached"] else "storage"
+            print(f"Downloaded result {done}/{len(results)} from {source} to {fetched['path']}")
+        return paths
+
+    # 結果画像を並列に取得し、取得できた順に返す（サムネイルなら変わっていない画像は再取得しない）
+    def iter_result_images(self, results, output_dir, max_workers=8, thumbnails=False):
+        """
+        Fetch result images concurrently, yielding each one as soon as it is saved
         
-        for i, result in enumerate(results):
-            uri = result["uri"]
-            blob_name = uri.replace(f"gs://{self.bucket_name}/", "")
-            blob = self.bucket.blob(blob_name)
-            output_path = os.path.join(output_dir, f"result_{i}.jpg")
+        Args:
+            results (list): List of search results with image URIs, optionally with the blob
+                "generation" (e.g. from a bucket listing), which lets a cached thumbnail be used
+                without contacting Cloud Storage
+            output_dir (str): Directory to save the images (result_{i}.jpg)
+            max_workers (int): Number of concurrent downloads
+            thumbnails (bool): Save thumbnails from thumbnail_cache instead of the full-size images
             
-            print(f"Downloading {blob_name} to {output_path}")
-            try:
-                blob.download_to_filename(output_path)
-                print(f"Downloaded result {i+1}/{len(results)}")
-            except Exception as e:
-                print(f"Error downloading {blob_name}: {str(e)}")
+        Yields:
+            dict: {"index", "uri", "path", "cached", "error"} in completion order
+        """
+        if thumbnails and self.thumbnail_cache is None:
+            raise ValueError("thumbnails=True needs a thumbnail_cache")
+        os.makedirs(output_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(
+                    self._fetch_result_image if thumbnails else self._download_result_image,
+                    i, result, os.path.join(output_dir, f"result_{i}.jpg")
+                )
+                for i, result in enumerate(results)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _download_result_image(self, index, result, output_path):
+        fetched = {"index": index, "uri": result["uri"], "path": output_path, "cached": False, "error": None}
+        try:
+            with self.tracer.span("download_result_images.fetch"):
+                self.bucket.blob(result["uri"].replace(f"gs://{self.bucket_name}/", "")).download_to_filename(output_path)
+        except Exception as e:
+            fetched["error"] = str(e)
+        return fetched
+
+    def _fetch_result_image(self, index, result, output_path):
+        uri = result["uri"]
+        fetched = {"index": index, "uri": uri, "path": output_path, "cached": False, "error": None}
+        try:
+            with self.tracer.span("download_result_images.fetch"):
+                blob = self.bucket.blob(uri.replace(f"gs://{self.bucket_name}/", ""))
+                generation = result.get("generation")
+                image_bytes = None
+                if generation is None:
+                    # 手元のサムネイルの generation を条件に付けて取得する（変わっていなければ 304 で本体は返らない）
+                    cached_generation = self.thumbnail_cache.latest_generation(uri)
+                    try:
+                        image_bytes = blob.download_as_bytes(if_generation_not_match=cached_generation)
+                        generation = blob.generation
+                    except google_exceptions.NotModified:
+                        generation = cached_generation
+                
+                cached_path = self.thumbnail_cache.get(uri, generation)
+                if cached_path is not None:
+                    fetched["cached"] = True
+                    shutil.copyfile(cached_path, output_path)
+                    return fetched
+                
+                # フルサイズを1回だけ取得し、縮小したものをキャッシュして使う
+                if image_bytes is None:
+                    image_bytes = blob.download_as_bytes()
+                    generation = blob.generation
+                thumbnail_path = self.thumbnail_cache.put(uri, image_bytes, generation)
+                shutil.copyfile(thumbnail_path, output_path)
+        except Exception as e:
+            fetched["error"] = str(e)
+        return fetched
@@ -0,0 +1,75 @@
+import hashlib
+import threading
+
+from .sqlite_lru import SQLiteLRUStore
+
+# 画像バイト列の SHA-256 + モデルID をキーにしたエンべディングの永続キャッシュ
+# 同じ画像を何度取り込んでもモデル推論は1回で済む
+class EmbeddingCache:
+    def __init__(self, db_path, max_entries=100000):
+        """
+        Content-addressed embedding cache stored in SQLite
+
+        Args:
+            db_path (str): SQLite database file
+            max_entries (int): Least-recently-used entries beyond this count are evicted
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._store = SQLiteLRUStore(db_path, "embeddings", "content_hash", max_entries)
+        self._lock = threading.Lock()
+
+    @property
+    def evictions(self):
+        return self._store.evictions
+
+    @staticmethod
+    def content_hash(image_bytes):
+        """SHA-256 hex digest of the encoded image bytes"""
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def get(self, content_hash, model_id):
+        """
+        Look up a cached embedding
+
+        Args:
+            content_hash (str): SHA-256 of the image bytes
+            model_id (str): Model handle, output dimension and preprocessing version, e.g. "<handle>:1280:pp2"
+
+        Returns:
+            np.ndarray | None: float32 embedding, or None on a miss
+        """
+        vector = self._store.get(content_hash, model_id)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return vector
+
+    def put(self, content_hash, model_id, embedding):
+        """
+        Store an embedding and evict the oldest entries past max_entries
+
+        Args:
+            content_hash (str): SHA-256 of the image bytes
+            model_id (str): Model handle, output dimension and preprocessing version
+            embedding (array-like): Embedding vector
+        """
+        self._store.put_many([(content_hash, embedding)], model_id)
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._store),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self._store.close()
@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+
+# クォータ超過・過負荷として扱う（待って再送すれば通る）エラー
+THROTTLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+)
+
+
+# 1秒あたりのリクエスト数を制限するトークンバケット
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        """
+        Thread-safe token bucket
+
+        Args:
+            rate (float): Tokens added per second (requests per second)
+            burst (float): Bucket capacity (defaults to one second's worth of tokens)
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# AIMD で同時実行数を調整するリミッタ
+# 成功するたびに少しずつ（1 ウィンドウで +1）増やし、スロットリングされたら半分に減らす
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, initial=4, minimum=1, maximum=32, decrease_factor=0.5, decrease_cooldown=1.0):
+        """
+        Additive-increase / multiplicative-decrease concurrency limit
+
+        Args:
+            initial (int): Starting concurrency limit
+            minimum (int): Lowest limit after decreases
+            maximum (int): Highest limit after increases
+            decrease_factor (float): Multiplier applied to the limit on throttling
+            decrease_cooldown (float): Seconds during which further throttles do not decrease again
+                (requests already in flight usually fail together)
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+# レート制限・適応的な同時実行数・ジッター付き再送をまとめたエンべディング API クライアント
+class EmbeddingClient:
+    def __init__(
+        self,
+        embed_fn,
+        requests_per_second=None,
+        burst=None,
+        initial_concurrency=4,
+        max_concurrency=32,
+        max_retries=6,
+        backoff=0.5,
+        max_backoff=30.0
+    ):
+        """
+        Rate-limited, adaptively concurrent wrapper around a remote embedding call
+
+        Args:
+            embed_fn (callable): Takes encoded image bytes and returns the embedding vector
+            requests_per_second (float): Quota to stay under (None for no rate limit)
+            burst (float): Token bucket capacity
+            initial_concurrency (int): Starting number of requests in flight
+            max_concurrency (int): Upper bound for the adaptive concurrency limit
+            max_retries (int): Retries per image after throttling errors
+            backoff (float): Base delay in seconds for exponential backoff
+            max_backoff (float): Cap on a single backoff delay
+        """
+        self.embed_fn = embed_fn
+        self.rate_limiter = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self.concurrency = AdaptiveConcurrencyLimiter(initial=initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._stats = {"requests": 0, "succeeded": 0, "throttled": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def embed(self, image_bytes):
+        """
+        Embed one image, waiting for rate/concurrency capacity and retrying on throttling
+
+        Args:
+            image_bytes (bytes): Encoded image
+
+        Returns:
+            list: Embedding vector
+        """
+        return self.call(self.embed_fn, image_bytes)
+
+    def call(self, fn, *args):
+        """
+        Run any other request against the same quota (e.g. text embeddings) under this client's
+        rate limit, concurrency limit and retries
+
+        Returns:
+            The return value of fn(*args)
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self.concurrency.acquire()
+            throttled = False
+            try:
+                self._count("requests")
+                result = fn(*args)
+                self._count("succeeded")
+                return result
+            except THROTTLE_ERRORS:
+                throttled = True
+                self._count("throttled")
+                if attempt == self.max_retries:
+                    self._count("failed")
+                    raise
+            except Exception:
+                self._count("failed")
+                raise
+            finally:
+                self.concurrency.release(throttled=throttled)
+            # 同時に弾かれたリクエストが一斉に再送しないようにジッターを入れる
+            delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def embed_many(self, images, max_workers=None):
+        """
+        Embed many images concurrently (the adaptive limit decides how many are in flight)
+
+        Args:
+            images (list): Encoded image bytes
+            max_workers (int): Worker threads (defaults to max_concurrency)
+
+        Returns:
+            list: Embedding vectors in input order
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or self.concurrency.maximum) as pool:
+            return list(pool.map(self.embed, images))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["concurrency_limit"] = self.concurrency.limit
+        return stats
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
@@ -0,0 +1,174 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .quantization import check_dtype, quantize
+
+
+# float32 を誤差なく往復できる桁数（%.9g）でまとめて文字列化する
+def format_embedding(embedding):
+    """
+    Format a vector as a compact JSON array using one C-level printf call
+
+    Args:
+        embedding (array-like): Embedding vector
+
+    Returns:
+        str: JSON array text, round-trip exact for float32 values
+    """
+    values = np.asarray(embedding, dtype=np.float32).tolist()
+    return "[" + ",".join(["%.9g"] * len(values)) % tuple(values) + "]"
+
+
+# add_images が書き出したエンべディングレコードを読み戻す（ローカルのバックエンドへの取り込み用）
+def read_embedding_records(bucket, prefix="embeddings/"):
+    """
+    Read every embedding record stored under a Cloud Storage prefix
+
+    Both the old one-record-per-file layout and JSONL shards are supported.
+
+    Args:
+        bucket: Cloud Storage bucket (or storage.LocalBucket)
+        prefix (str): Prefix the embedding records were written under
+
+    Returns:
+        list: {"id", "embedding", ...} record dicts
+    """
+    return [
+        json.loads(line)
+        for blob in bucket.list_blobs(prefix=prefix)
+        if blob.name.endswith(".json")
+        for line in blob.download_as_bytes().splitlines()
+        if line.strip()
+    ]
+
+
+# 1画像1ファイルではなく、サイズ上限付きの JSONL シャードにまとめて書き出す
+# Vector Search の contents_delta_uri にはシャードを置いたディレクトリを渡す
+class ShardedEmbeddingWriter:
+    def __init__(
+        self,
+        bucket,
+        prefix,
+        max_shard_bytes=64 * 1024 * 1024,
+        sidecar_prefix=None,
+        upload_workers=2,
+        sidecar_dtype="float32"
+    ):
+        """
+        Stream embedding records into size-capped JSONL shards
+
+        Args:
+            bucket: Cloud Storage bucket (or storage.LocalBucket for offline runs)
+            prefix (str): Directory the shards are written to (the contents_delta_uri)
+            max_shard_bytes (int): Approximate maximum size of one shard
+            sidecar_prefix (str): If set, also write each shard's vectors as a .npy file here.
+                Keep it outside prefix so Vector Search does not try to ingest it.
+            upload_workers (int): Background threads uploading finished shards
+            sidecar_dtype (str): Sidecar storage format: "float32", "float16", or "int8"
+                (written as .npz with "codes" and per-vector "scales")
+        """
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.max_shard_bytes = max_shard_bytes
+        self.sidecar_prefix = sidecar_prefix.rstrip("/") if sidecar_prefix else None
+        self.sidecar_dtype = check_dtype(sidecar_dtype)
+        self.shard_names = []
+        self.record_count = 0
+
+        self._lines = []
+        self._vectors = []
+        self._buffered_bytes = 0
+        self._upload_pool = ThreadPoolExecutor(max_workers=upload_workers)
+        self._uploads = []
+
+    @property
+    def contents_delta_uri(self):
+        return f"gs://{self.bucket.name}/{self.prefix}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record_id, embedding, metadata=None):
+        """
+        Append one embedding record
+
+        Args:
+            record_id (str): Datapoint id (gs:// URI of the image)
+            embedding (array-like): Embedding vector
+            metadata (dict): Extra metadata stored alongside the vector
+
+        Returns:
+            str: Blob name of the shard this record is written to
+        """
+        shard_name = self._shard_name(len(self.shard_names))
+        line = '{"id": %s, "embedding": %s, "metadata": %s}\n' % (
+            json.dumps(record_id),
+            format_embedding(embedding),
+            json.dumps(metadata or {}),
+        )
+        self._lines.append(line)
+        if self.sidecar_prefix:
+            self._vectors.append(np.asarray(embedding, dtype=np.float32))
+        self._buffered_bytes += len(line)
+        self.record_count += 1
+
+        if self._buffered_bytes >= self.max_shard_bytes:
+            self.flush()
+        return shard_name
+
+    def flush(self):
+        """Upload the buffered records as a new shard"""
+        if not self._lines:
+            return
+        shard_id = len(self.shard_names)
+        shard_name = self._shard_name(shard_id)
+        self.shard_names.append(shard_name)
+        self._uploads.append(self._upload_pool.submit(
+            self.bucket.blob(shard_name).upload_from_string,
+            "".join(self._lines),
+            content_type="application/json"
+        ))
+
+        if self.sidecar_prefix:
+            buffer = io.BytesIO()
+            codes, scales = quantize(np.stack(self._vectors), self.sidecar_dtype)
+            if scales is None:
+                np.save(buffer, codes)
+                extension = "npy"
+            else:
+                np.savez(buffer, codes=codes, scales=scales)
+                extension = "npz"
+            self._uploads.append(self._upload_pool.submit(
+                self.bucket.blob(f"{self.sidecar_prefix}/shard-{shard_id:05d}.{extension}").upload_from_string,
+                buffer.getvalue(),
+                content_type="application/octet-stream"
+            ))
+
+        self._lines = []
+        self._vectors = []
+        self._buffered_bytes = 0
+
+    def close(self):
+        """
+        Flush the last shard and wait for every upload to finish
+
+        Returns:
+            list: Blob names of the written shards
+        """
+        self.flush()
+        try:
+            for upload in self._uploads:
+                upload.result()
+        finally:
+            self._uploads = []
+            self._upload_pool.shutdown()
+        return self.shard_names
+
+    def _shard_name(self, shard_id):
+        return f"{self.prefix}/shard-{shard_id:05d}.json"
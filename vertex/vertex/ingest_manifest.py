@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+# 取り込み済みの画像を記録するローカルのマニフェスト
+# blob 名ごとに (generation, crc32c) と書き出したエンべディングの場所を保持し、
+# 再実行時は新規・変更された画像だけを処理する
+class IngestManifest:
+    def __init__(self, db_path):
+        """
+        Persistent record of which blobs already have embeddings in the index
+
+        Args:
+            db_path (str): SQLite database file
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                blob_name TEXT PRIMARY KEY,
+                generation TEXT,
+                crc32c TEXT NOT NULL,
+                datapoint_id TEXT NOT NULL,
+                embedding_uri TEXT NOT NULL,
+                source_size INTEGER,
+                source_mtime_ns INTEGER,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    def get(self, blob_name):
+        """
+        Look up the manifest entry for a blob
+
+        Returns:
+            dict | None: {"generation", "crc32c", "datapoint_id", "embedding_uri", "source_size", "source_mtime_ns"}
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT generation, crc32c, datapoint_id, embedding_uri, source_size, source_mtime_ns
+                FROM blobs WHERE blob_name = ?
+                """,
+                (blob_name,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("generation", "crc32c", "datapoint_id", "embedding_uri", "source_size", "source_mtime_ns")
+        return dict(zip(keys, row))
+
+    def is_current(self, blob_name, crc32c):
+        """True if blob_name was embedded from content with this crc32c"""
+        entry = self.get(blob_name)
+        return entry is not None and entry["crc32c"] == crc32c
+
+    def is_unchanged_source(self, blob_name, local_path):
+        """True if local_path has the same size and mtime as when blob_name was last embedded"""
+        entry = self.get(blob_name)
+        if entry is None or entry["source_size"] is None:
+            return False
+        stat = os.stat(local_path)
+        return entry["source_size"] == stat.st_size and entry["source_mtime_ns"] == stat.st_mtime_ns
+
+    def record(self, entries):
+        """
+        Insert or update manifest entries in one transaction
+
+        Args:
+            entries (list): Dicts with "blob_name", "generation", "crc32c", "datapoint_id", "embedding_uri"
+                and optionally "local_path" (its size/mtime enable the no-read fast path)
+        """
+        rows = []
+        now = time.time()
+        for entry in entries:
+            source_size = source_mtime_ns = None
+            if entry.get("local_path"):
+                stat = os.stat(entry["local_path"])
+                source_size, source_mtime_ns = stat.st_size, stat.st_mtime_ns
+            generation = entry.get("generation")
+            rows.append((
+                entry["blob_name"],
+                None if generation is None else str(generation),
+                entry["crc32c"],
+                entry["datapoint_id"],
+                entry["embedding_uri"],
+                source_size,
+                source_mtime_ns,
+                now,
+            ))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
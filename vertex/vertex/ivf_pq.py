@@ -0,0 +1,349 @@
+import json
+import os
+
+import numpy as np
+
+from .embedding_writer import read_embedding_records
+
+# 近似最近傍探索用の IVF + 直積量子化(PQ) インデックス
+# 粗いクラスタ(IVF)で候補リストを絞り、残差を PQ コードで近似スコアリングしてから
+# 上位候補だけを LocalVectorStore の全精度ベクトルで再スコアリングする
+# LocalVectorStore と同じく、同じ id を再度追加すると upsert になる（古い行は検索対象から外す）
+class IVFPQIndex:
+    INDEX_FILE = "ivfpq.npz"
+    IDS_FILE = "ids.json"
+
+    def __init__(
+        self,
+        dimension=1280,
+        n_lists=1024,
+        n_subvectors=64,
+        n_bits=8,
+        nprobe=16,
+        rerank_factor=4,
+        vector_store=None
+    ):
+        """
+        Inverted-file index with product-quantized residual codes
+
+        Args:
+            dimension (int): Embedding dimension
+            n_lists (int): Number of coarse k-means clusters (inverted lists)
+            n_subvectors (int): Number of PQ sub-quantizers; must divide dimension
+            n_bits (int): Bits per PQ code (at most 8, stored as uint8)
+            nprobe (int): Inverted lists scanned per query
+            rerank_factor (int): Shortlist size multiplier re-scored exactly against vector_store
+            vector_store (LocalVectorStore): Optional vectors (any storage dtype) aligned with index rows
+        """
+        if dimension % n_subvectors:
+            raise ValueError("n_subvectors must divide dimension")
+        if not 1 <= n_bits <= 8:
+            raise ValueError("n_bits must be between 1 and 8")
+
+        self.dimension = dimension
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_centroids = 2 ** n_bits
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.vector_store = vector_store
+
+        self.coarse_centroids = None
+        self.codebooks = None
+        self.ids = []
+        self._codes = np.empty((0, n_subvectors), dtype=np.uint8)
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._list_order = None
+        self._list_offsets = None
+        self._rows = None
+        self._live = None
+
+    def __len__(self):
+        """Number of distinct datapoints (superseded rows are not counted)"""
+        return len(self._row_index())
+
+    @property
+    def is_trained(self):
+        return self.coarse_centroids is not None
+
+    @property
+    def bytes_per_vector(self):
+        """In-memory bytes per indexed vector (PQ code + list assignment)"""
+        return self._codes.itemsize * self.n_subvectors + self._assignments.itemsize
+
+    @classmethod
+    def from_vector_store(cls, vector_store, max_train=100000, seed=0, **kwargs):
+        """
+        Train an index on a LocalVectorStore and index every vector in it
+
+        Args:
+            vector_store (LocalVectorStore): Store whose rows become index rows
+            max_train (int): Maximum number of vectors sampled for training
+            seed (int): Random seed for sampling and k-means initialisation
+
+        Returns:
+            IVFPQIndex: Trained index sharing row order with the store
+        """
+        index = cls(dimension=vector_store.dimension, vector_store=vector_store, **kwargs)
+        matrix = vector_store.vectors()
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(matrix), min(max_train, len(matrix)), replace=False))
+        index.train(matrix[sample], seed=seed)
+        index._append(vector_store.ids, matrix)
+        return index
+
+    def train(self, embeddings, n_iter=20, seed=0):
+        """
+        Learn coarse centroids and PQ codebooks with vectorized k-means
+
+        Args:
+            embeddings (array-like): Training matrix of shape (N, dimension)
+            n_iter (int): k-means iterations
+            seed (int): Random seed for centroid initialisation
+        """
+        x = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        if len(x) < max(self.n_lists, self.n_centroids):
+            raise ValueError(
+                f"need at least {max(self.n_lists, self.n_centroids)} training vectors, got {len(x)}"
+            )
+        rng = np.random.default_rng(seed)
+
+        self.coarse_centroids = _kmeans(x, self.n_lists, n_iter, rng)
+        residuals = x - self.coarse_centroids[_nearest_centroids(x, self.coarse_centroids)]
+
+        sub_dim = self.dimension // self.n_subvectors
+        sub_residuals = residuals.reshape(len(x), self.n_subvectors, sub_dim)
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(sub_residuals[:, m]), self.n_centroids, n_iter, rng)
+            for m in range(self.n_subvectors)
+        ])
+
+    def add(self, ids, embeddings):
+        """
+        Encode and upsert vectors (also added to vector_store when present); an id that is
+        already indexed is superseded by its new row
+
+        Args:
+            ids (list): Datapoint ids (gs:// URIs)
+            embeddings (array-like): Matrix of shape (len(ids), dimension)
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        if self.vector_store is not None:
+            self.vector_store.add(ids, embeddings)
+        self._append(ids, embeddings)
+
+    def add_records(self, records):
+        """
+        Add embedding records in the {"id", "embedding"} JSON format written by add_images
+
+        Args:
+            records (list): Embedding record dicts
+        """
+        records = list(records)
+        if records:
+            self.add([record["id"] for record in records], [record["embedding"] for record in records])
+
+    def import_from_bucket(self, bucket, prefix="embeddings/"):
+        """
+        Encode and add every embedding record stored under a Cloud Storage prefix
+
+        The index must already be trained (see train / from_vector_store).
+
+        Args:
+            bucket: Cloud Storage bucket (or storage.LocalBucket)
+            prefix (str): Prefix the embedding records were written under
+
+        Returns:
+            int: Number of imported vectors
+        """
+        records = read_embedding_records(bucket, prefix)
+        self.add_records(records)
+        return len(records)
+
+    def search(self, query_embedding, num_neighbors=5, nprobe=None):
+        """
+        Approximate top-k search by dot product
+
+        Args:
+            query_embedding (array-like): Query vector
+            num_neighbors (int): Number of neighbours to return
+            nprobe (int): Inverted lists to scan (defaults to self.nprobe)
+
+        Returns:
+            list: [{"uri": str, "distance": float}, ...] sorted by decreasing similarity
+        """
+        return self.search_batch([query_embedding], num_neighbors, nprobe)[0]
+
+    def search_batch(self, query_embeddings, num_neighbors=5, nprobe=None):
+        """
+        Approximate top-k search for many queries
+
+        Args:
+            query_embeddings (array-like): Matrix of shape (Q, dimension)
+            num_neighbors (int): Number of neighbours per query
+            nprobe (int): Inverted lists to scan (defaults to self.nprobe)
+
+        Returns:
+            list: One result list per query, aligned with the inputs
+        """
+        if not self.is_trained:
+            raise RuntimeError("index must be trained before searching")
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        self._build_lists()
+        return [self._search_one(query, num_neighbors, nprobe) for query in queries]
+
+    def save(self, index_dir):
+        """Persist centroids, codebooks and codes to index_dir"""
+        os.makedirs(index_dir, exist_ok=True)
+        np.savez(
+            os.path.join(index_dir, self.INDEX_FILE),
+            coarse_centroids=self.coarse_centroids,
+            codebooks=self.codebooks,
+            codes=self._codes,
+            assignments=self._assignments,
+            params=np.array([self.nprobe, self.rerank_factor]),
+        )
+        with open(os.path.join(index_dir, self.IDS_FILE), "w") as f:
+            json.dump(self.ids, f)
+
+    @classmethod
+    def load(cls, index_dir, vector_store=None):
+        """Load an index written by save()"""
+        data = np.load(os.path.join(index_dir, cls.INDEX_FILE))
+        coarse_centroids, codebooks = data["coarse_centroids"], data["codebooks"]
+        nprobe, rerank_factor = (int(value) for value in data["params"])
+        index = cls(
+            dimension=coarse_centroids.shape[1],
+            n_lists=coarse_centroids.shape[0],
+            n_subvectors=codebooks.shape[0],
+            n_bits=int(np.log2(codebooks.shape[1])),
+            nprobe=nprobe,
+            rerank_factor=rerank_factor,
+            vector_store=vector_store,
+        )
+        index.coarse_centroids = coarse_centroids
+        index.codebooks = codebooks
+        index._codes = data["codes"]
+        index._assignments = data["assignments"]
+        with open(os.path.join(index_dir, cls.IDS_FILE)) as f:
+            index.ids = json.load(f)
+        index._rows = None
+        return index
+
+    def _append(self, ids, embeddings):
+        if not self.is_trained:
+            raise RuntimeError("index must be trained before adding vectors")
+        if len(ids) != len(embeddings):
+            raise ValueError("ids and embeddings must have the same length")
+
+        assignments = np.empty(len(embeddings), dtype=np.int32)
+        codes = np.empty((len(embeddings), self.n_subvectors), dtype=np.uint8)
+        sub_dim = self.dimension // self.n_subvectors
+        # 大量追加時にメモリを使いすぎないようにチャンクごとにエンコード
+        for start in range(0, len(embeddings), 65536):
+            chunk = np.asarray(embeddings[start:start + 65536], dtype=np.float32)
+            chunk_assignments = _nearest_centroids(chunk, self.coarse_centroids)
+            residuals = (chunk - self.coarse_centroids[chunk_assignments]).reshape(-1, self.n_subvectors, sub_dim)
+            assignments[start:start + len(chunk)] = chunk_assignments
+            for m in range(self.n_subvectors):
+                codes[start:start + len(chunk), m] = _nearest_centroids(
+                    np.ascontiguousarray(residuals[:, m]), self.codebooks[m]
+                )
+
+        first_row = len(self.ids)
+        self.ids.extend(ids)
+        self._codes = np.concatenate([self._codes, codes])
+        self._assignments = np.concatenate([self._assignments, assignments])
+        self._list_order = None
+        if self._rows is not None:
+            # id → 行番号と有効な行のマスクを差分だけ更新する
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            for row, datapoint_id in enumerate(ids, first_row):
+                previous = self._rows.get(datapoint_id)
+                if previous is not None:
+                    self._live[previous] = False
+                self._rows[datapoint_id] = row
+
+    def _row_index(self):
+        # id → 最新の行番号。同じ id が複数回追加された場合は最後の行が有効
+        if self._rows is None:
+            self._rows = {datapoint_id: row for row, datapoint_id in enumerate(self.ids)}
+            self._live = np.zeros(len(self.ids), dtype=bool)
+            self._live[list(self._rows.values())] = True
+        return self._rows
+
+    def _build_lists(self):
+        # 転置リストは「リスト番号順に並べた行番号 + 各リストの開始位置」で表す
+        if self._list_order is None:
+            self._list_order = np.argsort(self._assignments, kind="stable")
+            counts = np.bincount(self._assignments, minlength=self.n_lists)
+            self._list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def _search_one(self, query, num_neighbors, nprobe):
+        coarse_scores = self.coarse_centroids @ query
+        probe = np.argpartition(-coarse_scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([
+            self._list_order[self._list_offsets[list_id]:self._list_offsets[list_id + 1]]
+            for list_id in probe
+        ])
+        # 上書きされた古い行は候補にしない
+        self._row_index()
+        rows = rows[self._live[rows]]
+        if len(rows) == 0:
+            return []
+
+        # 非対称距離計算: クエリの部分ベクトルと各コードブックの内積表を引いて合計
+        sub_queries = query.reshape(self.n_subvectors, -1)
+        lookup = np.einsum("md,mkd->mk", sub_queries, self.codebooks)
+        scores = coarse_scores[self._assignments[rows]] + lookup[
+            np.arange(self.n_subvectors), self._codes[rows]
+        ].sum(axis=1)
+
+        rerank = self.vector_store is not None and self.rerank_factor > 1
+        shortlist_size = min(num_neighbors * self.rerank_factor if rerank else num_neighbors, len(rows))
+        shortlist = np.argpartition(-scores, shortlist_size - 1)[:shortlist_size]
+        rows, scores = rows[shortlist], scores[shortlist]
+
+        if rerank:
+            # 候補だけ保存済みの元ベクトルで正確に再スコアリング（memmap は行番号順に読む）
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = self.vector_store.vectors(rows) @ query
+
+        top = np.argsort(-scores)[:num_neighbors]
+        return [
+            {"uri": self.ids[row], "distance": float(score)}
+            for row, score in zip(rows[top], scores[top])
+        ]
+
+
+def _nearest_centroids(x, centroids, chunk_size=16384):
+    """Index of the nearest centroid (squared L2) for every row of x"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk_size):
+        chunk = x[start:start + chunk_size]
+        # ||x||^2 は argmin に影響しないので省略
+        distances = centroid_norms - 2.0 * (chunk @ centroids.T)
+        assignments[start:start + len(chunk)] = np.argmin(distances, axis=1)
+    return assignments
+
+
+def _kmeans(x, k, n_iter, rng):
+    """Lloyd's k-means with vectorized assignment and update steps"""
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _nearest_centroids(x, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        non_empty = counts > 0
+
+        # クラスタ番号順に並べ替えて区間ごとに合計する
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.add.reduceat(x[np.argsort(assignments, kind="stable")], starts[non_empty], axis=0)
+        centroids[non_empty] = sums / counts[non_empty, None]
+        # 空クラスタはランダムな点で初期化し直す
+        n_empty = int((~non_empty).sum())
+        if n_empty:
+            centroids[~non_empty] = x[rng.choice(len(x), n_empty, replace=False)]
+    return centroids
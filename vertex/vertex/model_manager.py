@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import tensorflow as tf
+import tensorflow_hub as hub
+
+from .constants import IMAGE_SIZE
+
+MODEL_HANDLE = 'https://tfhub.dev/google/imagenet/efficientnet_v2_imagenet1k_b0/feature_vector/2'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pinterest-clone", "models")
+
+
+# TF Hub のモデルをローカルの SavedModel として保存し、2回目以降はネットワークなしで読み込む
+# 読み込みは初回の推論時まで遅延させ、ウォームアップ推論で最初のリクエストが遅くならないようにする
+class ModelManager:
+    def __init__(self, handle=MODEL_HANDLE, cache_dir=None, warmup=True):
+        """
+        Lazily loaded, locally cached TF Hub model
+
+        Args:
+            handle (str): TF Hub model handle (URL)
+            cache_dir (str): Directory for cached SavedModels (defaults to $VERTEX_MODEL_CACHE
+                or ~/.cache/pinterest-clone/models)
+            warmup (bool): Run one dummy inference right after loading
+        """
+        self.handle = handle
+        self.cache_dir = cache_dir or os.getenv("VERTEX_MODEL_CACHE") or DEFAULT_CACHE_DIR
+        self.warmup = warmup
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def saved_model_dir(self):
+        key = hashlib.sha1(self.handle.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The loaded model; loads (and caches) it on first access"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def __call__(self, images, training=False):
+        return self.model(images, training=training)
+
+    def load(self):
+        """Load the model now instead of on first use"""
+        return self.model
+
+    def _load(self):
+        started = time.perf_counter()
+        if not self._is_cached():
+            self._populate_cache()
+        model = tf.saved_model.load(self.saved_model_dir)
+        self.load_seconds = time.perf_counter() - started
+
+        if self.warmup:
+            started = time.perf_counter()
+            model(tf.zeros([1, IMAGE_SIZE, IMAGE_SIZE, 3], dtype=tf.float32), training=False)
+            self.warmup_seconds = time.perf_counter() - started
+
+        warmup_message = f", warmup {self.warmup_seconds:.2f}s" if self.warmup_seconds is not None else ""
+        print(f"Model loaded in {self.load_seconds:.2f}s{warmup_message} ({self.saved_model_dir})")
+        return model
+
+    def _is_cached(self):
+        return os.path.exists(os.path.join(self.saved_model_dir, "saved_model.pb"))
+
+    def _populate_cache(self):
+        # hub.resolve でダウンロードしたディレクトリを一時ディレクトリ経由でキャッシュに置く
+        print(f"Downloading model {self.handle}...")
+        resolved_dir = hub.resolve(self.handle)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            shutil.copytree(resolved_dir, os.path.join(staging_dir, "model"))
+            os.replace(os.path.join(staging_dir, "model"), self.saved_model_dir)
+        except OSError:
+            # 別プロセスが先にキャッシュを作っていればそれを使う
+            if not self._is_cached():
+                raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
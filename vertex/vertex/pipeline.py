@@ -0,0 +1,187 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+
+from .embedding_cache import EmbeddingCache
+from .preprocess import decode_and_resize
+from .tracing import Tracer
+
+
+# ダウンロード → デコード/リサイズ → 推論 → シャード書き出し をストリームで重ねて実行する
+# 各段をスレッドプール / tf.data の並列 map でつなぎ、ネットワーク待ちの間も CPU を遊ばせない
+# エンべディングキャッシュがあれば、ダウンロード直後に引いて当たった画像はデコードも推論もしない
+# シャードのアップロードは ShardedEmbeddingWriter がバックグラウンドで行う
+class StreamingIngestPipeline:
+    def __init__(
+        self,
+        bucket,
+        model,
+        bucket_name=None,
+        batch_size=32,
+        download_workers=8,
+        prefetch_batches=2,
+        tracer=None,
+        embedding_cache=None,
+        model_id=None,
+        reduced=False
+    ):
+        """
+        Streaming ingest pipeline that overlaps storage I/O with decoding and inference
+
+        Args:
+            bucket: Cloud Storage bucket (or storage.LocalBucket for offline runs)
+            model: Callable embedding model taking a (N, 224, 224, 3) float32 batch
+            bucket_name (str): Bucket name used for gs:// ids (defaults to bucket.name)
+            batch_size (int): Images per model call
+            download_workers (int): Concurrent blob downloads
+            prefetch_batches (int): Decoded batches buffered ahead of inference
+            tracer (Tracer): Records add_images.download / .decode_wait / .inference / .serialize spans
+            embedding_cache (EmbeddingCache): Optional cache looked up before decoding and filled after inference
+            model_id (str): Cache key of the model, e.g. "<handle>:1280:pp2" (required with embedding_cache)
+            reduced (bool): Reduced-resolution JPEG decoding (see preprocess.decode_and_resize)
+        """
+        self.bucket = bucket
+        self.model = model
+        self.bucket_name = bucket_name or bucket.name
+        self.batch_size = batch_size
+        self.download_workers = download_workers
+        self.prefetch_batches = prefetch_batches
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.embedding_cache = embedding_cache
+        self.model_id = model_id
+        self.reduced = reduced
+        # キャッシュに当たった (blob_name, embedding)。tf.data の生成スレッドが積み、推論側が取り出す
+        self._cached = deque()
+
+    def run(self, blob_names, writer, metadata=None):
+        """
+        Embed the given blobs and stream one embedding record per image into writer
+
+        Args:
+            blob_names (list): Image blob names inside the bucket
+            writer (ShardedEmbeddingWriter): Destination for the embedding records
+            metadata (dict): Extra metadata merged into every record
+
+        Returns:
+            list: (blob_name, shard_name) for every embedded image
+        """
+        started = time.perf_counter()
+        processed = []
+
+        for names, embeddings in self._embedding_batches(blob_names):
+            for blob_name, embedding in zip(names, embeddings):
+                if isinstance(blob_name, bytes):
+                    blob_name = blob_name.decode("utf-8")
+                with self.tracer.span("add_images.serialize"):
+                    shard_name = writer.write(
+                        f"gs://{self.bucket_name}/{blob_name}",
+                        embedding,
+                        self._build_metadata(blob_name, metadata)
+                    )
+                processed.append((blob_name, shard_name))
+
+        elapsed = time.perf_counter() - started
+        rate = len(processed) / elapsed if elapsed > 0 else 0.0
+        print(f"Streamed {len(processed)}/{len(blob_names)} images in {elapsed:.2f}s ({rate:.1f} images/sec)")
+        return processed
+
+    def build_dataset(self, blob_names):
+        """
+        Build the tf.data pipeline yielding (blob_names, content_hashes, image_batch) batches
+
+        Images found in embedding_cache are set aside instead of being decoded.
+
+        Args:
+            blob_names (list): Image blob names inside the bucket
+
+        Returns:
+            tf.data.Dataset: Batched, prefetched dataset of decoded images
+        """
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self._uncached_stream(blob_names),
+            output_signature=(
+                tf.TensorSpec(shape=(), dtype=tf.string),
+                tf.TensorSpec(shape=(), dtype=tf.string),
+                tf.TensorSpec(shape=(), dtype=tf.string),
+            )
+        )
+        dataset = dataset.map(
+            lambda name, content_hash, data: (name, content_hash, decode_and_resize(data, self.reduced)),
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=False
+        )
+        # デコードできない画像はスキップして続行
+        dataset = dataset.ignore_errors(log_warning=True)
+        dataset = dataset.batch(self.batch_size)
+        return dataset.prefetch(self.prefetch_batches)
+
+    def _embedding_batches(self, blob_names):
+        self._cached.clear()
+        batches = iter(self.build_dataset(blob_names))
+        while True:
+            # デコード済みバッチが揃うのを待った時間（ダウンロード・デコードが追いついていないと長くなる）
+            with self.tracer.span("add_images.decode_wait"):
+                batch = next(batches, None)
+            yield from self._cached_batches()
+            if batch is None:
+                return
+            names, content_hashes, images = batch
+            with self.tracer.span("add_images.inference"):
+                embeddings = self.model(images, training=False).numpy()
+            if self.embedding_cache is not None:
+                for content_hash, embedding in zip(content_hashes.numpy(), embeddings):
+                    self.embedding_cache.put(content_hash.decode("ascii"), self.model_id, embedding)
+            yield names.numpy(), embeddings
+
+    def _cached_batches(self):
+        hits = []
+        while self._cached:
+            hits.append(self._cached.popleft())
+        if hits:
+            self.tracer.incr("embed.cache_hits", len(hits))
+            yield [name for name, _ in hits], np.stack([embedding for _, embedding in hits])
+
+    def _uncached_stream(self, blob_names):
+        # tf.data の生成スレッドで動く。キャッシュに当たった画像はデコードに回さない
+        for blob_name, data in self._download_stream(blob_names):
+            if self.embedding_cache is None:
+                yield blob_name, "", data
+                continue
+            content_hash = EmbeddingCache.content_hash(data)
+            cached = self.embedding_cache.get(content_hash, self.model_id)
+            if cached is not None:
+                self._cached.append((blob_name, cached))
+            else:
+                yield blob_name, content_hash, data
+
+    def _download_stream(self, blob_names):
+        # 先読みするダウンロード数を制限してメモリ使用量を抑える
+        window = self.download_workers * 2
+        with ThreadPoolExecutor(max_workers=self.download_workers) as download_pool:
+            pending = deque()
+            for blob_name in blob_names:
+                pending.append((blob_name, download_pool.submit(self._download, blob_name)))
+                if len(pending) >= window:
+                    yield from self._collect_download(*pending.popleft())
+            while pending:
+                yield from self._collect_download(*pending.popleft())
+
+    def _download(self, blob_name):
+        with self.tracer.span("add_images.download"):
+            return self.bucket.blob(blob_name).download_as_bytes()
+
+    def _collect_download(self, blob_name, future):
+        try:
+            yield blob_name, future.result()
+        except Exception as e:
+            print(f"Error downloading {blob_name}: {str(e)}")
+
+    def _build_metadata(self, blob_name, metadata):
+        record_metadata = {"image_path": blob_name}
+        record_metadata.update(metadata or {})
+        record_metadata["created_at"] = datetime.now().isoformat()
+        return record_metadata
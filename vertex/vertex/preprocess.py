@@ -0,0 +1,64 @@
+import tensorflow as tf
+
+from .constants import IMAGE_SIZE, JPEG_DECODE_RATIOS
+
+
+def _decode_jpeg(image_bytes, ratio=1):
+    # TF の既定（INTEGER_FAST）ではなく libjpeg / Pillow の既定と同じ ISLOW で IDCT する
+    # （decoder.decode_image と同じ画素値にし、経路によってエンべディングが変わらないようにする）
+    return tf.image.decode_jpeg(image_bytes, channels=3, ratio=ratio, dct_method="INTEGER_ACCURATE")
+
+
+def _decode_jpeg_reduced(image_bytes):
+    # 短辺が IMAGE_SIZE を下回らない範囲で最も小さいスケールを選んでデコードする
+    # （Pillow の draft((IMAGE_SIZE, IMAGE_SIZE)) と同じ選び方）
+    shape = tf.image.extract_jpeg_shape(image_bytes)
+    min_side = tf.minimum(shape[0], shape[1])
+    branch = tf.reduce_sum(tf.cast(
+        min_side >= tf.constant([IMAGE_SIZE * ratio for ratio in JPEG_DECODE_RATIOS[1:]], dtype=shape.dtype),
+        tf.int32
+    ))
+    return tf.switch_case(branch, [
+        lambda ratio=ratio: _decode_jpeg(image_bytes, ratio)
+        for ratio in JPEG_DECODE_RATIOS
+    ])
+
+
+# 画像バイト列 → モデル入力テンソル
+def decode_and_resize(image_bytes, reduced=False):
+    """
+    Decode encoded image bytes into a model-ready tensor
+
+    The format (JPEG/PNG/GIF/BMP) is detected from the data; GIFs use their first frame and
+    alpha channels are dropped. decoder.decode_image produces the same values with Pillow.
+
+    Args:
+        image_bytes (tf.Tensor | bytes): Encoded image data
+        reduced (bool): Decode JPEGs at the smallest 1/2, 1/4 or 1/8 scale that still covers
+            IMAGE_SIZE on the short side, instead of at full resolution. Faster, but the embeddings
+            differ slightly, so a whole index must use one setting (see constants.preprocess_id)
+
+    Returns:
+        tf.Tensor: float32 tensor of shape (IMAGE_SIZE, IMAGE_SIZE, 3) scaled to [0, 1]
+    """
+    img = tf.cond(
+        tf.io.is_jpeg(image_bytes),
+        lambda: _decode_jpeg_reduced(image_bytes) if reduced else _decode_jpeg(image_bytes),
+        lambda: tf.io.decode_image(image_bytes, channels=3, expand_animations=False)
+    )
+    # half-pixel centers のバイリニア補間（アンチエイリアスなし）
+    img = tf.image.resize(img, [IMAGE_SIZE, IMAGE_SIZE])
+    return tf.cast(img, tf.float32) / 255.0
+
+
+def load_image(image_path):
+    """
+    Load and preprocess an image file into a model-ready tensor
+
+    Args:
+        image_path (str): Path to image file
+
+    Returns:
+        tf.Tensor: float32 tensor of shape (IMAGE_SIZE, IMAGE_SIZE, 3) scaled to [0, 1]
+    """
+    return decode_and_resize(tf.io.read_file(image_path))
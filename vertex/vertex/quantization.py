@@ -0,0 +1,59 @@
+import numpy as np
+
+# エンべディングの保存形式。int8 はベクトルごとのスケール（float32）を別に持つ
+STORAGE_DTYPES = ("float32", "float16", "int8")
+FILE_SUFFIXES = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+
+def check_dtype(dtype):
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"dtype must be one of {STORAGE_DTYPES}, got {dtype!r}")
+    return dtype
+
+
+# float32 のベクトル → 保存用のコード（int8 のときはスケールも返す）
+def quantize(embeddings, dtype):
+    """
+    Convert float vectors to the storage dtype
+
+    int8 uses symmetric per-vector scaling: code = round(x / scale) with scale = max|x| / 127.
+
+    Args:
+        embeddings (array-like): Matrix of shape (N, dimension)
+        dtype (str): "float32", "float16" or "int8"
+
+    Returns:
+        tuple: (codes, scales) where scales is a float32 array of shape (N,) for int8 and None otherwise
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if check_dtype(dtype) != "int8":
+        return embeddings.astype(dtype), None
+
+    scales = np.abs(embeddings).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes, scales=None):
+    """
+    Convert stored codes back to float32 vectors
+
+    Args:
+        codes (np.ndarray): Stored vectors
+        scales (np.ndarray): Per-vector scales for int8 codes
+
+    Returns:
+        np.ndarray: float32 matrix with the same shape as codes
+    """
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[..., None]
+    return vectors
+
+
+def bytes_per_vector(dimension, dtype):
+    """Storage size of one vector, including the int8 scale"""
+    if check_dtype(dtype) == "int8":
+        return dimension + 4
+    return dimension * np.dtype(dtype).itemsize
@@ -0,0 +1,60 @@
+import threading
+
+from cachetools import TTLCache
+
+# 「似た画像をもっと見る」で何度も検索される人気ピン向けのメモリ内キャッシュ
+# クエリ画像のエンべディングと近傍リストを画像ハッシュ単位で保持する
+class QueryCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        """
+        LRU + TTL cache for query embeddings and neighbour lists
+
+        Args:
+            maxsize (int): Maximum entries per cache (least recently used are dropped first)
+            ttl (float): Seconds an entry stays valid
+        """
+        self._embeddings = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_embedding(self, content_hash):
+        return self._get(self._embeddings, content_hash)
+
+    def put_embedding(self, content_hash, embedding):
+        with self._lock:
+            self._embeddings[content_hash] = embedding
+
+    def get_results(self, content_hash, num_neighbors, filter_expression=None):
+        results = self._get(self._results, (content_hash, num_neighbors, filter_expression))
+        # 呼び出し側で書き換えられてもキャッシュが壊れないようにコピーを返す
+        return None if results is None else [dict(result) for result in results]
+
+    def put_results(self, content_hash, num_neighbors, results, filter_expression=None):
+        with self._lock:
+            self._results[(content_hash, num_neighbors, filter_expression)] = [dict(result) for result in results]
+
+    def invalidate(self):
+        """Drop cached neighbour lists (call whenever the index contents change)"""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "embeddings": len(self._embeddings),
+            "results": len(self._results),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get(self, cache, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+# 表示名 → リソース名（projects/.../indexes/123 など）の対応をローカルに保存するキャッシュ
+# 起動のたびに一覧 API を全件たどらずに済むようにする。期限切れでも値は返し、呼び出し側で裏で確認し直す
+class ResourceCache:
+    def __init__(self, path, ttl=24 * 60 * 60):
+        """
+        On-disk cache of resolved Vertex AI resource names
+
+        Args:
+            path (str): JSON file holding the cache
+            ttl (float): Seconds after which an entry is reported as stale
+        """
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = self._read()
+
+    def get(self, key):
+        """
+        Look up a resolved resource name
+
+        Returns:
+            tuple | None: (resource_name, is_stale), or None if key has never been resolved
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry["resource_name"], time.time() - entry["resolved_at"] > self.ttl
+
+    def put(self, key, resource_name):
+        """Store a freshly resolved resource name"""
+        with self._lock:
+            self._entries[key] = {"resource_name": resource_name, "resolved_at": time.time()}
+            self._write()
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._write()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # 壊れている・存在しない場合は空から作り直す
+            return {}
+
+    def _write(self):
+        # 一時ファイルに書いてから置き換え、別プロセスに書きかけを読ませない
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,184 @@
+import asyncio
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .embedding_cache import EmbeddingCache
+
+
+# ImageSearchDemo を常駐させる非同期の類似画像検索サービス
+# 数ミリ秒以内に届いたクエリをまとめ、1回の推論 + 1回の複数クエリ検索で処理する
+class SimilarImageSearchService:
+    def __init__(self, demo, batch_window_ms=5, max_batch_size=32, default_num_neighbors=5):
+        """
+        Micro-batching search service around a warm ImageSearchDemo
+
+        Args:
+            demo (ImageSearchDemo): Search demo holding the model, endpoint and caches
+            batch_window_ms (float): How long to wait for more queries after the first one arrives
+            max_batch_size (int): Maximum queries embedded and searched together
+            default_num_neighbors (int): num_neighbors used when a request does not specify one
+        """
+        self.demo = demo
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+        self.default_num_neighbors = default_num_neighbors
+        self.batches = 0
+        self.queries = 0
+
+        self._queue = None
+        self._worker = None
+        # 集めている途中・処理中のバッチ（stop で止めたときに待っている呼び出し元へエラーを返すため）
+        self._batch = []
+        self._executor = None
+
+    async def start(self):
+        """Warm up the model and start the batching loop (again after stop())"""
+        if self._worker is not None:
+            raise RuntimeError("Search service is already running")
+        loop = asyncio.get_running_loop()
+        # 推論と検索はイベントループを止めないよう専用スレッドで実行する
+        # stop で止めたあと再び start できるよう、スレッドは起動のたびに作り直す
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-batch")
+        self._queue = asyncio.Queue()
+        await loop.run_in_executor(self._executor, self.demo.model.load)
+        self._worker = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        """Stop the batching loop and fail every query still waiting for results"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            # 取り出し済みのバッチとキューに残っているクエリの呼び出し元を待たせたままにしない
+            pending = self._batch
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("Search service stopped"))
+            self._batch = []
+            self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def search(self, image_bytes, num_neighbors=None):
+        """
+        Find similar images for one query image
+
+        Args:
+            image_bytes (bytes): Encoded query image
+            num_neighbors (int): Number of similar images to return
+
+        Returns:
+            list: [{"uri": str, "distance": float}, ...]
+        """
+        if self._queue is None:
+            raise RuntimeError("Search service is not running")
+        num_neighbors = num_neighbors or self.default_num_neighbors
+        query_cache = self.demo.query_cache
+        content_hash = None
+        if query_cache is not None:
+            content_hash = EmbeddingCache.content_hash(image_bytes)
+            cached_results = query_cache.get_results(content_hash, num_neighbors)
+            if cached_results is not None:
+                return cached_results
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_bytes, num_neighbors, future))
+        results = await future
+
+        if content_hash is not None:
+            query_cache.put_results(content_hash, num_neighbors, results)
+        return results
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """
+        Serve newline-delimited JSON requests over TCP
+
+        Each request line is {"image_path": str} or {"image_base64": str}, optionally with
+        "num_neighbors"; each response line is {"results": [...]} or {"error": str}.
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Similar image search service listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if "image_base64" in request:
+                        image_bytes = base64.b64decode(request["image_base64"])
+                    else:
+                        with open(request["image_path"], "rb") as f:
+                            image_bytes = f.read()
+                    results = await self.search(image_bytes, request.get("num_neighbors"))
+                    response = {"results": results}
+                except Exception as e:
+                    response = {"error": str(e)}
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self._executor, self._run_batch, batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # 壊れた画像が1枚あるとバッチ全体が失敗するので1件ずつやり直す
+                    results = await asyncio.gather(
+                        *(loop.run_in_executor(self._executor, self._run_batch, [item]) for item in batch),
+                        return_exceptions=True
+                    )
+                results = [result[0] if isinstance(result, list) else result for result in results]
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self._batch = []
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        images = [image_bytes for image_bytes, _, _ in batch]
+        # num_neighbors が違うクエリは最大値で検索して各自の件数に切り詰める
+        max_neighbors = max(num_neighbors for _, num_neighbors, _ in batch)
+
+        embeddings = self.demo.generate_embeddings_from_bytes(images, batch_size=len(images))
+        neighbors = self.demo.find_neighbors_batch(embeddings, max_neighbors)
+
+        self.batches += 1
+        self.queries += len(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"Served batch of {len(batch)} queries in {elapsed_ms:.1f}ms")
+        return [
+            results[:num_neighbors]
+            for (_, num_neighbors, _), results in zip(batch, neighbors)
+        ]
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+# (キー, モデルID) → float32 ベクトルを SQLite に保存し、最終利用日時の古い順に削除する共通の保存先
+# EmbeddingCache（画像ハッシュ）と TextEmbeddingCache（正規化したテキスト）で共有する
+class SQLiteLRUStore:
+    # SQLite の1文あたりの変数上限に収まるように IN 句を分ける
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, db_path, table, key_column, max_entries):
+        """
+        SQLite table of vectors keyed by (key, model_id) with least-recently-used eviction
+
+        Args:
+            db_path (str): SQLite database file
+            table (str): Table name
+            key_column (str): Name of the key column (e.g. "content_hash")
+            max_entries (int): Least-recently-used rows beyond this count are evicted
+        """
+        self.db_path = db_path
+        self.table = table
+        self.key_column = key_column
+        self.max_entries = max_entries
+        self.evictions = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # パイプラインのスレッドからも使うので1接続をロックで守る
+        self.lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key_column} TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY ({key_column}, model_id)
+            )
+            """
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._conn.commit()
+        # 件数は開いたときに数え、以降は追加・削除のたびに増減させる（書き込みごとに全件を数えない）
+        # 別プロセスが同じファイルに書き込んだときだけ、書き込みトランザクションの中で数え直す
+        self._size = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def __len__(self):
+        """Row count as of this store's last write (other processes' writes are picked up on the next put_many)"""
+        return self._size
+
+    def get(self, key, model_id):
+        """
+        Look up a vector and mark it as recently used
+
+        Returns:
+            np.ndarray | None: float32 vector, or None on a miss
+        """
+        with self.lock:
+            row = self._conn.execute(
+                f"SELECT vector FROM {self.table} WHERE {self.key_column} = ? AND model_id = ?",
+                (key, model_id)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                f"UPDATE {self.table} SET last_access = ? WHERE {self.key_column} = ? AND model_id = ?",
+                (time.time(), key, model_id)
+            )
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def missing(self, keys, model_id):
+        """
+        Keys that have no stored vector
+
+        Returns:
+            list: The missing keys in input order, without duplicates
+        """
+        keys = list(dict.fromkeys(keys))
+        found = set()
+        with self.lock:
+            for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                chunk = keys[start:start + self.LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT {self.key_column} FROM {self.table} "
+                    f"WHERE model_id = ? AND {self.key_column} IN ({','.join('?' * len(chunk))})",
+                    (model_id, *chunk)
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return [key for key in keys if key not in found]
+
+    def put_many(self, items, model_id):
+        """
+        Store (key, vector) pairs in one transaction and evict the oldest rows past max_entries
+
+        Args:
+            items (list): (key, array-like vector) pairs
+            model_id (str): Model handle and output dimension
+        """
+        now = time.time()
+        with self.lock:
+            for key, embedding in items:
+                vector = np.asarray(embedding, dtype=np.float32)
+                row = (len(vector), vector.tobytes(), now, key, model_id)
+                updated = self._conn.execute(
+                    f"UPDATE {self.table} SET dimension = ?, vector = ?, last_access = ? "
+                    f"WHERE {self.key_column} = ? AND model_id = ?",
+                    row
+                ).rowcount
+                if not updated:
+                    self._conn.execute(
+                        f"INSERT INTO {self.table} (dimension, vector, last_access, {self.key_column}, model_id) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        row
+                    )
+                    self._size += 1
+            # data_version は他の接続がコミットしたときだけ変わる。書き込みロックを持った状態で数え直すので、
+            # 複数プロセスで共有していても件数がずれたまま削除することはない
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+                self._data_version = data_version
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                evicted = self._conn.execute(
+                    f"""
+                    DELETE FROM {self.table} WHERE rowid IN (
+                        SELECT rowid FROM {self.table} ORDER BY last_access LIMIT ?
+                    )
+                    """,
+                    (overflow,)
+                ).rowcount
+                self._size -= evicted
+                self.evictions += evicted
+            self._conn.commit()
+
+    def close(self):
+        with self.lock:
+            self._conn.close()
@@ -0,0 +1,129 @@
+import base64
+import os
+import shutil
+import time
+
+import google_crc32c
+from google.api_core import exceptions as google_exceptions
+
+
+# GCS の Blob.crc32c と同じ形式（ビッグエンディアン uint32 の base64）でチェックサムを計算
+def crc32c_of_file(path, chunk_size=1024 * 1024):
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+def crc32c_of_bytes(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")
+
+
+# google.cloud.storage の Bucket / Blob と同じ呼び出し方ができるローカル版
+# オフラインでのベンチマークやパイプラインの動作確認に使う
+class LocalBucket:
+    def __init__(self, root_dir, name="local", latency=0.0):
+        """
+        Local-directory stand-in for a Cloud Storage bucket
+
+        Args:
+            root_dir (str): Directory that holds the bucket's objects
+            name (str): Bucket name used when building gs:// URIs
+            latency (float): Seconds of artificial delay per remote call, to emulate network I/O
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.name = name
+        self.latency = latency
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def get_blob(self, blob_name):
+        self._simulate_latency()
+        blob = self.blob(blob_name)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+    def list_blobs(self, prefix=""):
+        self._simulate_latency()
+        blobs = []
+        for dirpath, _, filenames in os.walk(self.root_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                blob_name = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+                if blob_name.startswith(prefix):
+                    blobs.append(self.blob(blob_name))
+        return sorted(blobs, key=lambda blob: blob.name)
+
+    def _path(self, blob_name):
+        return os.path.join(self.root_dir, *blob_name.split("/"))
+
+    def _simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.generation = None
+        self.crc32c = None
+
+    @property
+    def path(self):
+        return self.bucket._path(self.name)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def reload(self):
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.generation = stat.st_mtime_ns
+        self.crc32c = crc32c_of_file(self.path)
+
+    def upload_from_filename(self, filename):
+        self.bucket._simulate_latency()
+        self._prepare_parent()
+        shutil.copyfile(filename, self.path)
+        self.reload()
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket._simulate_latency()
+        if self.name.endswith("/"):
+            # "ディレクトリ" のプレースホルダはフォルダ作成だけで済ませる
+            os.makedirs(self.path, exist_ok=True)
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._prepare_parent()
+        with open(self.path, "wb") as f:
+            f.write(data)
+        self.reload()
+
+    def download_to_filename(self, filename):
+        self.bucket._simulate_latency()
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self, if_generation_not_match=None):
+        self.bucket._simulate_latency()
+        # GCS と同じく、ダウンロードの応答で size と generation も更新する
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.generation = stat.st_mtime_ns
+        if if_generation_not_match is not None and self.generation == if_generation_not_match:
+            raise google_exceptions.NotModified(f"{self.name} is still at generation {self.generation}")
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def delete(self):
+        os.remove(self.path)
+
+    def _prepare_parent(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
@@ -0,0 +1,108 @@
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from cachetools import LRUCache
+
+from .sqlite_lru import SQLiteLRUStore
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text):
+    """
+    Normalize a search string so trivially different spellings share one cache entry
+    (NFKC: full-width → half-width, case folding, collapsed whitespace)
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+# 正規化したテキスト → テキストエンべディングの永続キャッシュ
+# 検索ボックスからの同じ・よく似たクエリで毎回モデルを呼ばないように、メモリ上の LRU（ホットクエリ）と SQLite の2段で持つ
+class TextEmbeddingCache:
+    def __init__(self, db_path, hot_size=1024, max_entries=1000000):
+        """
+        Two-tier text embedding cache: in-memory LRU in front of SQLite
+
+        Args:
+            db_path (str): SQLite database file
+            hot_size (int): Entries kept in the in-memory LRU
+            max_entries (int): Least-recently-used rows beyond this count are evicted from SQLite
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hot_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._hot = LRUCache(maxsize=hot_size)
+        self._lock = threading.Lock()
+        self._store = SQLiteLRUStore(db_path, "text_embeddings", "text", max_entries)
+
+    def get(self, text, model_id):
+        """
+        Look up the embedding of an already normalized text
+
+        Returns:
+            np.ndarray | None: float32 embedding, or None on a miss
+        """
+        key = (text, model_id)
+        with self._lock:
+            vector = self._hot.get(key)
+            if vector is not None:
+                self.hot_hits += 1
+                return vector.copy()
+        # 最終利用日時は SQLite から読み直したときだけ更新する（ホットヒットでは書き込まない）
+        vector = self._store.get(text, model_id)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._hot[key] = vector
+        return vector.copy()
+
+    def missing(self, texts, model_id):
+        """
+        Normalized texts that have no cached embedding yet (for batch precomputation)
+
+        Returns:
+            list: The texts not found in SQLite, in input order without duplicates
+        """
+        return self._store.missing(texts, model_id)
+
+    def put(self, text, model_id, embedding):
+        """Store the embedding of a normalized text"""
+        self.put_many([(text, embedding)], model_id)
+
+    def put_many(self, items, model_id):
+        """
+        Store several (normalized text, embedding) pairs in one transaction
+
+        Args:
+            items (list): (text, embedding) pairs
+            model_id (str): Model handle and output dimension
+        """
+        items = [(text, np.asarray(embedding, dtype=np.float32)) for text, embedding in items]
+        self._store.put_many(items, model_id)
+        with self._lock:
+            for text, vector in items:
+                self._hot[(text, model_id)] = vector
+
+    def stats(self):
+        with self._lock:
+            hot = len(self._hot)
+        lookups = self.hot_hits + self.disk_hits + self.misses
+        return {
+            "hot_hits": self.hot_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hot_size": hot,
+            "size": len(self._store),
+            "evictions": self._store.evictions,
+            "hit_rate": (self.hot_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self._store.close()
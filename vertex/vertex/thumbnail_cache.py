@@ -0,0 +1,176 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+from PIL import Image
+
+
+# 検索結果の画像を縮小して保存しておくローカルキャッシュ
+# 同じピンが何度ヒットしても、フルサイズの画像を取り直さずにここから返す
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_size=512, quality=85, max_entries=10000):
+        """
+        On-disk cache of resized JPEG thumbnails keyed by image URI and blob generation
+
+        Args:
+            cache_dir (str): Directory holding the thumbnails
+            max_size (int): Longest side of a thumbnail in pixels
+            quality (int): JPEG quality of the thumbnails
+            max_entries (int): Thumbnails kept before the least recently used ones are removed
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.quality = quality
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        entries = self._list_entries()
+        self._entries = len(entries)
+        # URI ごとに手元にあるサムネイルの generation（ファイル名から復元する）
+        self._generations = {}
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            uri_key, _, generation = entry.name[:-len(".jpg")].partition("_")
+            if generation:
+                self._generations[uri_key] = generation
+
+    def path_for(self, uri, generation=None):
+        # 同じ URI に別の画像がアップロードされると generation が変わるので、古いサムネイルには当たらない
+        return os.path.join(self.cache_dir, f"{self._uri_key(uri)}_{generation}.jpg")
+
+    def latest_generation(self, uri):
+        """
+        Generation of the thumbnail cached for uri, without touching Cloud Storage
+
+        Pass it as if_generation_not_match when downloading: a 304 means the cached
+        thumbnail is still current.
+
+        Args:
+            uri (str): Image URI (gs://...)
+
+        Returns:
+            int | str | None: Generation of the cached thumbnail, or None if uri has none
+        """
+        with self._lock:
+            generation = self._generations.get(self._uri_key(uri))
+        if generation is None or generation == "None":
+            return None
+        return int(generation) if generation.isdigit() else generation
+
+    def get(self, uri, generation=None):
+        """
+        Look up the cached thumbnail of an image
+
+        Args:
+            uri (str): Image URI (gs://...)
+            generation (int): Generation of the blob the thumbnail must have been made from
+
+        Returns:
+            str | None: Path of the thumbnail, or None if it is not cached
+        """
+        path = self.path_for(uri, generation)
+        try:
+            # 更新日時を最終利用日時として使う（LRU での削除用）
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, uri, image_bytes, generation=None):
+        """
+        Resize an image and store it as the thumbnail for uri
+
+        Args:
+            uri (str): Image URI (gs://...)
+            image_bytes (bytes): Full-size encoded image
+            generation (int): Generation of the blob image_bytes was downloaded from
+
+        Returns:
+            str: Path of the stored thumbnail
+        """
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("RGB", (self.max_size, self.max_size))
+            img.thumbnail((self.max_size, self.max_size))
+            thumbnail = img.convert("RGB")
+
+        # 一時ファイルに書いてから置き換え、読み込み中の別スレッドに書きかけを見せない
+        path = self.path_for(uri, generation)
+        uri_key = self._uri_key(uri)
+        is_new = not os.path.exists(path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                thumbnail.save(f, "JPEG", quality=self.quality)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        # 置き換えられた古い generation のサムネイルはもう使わないので消す
+        with self._lock:
+            previous = self._generations.get(uri_key)
+            self._generations[uri_key] = str(generation)
+        if previous is not None and previous != str(generation):
+            self._unlink(os.path.join(self.cache_dir, f"{uri_key}_{previous}.jpg"))
+
+        if is_new:
+            with self._lock:
+                self._entries += 1
+                evict = self._entries > self.max_entries
+            if evict:
+                self._evict()
+        return path
+
+    def invalidate(self, uri, generation=None):
+        """Remove the thumbnail of one generation of uri"""
+        uri_key = self._uri_key(uri)
+        with self._lock:
+            if self._generations.get(uri_key) == str(generation):
+                del self._generations[uri_key]
+        self._unlink(self.path_for(uri, generation))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": self._entries, "hits": self.hits, "misses": self.misses}
+
+    def _evict(self):
+        # 古い順に消して上限の 9 割まで減らす
+        entries = sorted(self._list_entries(), key=lambda entry: entry.stat().st_mtime)
+        target = int(self.max_entries * 0.9)
+        removed = 0
+        evicted = []
+        for entry in entries[:max(len(entries) - target, 0)]:
+            try:
+                os.unlink(entry.path)
+                removed += 1
+                evicted.append(entry.name[:-len(".jpg")].partition("_"))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._entries = len(entries) - removed
+            for uri_key, _, generation in evicted:
+                if self._generations.get(uri_key) == generation:
+                    del self._generations[uri_key]
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._entries -= 1
+
+    @staticmethod
+    def _uri_key(uri):
+        return hashlib.sha256(uri.encode("utf-8")).hexdigest()
+
+    def _list_entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".jpg")]
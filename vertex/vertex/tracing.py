@@ -0,0 +1,176 @@
+import threading
+import time
+from bisect import bisect_left
+
+# ヒストグラムのバケット上限（ミリ秒）。Prisma のメトリクスと同じく [上限, 件数] で出力する
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class _NoopSpan:
+    # 計測しないときに使い回す何もしない span
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "labels", "started")
+
+    def __init__(self, tracer, name, labels):
+        self.tracer = tracer
+        self.name = name
+        self.labels = labels
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None:
+            self.tracer.incr(f"{self.name}_errors", **self.labels)
+        return False
+
+
+class _Histogram:
+    __slots__ = ("sum", "count", "bucket_counts")
+
+    def __init__(self, n_buckets):
+        self.sum = 0.0
+        self.count = 0
+        self.bucket_counts = [0] * n_buckets
+
+
+# 処理段階ごとの所要時間を集計する軽量なトレーサ
+# 無効なときの span() は共有の空オブジェクトを返すだけなので、計測箇所を残したままでもほぼコストがかからない
+class Tracer:
+    def __init__(self, enabled=True, buckets_ms=DEFAULT_BUCKETS_MS):
+        """
+        Span timer aggregating into counters, gauges and histograms
+
+        Args:
+            enabled (bool): Record spans; when False every call is a no-op
+            buckets_ms (tuple): Upper bounds of the histogram buckets in milliseconds; longer
+                durations are only reflected in the histogram's sum and count
+        """
+        self.enabled = enabled
+        self.buckets_ms = tuple(buckets_ms)
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **labels):
+        """
+        Time a block of code: `with tracer.span("add_images.upload"): ...`
+
+        The duration is added to the `name` histogram (in ms); an exception leaving the block
+        also increments the `{name}_errors` counter.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        """Add one duration in seconds to the `name` histogram"""
+        if not self.enabled:
+            return
+        value_ms = seconds * 1000
+        bucket = bisect_left(self.buckets_ms, value_ms)
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets_ms) + 1)
+            histogram.sum += value_ms
+            histogram.count += 1
+            histogram.bucket_counts[bucket] += 1
+
+    def incr(self, name, value=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Set a gauge to its latest value"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def export(self):
+        """
+        Snapshot of every metric in the prisma Metrics JSON shape
+
+        Returns:
+            dict: {"counters": [...], "gauges": [...], "histograms": [...]} where each metric is
+                {"key", "value", "labels", "description"} and a histogram value is
+                {"sum", "count", "buckets": [[max_value, count], ...]} in milliseconds
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = [
+                (key, histogram.sum, histogram.count, list(histogram.bucket_counts))
+                for key, histogram in self._histograms.items()
+            ]
+
+        def metric(key, value, description):
+            name, labels = key
+            return {"key": name, "value": value, "labels": {k: str(v) for k, v in labels}, "description": description}
+
+        def order(item):
+            name, labels = item[0]
+            return name, [(k, str(v)) for k, v in labels]
+
+        return {
+            "counters": [metric(key, value, "") for key, value in sorted(counters, key=order)],
+            "gauges": [metric(key, value, "") for key, value in sorted(gauges, key=order)],
+            "histograms": [
+                metric(key, {
+                    "sum": total,
+                    "count": count,
+                    "buckets": [[bound, bucket_count] for bound, bucket_count in zip(self.buckets_ms, bucket_counts)],
+                }, "Span duration in milliseconds")
+                for key, total, count, bucket_counts in sorted(histograms, key=order)
+            ],
+        }
+
+    def to_prisma_metrics(self):
+        """The export() snapshot parsed into a prisma.Metrics model"""
+        from prisma import Metrics
+        from prisma._compat import model_parse
+
+        return model_parse(Metrics, self.export())
+
+    def report(self):
+        """
+        Print one line per span: count, total and mean time
+
+        Returns:
+            str: The printed table
+        """
+        lines = [f"{'span':<40}{'count':>8}{'total ms':>12}{'mean ms':>10}"]
+        for histogram in self.export()["histograms"]:
+            value = histogram["value"]
+            labels = ",".join(f"{k}={v}" for k, v in histogram["labels"].items())
+            name = f"{histogram['key']}{{{labels}}}" if labels else histogram["key"]
+            lines.append(f"{name:<40}{value['count']:>8}{value['sum']:>12.1f}{value['sum'] / value['count']:>10.2f}")
+        table = "\n".join(lines)
+        print(table)
+        return table
@@ -0,0 +1,109 @@
+import mimetypes
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .storage import crc32c_of_bytes, crc32c_of_file
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+# アップロード対象の一覧（マニフェスト）を作る
+def build_upload_manifest(local_dir, base_dir, extensions=IMAGE_EXTENSIONS):
+    """
+    List the files in local_dir that should be uploaded under base_dir
+
+    Args:
+        local_dir (str): Path to local directory containing images
+        base_dir (str): Blob name prefix, e.g. "images/admin/"
+        extensions (tuple): Lower-case file extensions to include
+
+    Returns:
+        list: (local_path, blob_name) pairs sorted by file name
+    """
+    return [
+        (os.path.join(local_dir, filename), f"{base_dir}{filename}")
+        for filename in sorted(os.listdir(local_dir))
+        if filename.lower().endswith(extensions)
+    ]
+
+
+# スレッドプールで並列アップロードし、中身が同じファイルはスキップする
+class ConcurrentUploader:
+    def __init__(self, bucket, max_workers=8, max_retries=3, backoff=0.5):
+        """
+        Bounded-concurrency uploader with per-file retries and crc32c skip checks
+
+        Args:
+            bucket: Cloud Storage bucket (or storage.LocalBucket for offline runs)
+            max_workers (int): Concurrent uploads
+            max_retries (int): Retries per file after the first failed attempt
+            backoff (float): Base delay in seconds for exponential backoff
+        """
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def upload(self, manifest, keep_bytes_below=None):
+        """
+        Upload every (local_path, blob_name) pair in the manifest
+
+        Args:
+            manifest (list): (local_path, blob_name) pairs
+            keep_bytes_below (int): Files up to this size are read into memory once, uploaded from
+                that buffer and returned in the result's "data" so callers can reuse them
+
+        Returns:
+            list: One {"local_path", "blob_name", "status", "error", "data", "crc32c", "generation"} dict
+                per entry, in manifest order. status is "uploaded", "skipped" (remote crc32c already
+                matches) or "failed".
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda entry: self.upload_file(*entry, keep_bytes_below), manifest))
+
+    def upload_file(self, local_path, blob_name, keep_bytes_below=None):
+        """Upload a single file with retries; returns the same result dict as upload()"""
+        result = {
+            "local_path": local_path,
+            "blob_name": blob_name,
+            "status": None,
+            "error": None,
+            "data": None,
+            "crc32c": None,
+            "generation": None,
+        }
+        for attempt in range(self.max_retries + 1):
+            try:
+                if result["data"] is None and keep_bytes_below is not None \
+                        and os.path.getsize(local_path) <= keep_bytes_below:
+                    with open(local_path, "rb") as f:
+                        result["data"] = f.read()
+                data = result["data"]
+
+                local_crc32c = crc32c_of_file(local_path) if data is None else crc32c_of_bytes(data)
+                result["crc32c"] = local_crc32c
+                remote = self.bucket.get_blob(blob_name)
+                if remote is not None and remote.crc32c == local_crc32c:
+                    result["status"] = "skipped"
+                    result["generation"] = remote.generation
+                    return result
+
+                blob = self.bucket.blob(blob_name)
+                if data is None:
+                    blob.upload_from_filename(local_path)
+                else:
+                    content_type = mimetypes.guess_type(local_path)[0] or "application/octet-stream"
+                    blob.upload_from_string(data, content_type=content_type)
+                result["status"] = "uploaded"
+                result["generation"] = blob.generation
+                return result
+            except Exception as e:
+                result["error"] = str(e)
+                if attempt < self.max_retries:
+                    # 同時に失敗したスレッドが一斉に再送しないようにジッターを入れる
+                    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        result["status"] = "failed"
+        return result
@@ -0,0 +1,268 @@
+import os
+
+import numpy as np
+
+from .embedding_writer import read_embedding_records
+from .quantization import FILE_SUFFIXES, check_dtype, dequantize, quantize
+
+# Matching Engine の代わりにローカルで全件検索するためのベクトルストア
+# ベクトルは float32 / float16 / int8 の生バイナリとして追記し、検索時はメモリマップして行列積で計算する
+# 同じ id を再度追加すると upsert になる（古い行はファイルに残るが、検索・再スコアリングでは最後の行だけを使う）
+class LocalVectorStore:
+    VECTORS_FILE = "vectors.{suffix}"
+    SCALES_FILE = "scales.f32"
+    IDS_FILE = "ids.txt"
+    # 量子化したストアを float32 に戻しながら計算するときの1ブロックの行数
+    SEARCH_BLOCK_ROWS = 65536
+
+    def __init__(self, store_dir, dimension=1280, dtype="float32"):
+        """
+        Memory-mapped exact (brute-force) vector search backend
+
+        Args:
+            store_dir (str): Directory holding the vector matrix and id list
+            dimension (int): Embedding dimension
+            dtype (str): Storage format: "float32", "float16" (half the size) or
+                "int8" (a quarter of the size, plus one float32 scale per vector)
+        """
+        self.store_dir = store_dir
+        self.dimension = dimension
+        self.dtype = check_dtype(dtype)
+        os.makedirs(store_dir, exist_ok=True)
+
+        self._vectors_path = os.path.join(store_dir, self.VECTORS_FILE.format(suffix=FILE_SUFFIXES[dtype]))
+        self._scales_path = os.path.join(store_dir, self.SCALES_FILE)
+        self._ids_path = os.path.join(store_dir, self.IDS_FILE)
+        self._ids = self._read_ids()
+        if self._ids and not os.path.exists(self._vectors_path):
+            raise ValueError(f"{store_dir} does not hold {dtype} vectors")
+        self._matrix = None
+        self._scales = None
+        self._rows = None
+        self._live = None
+
+    def __len__(self):
+        """Number of distinct datapoints (superseded rows are not counted)"""
+        return len(self._row_index())
+
+    @property
+    def ids(self):
+        """Datapoint id of every stored row, including rows superseded by a later upsert"""
+        return self._ids
+
+    @property
+    def live_rows(self):
+        """Boolean mask over stored rows: True for the latest row of each id"""
+        self._row_index()
+        return self._live
+
+    @property
+    def matrix(self):
+        """Read-only (N, dimension) memmap of every stored vector, in the storage dtype"""
+        if self._matrix is None and self._ids:
+            self._matrix = np.memmap(
+                self._vectors_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(len(self._ids), self.dimension)
+            )
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(len(self._ids),))
+        return self._matrix
+
+    @property
+    def nbytes(self):
+        """Bytes used on disk by the stored vectors (and int8 scales)"""
+        paths = (self._vectors_path, self._scales_path) if self.dtype == "int8" else (self._vectors_path,)
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def vectors(self, rows=None):
+        """
+        Stored vectors as float32 (dequantized for float16 / int8 stores)
+
+        Args:
+            rows (array-like | slice): Row indices to read; all rows when omitted
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(rows), dimension)
+        """
+        matrix = self.matrix
+        if matrix is None:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        rows = slice(None) if rows is None else rows
+        return dequantize(matrix[rows], None if self._scales is None else self._scales[rows])
+
+    def rows_for(self, ids):
+        """
+        Row numbers of the given datapoint ids
+
+        Returns:
+            np.ndarray: int64 row index per id, -1 for ids not in the store
+        """
+        rows = self._row_index()
+        return np.array([rows.get(datapoint_id, -1) for datapoint_id in ids], dtype=np.int64)
+
+    def add(self, ids, embeddings):
+        """
+        Upsert vectors: new ids are appended, and an id that is already stored is superseded
+        by its new row (the old row stays on disk but is no longer searched)
+
+        Args:
+            ids (list): Datapoint ids (gs:// URIs)
+            embeddings (array-like): Matrix of shape (len(ids), dimension)
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        if len(ids) != len(embeddings):
+            raise ValueError("ids and embeddings must have the same length")
+
+        codes, scales = quantize(embeddings, self.dtype)
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(codes).tobytes())
+        if scales is not None:
+            with open(self._scales_path, "ab") as f:
+                f.write(scales.tobytes())
+        with open(self._ids_path, "a") as f:
+            f.writelines(f"{datapoint_id}\n" for datapoint_id in ids)
+
+        first_row = len(self._ids)
+        self._ids.extend(ids)
+        if self._rows is not None:
+            # id → 行番号と有効な行のマスクを差分だけ更新する（全件作り直さない）
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            for row, datapoint_id in enumerate(ids, first_row):
+                previous = self._rows.get(datapoint_id)
+                if previous is not None:
+                    self._live[previous] = False
+                self._rows[datapoint_id] = row
+        # 次の検索時にサイズが変わったファイルを開き直す
+        self._matrix = None
+        self._scales = None
+
+    def add_records(self, records):
+        """
+        Append embedding records in the {"id", "embedding"} JSON format written by add_images
+
+        Args:
+            records (list): Embedding record dicts
+        """
+        records = list(records)
+        if records:
+            self.add([record["id"] for record in records], [record["embedding"] for record in records])
+
+    def import_from_bucket(self, bucket, prefix="embeddings/"):
+        """
+        Load every embedding record stored under a Cloud Storage prefix
+
+        Args:
+            bucket: Cloud Storage bucket (or storage.LocalBucket)
+            prefix (str): Prefix the embedding records were written under
+
+        Returns:
+            int: Number of imported vectors
+        """
+        records = read_embedding_records(bucket, prefix)
+        self.add_records(records)
+        return len(records)
+
+    def search(self, query_embedding, num_neighbors=5):
+        """
+        Exact top-k search by dot product (same ordering as DOT_PRODUCT_DISTANCE)
+
+        Args:
+            query_embedding (array-like): Query vector
+            num_neighbors (int): Number of neighbours to return
+
+        Returns:
+            list: [{"uri": str, "distance": float}, ...] sorted by decreasing similarity
+        """
+        return self.search_batch([query_embedding], num_neighbors)[0]
+
+    def search_batch(self, query_embeddings, num_neighbors=5):
+        """
+        Exact top-k search for many queries with one matrix multiplication
+
+        Args:
+            query_embeddings (array-like): Matrix of shape (Q, dimension)
+            num_neighbors (int): Number of neighbours per query
+
+        Returns:
+            list: One result list per query, aligned with the inputs
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        if not self._ids:
+            return [[] for _ in range(len(queries))]
+
+        scores = self._scores(queries)
+        n_live = len(self)
+        if n_live < len(self._ids):
+            # 上書きされた古い行は候補にしない（同じ id を2回返さない）
+            scores[:, ~self._live] = -np.inf
+        k = min(num_neighbors, n_live)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [
+                {"uri": self._ids[i], "distance": float(score)}
+                for i, score in zip(row, row_scores)
+            ]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+    def rerank(self, query_embedding, candidates, num_neighbors=5):
+        """
+        Re-score an approximate shortlist exactly and return the corrected top-k
+
+        Args:
+            query_embedding (array-like): Query vector
+            candidates (list): [{"uri": str, "distance": float}, ...] from an approximate search
+            num_neighbors (int): Number of neighbours to return
+
+        Returns:
+            list: Top num_neighbors candidates ordered by exact dot product. Candidates missing from
+                the store keep their approximate distance and are placed after the re-scored ones.
+        """
+        rows = self.rows_for([candidate["uri"] for candidate in candidates])
+        found = np.flatnonzero(rows >= 0)
+        # 候補の行をまとめて読み、1回の行列ベクトル積で正確な内積を計算する
+        scores = self.vectors(rows[found]) @ np.asarray(query_embedding, dtype=np.float32).reshape(self.dimension)
+        order = np.argsort(-scores, kind="stable")
+        reranked = [
+            {"uri": candidates[found[i]]["uri"], "distance": float(scores[i])}
+            for i in order[:num_neighbors]
+        ]
+        if len(reranked) < num_neighbors:
+            reranked.extend(candidate for candidate, row in zip(candidates, rows) if row < 0)
+        return reranked[:num_neighbors]
+
+    def _row_index(self):
+        # id → 最新の行番号。同じ id が複数回追加された場合は最後の行が有効
+        if self._rows is None:
+            self._rows = {datapoint_id: row for row, datapoint_id in enumerate(self._ids)}
+            self._live = np.zeros(len(self._ids), dtype=bool)
+            self._live[list(self._rows.values())] = True
+        return self._rows
+
+    def _scores(self, queries):
+        matrix = self.matrix
+        if self.dtype == "float32":
+            return queries @ matrix.T
+        # float32 のコピーを全件分作らないよう、ブロックごとに戻して計算する
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), self.SEARCH_BLOCK_ROWS):
+            block = slice(start, start + self.SEARCH_BLOCK_ROWS)
+            if self.dtype == "int8":
+                # 内積はスケールをくくり出せるので、整数コードとの積にあとからスケールを掛ける
+                scores[:, block] = (queries @ np.asarray(matrix[block], dtype=np.float32).T) * self._scales[block]
+            else:
+                scores[:, block] = queries @ np.asarray(matrix[block], dtype=np.float32).T
+        return scores
+
+    def _read_ids(self):
+        if not os.path.exists(self._ids_path):
+            return []
+        with open(self._ids_path) as f:
+            return [line.rstrip("\n") for line in f if line.strip()]